@@ -0,0 +1,22 @@
+# gunicorn.conf.py
+# gunicorn -c gunicorn.conf.py waterloo.wsgi
+import glob
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
+
+# importa la app (y con PREDICTOR_EAGER_LOAD=1 carga el modelo) en el master antes del fork,
+# asi los pesos quedan compartidos copy-on-write entre workers
+preload_app = True
+raw_env = ['PREDICTOR_EAGER_LOAD=' + os.environ.get('PREDICTOR_EAGER_LOAD', '1')]
+
+# con varios workers /metrics suma los archivos de PROMETHEUS_MULTIPROC_DIR (ver settings);
+# se define aqui para que todos los workers usen el mismo directorio
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/reciface-metrics')
+
+
+def on_starting(server):
+    # lo que contaron los workers de la corrida anterior no se suma a esta
+    for path in glob.glob(os.path.join(os.environ['PROMETHEUS_MULTIPROC_DIR'], 'metrics_*.json')):
+        os.remove(path)
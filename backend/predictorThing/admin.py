@@ -1,8 +1,22 @@
 from django.contrib import admin
-from .models import FaceAnalysis
+from .models import FaceAnalysis, DailyAnalysisSummary, DailyAnalysisDelta, BackgroundJob, DetectedFace
+
+
+class DetectedFaceInline(admin.TabularInline):
+    model = DetectedFace
+    extra = 0
+    can_delete = False
+    fields = [
+        'index', 'box_x', 'box_y', 'box_width', 'box_height', 'detection_score',
+        'sex', 'sex_confidence', 'eyes', 'eyes_confidence',
+        'race', 'race_confidence', 'hair', 'hair_confidence',
+    ]
+    readonly_fields = fields
+
 
 @admin.register(FaceAnalysis)
 class FaceAnalysisAdmin(admin.ModelAdmin):
+    inlines = [DetectedFaceInline]
     list_display = [
         'id', 
         'image_name', 
@@ -13,9 +27,9 @@ class FaceAnalysisAdmin(admin.ModelAdmin):
         'average_confidence',
         'created_at'
     ]
-    list_filter = ['sex', 'eyes', 'race', 'hair', 'created_at']
+    list_filter = ['sex', 'eyes', 'race', 'hair', 'model_version', 'created_at']
     search_fields = ['image_name', 'sex', 'eyes', 'race', 'hair']
-    readonly_fields = ['created_at', 'average_confidence', 'has_low_confidence']
+    readonly_fields = ['created_at', 'average_confidence', 'min_confidence', 'has_low_confidence', 'top_k', 'model_version']
     
     fieldsets = (
         ('Información de la Imagen', {
@@ -34,10 +48,38 @@ class FaceAnalysisAdmin(admin.ModelAdmin):
             'fields': ('hair', 'hair_confidence')
         }),
         ('Estadísticas', {
-            'fields': ('average_confidence', 'has_low_confidence')
+            'fields': ('average_confidence', 'min_confidence', 'has_low_confidence')
+        }),
+        ('Revisión', {
+            'fields': ('top_k', 'model_version')
         }),
     )
     
     def average_confidence(self, obj):
         return f"{obj.average_confidence:.2f}%"
-    average_confidence.short_description = 'Confianza Promedio'
\ No newline at end of file
+    average_confidence.short_description = 'Confianza Promedio'
+
+
+@admin.register(DailyAnalysisSummary)
+class DailyAnalysisSummaryAdmin(admin.ModelAdmin):
+    list_display = ['date', 'total', 'low_confidence', 'updated_at']
+    readonly_fields = [
+        'date', 'total', 'low_confidence', 'average_confidence_sum',
+        'class_counts', 'confidence_histograms', 'updated_at'
+    ]
+
+
+@admin.register(DailyAnalysisDelta)
+class DailyAnalysisDeltaAdmin(admin.ModelAdmin):
+    list_display = ['id', 'date', 'total', 'low_confidence', 'created_at']
+    readonly_fields = [
+        'date', 'total', 'low_confidence', 'average_confidence_sum',
+        'class_counts', 'confidence_histograms', 'created_at'
+    ]
+
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'status', 'attempts', 'run_after', 'updated_at']
+    list_filter = ['kind', 'status']
+    readonly_fields = ['created_at', 'updated_at', 'last_error']
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class PredictorthingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'predictorThing'
+
+    def ready(self):
+        # carga y calienta el modelo al arrancar en vez de en el primer request;
+        # con gunicorn --preload esto corre antes del fork y los workers comparten los pesos
+        if getattr(settings, 'PREDICTOR_EAGER_LOAD', False):
+            from .warmup import load_and_warm_up
+            load_and_warm_up()
@@ -0,0 +1,185 @@
+# predictorThing/batching.py
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from .metrics import observe_stage, timed
+from .predictor import get_predictor, DEFAULT_MAX_BATCH_SIZE
+
+# cuanto espera el worker por mas imagenes antes de lanzar el batch
+DEFAULT_BATCH_WINDOW_MS = 5
+
+# marca en la cola para que el hilo termine (ver MicroBatcher.close)
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    worker en segundo plano que junta las imagenes que llegan dentro de una
+    ventana corta (o hasta max_batch_size) y las pasa juntas por el modelo
+    """
+
+    def __init__(self, predictor, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 window_ms=DEFAULT_BATCH_WINDOW_MS, max_queue_size=0):
+        self.predictor = predictor
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.window = max(0, window_ms) / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+        # estadisticas
+        self._requests = 0
+        self._batches = 0
+        self._errors = 0
+        self._batch_sizes = {}
+        self._total_wait = 0.0
+        self._total_forward = 0.0
+
+    def _ensure_worker(self):
+        # el hilo no sobrevive a un fork, asi que se arranca por proceso
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+            self._thread.start()
+
+    def submit(self, image):
+        """preprocesa en el hilo del request y encola; regresa un Future"""
+        self._ensure_worker()
+        # la version con la que se preproceso es la que hace el forward, aunque haya un cambio en medio
+        predictor = self.predictor
+        tensor = predictor.preprocess(image)
+        future = Future()
+        self._queue.put((tensor, future, time.monotonic(), predictor))
+        return future
+
+    def predict(self, image, timeout=None):
+        future = self.submit(image)
+        # espera en cola + forward compartido, visto desde el request
+        with timed('batched_inference'):
+            return future.result(timeout=timeout)
+
+    def close(self, timeout=5.0):
+        """termina el hilo despues de atender lo que ya esta en cola"""
+        thread = self._thread
+        if thread is None or not thread.is_alive() or self._pid != os.getpid():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def _collect(self):
+        """
+        bloquea hasta el primer item y junta los que lleguen dentro de la ventana;
+        None si se pidio terminar
+        """
+        item = self._queue.get()
+        if item is _STOP:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.window
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    # ventana cerrada, pero lo que ya esta encolado se va en este batch
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # se atiende este batch y la siguiente vuelta termina
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            started = time.monotonic()
+            for _, _, enqueued, _ in batch:
+                observe_stage('batch_wait', started - enqueued)
+
+            # casi siempre un solo grupo; dos solo justo despues de un cambio de version
+            groups = {}
+            for item in batch:
+                groups.setdefault(id(item[3]), []).append(item)
+
+            for group in groups.values():
+                try:
+                    results = group[0][3].predict_tensors(
+                        [tensor for tensor, _, _, _ in group],
+                        max_batch_size=self.max_batch_size
+                    )
+                    for (_, future, _, _), result in zip(group, results):
+                        future.set_result(result)
+                except Exception as e:
+                    for _, future, _, _ in group:
+                        future.set_exception(e)
+                    with self._lock:
+                        self._errors += 1
+
+            finished = time.monotonic()
+            with self._lock:
+                self._requests += len(batch)
+                self._batches += 1
+                self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+                self._total_wait += sum(started - enqueued for _, _, enqueued, _ in batch)
+                self._total_forward += finished - started
+
+            # que una version ya reemplazada no quede viva mientras se espera el siguiente batch
+            batch = groups = group = item = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_batch_size': self.max_batch_size,
+                'window_ms': self.window * 1000,
+                'requests': self._requests,
+                'batches': self._batches,
+                'errors': self._errors,
+                'avg_batch_size': round(self._requests / self._batches, 2) if self._batches else 0,
+                'batch_sizes': dict(sorted(self._batch_sizes.items())),
+                'avg_queue_wait_ms': round(self._total_wait / self._requests * 1000, 2) if self._requests else 0,
+                'avg_forward_ms': round(self._total_forward / self._batches * 1000, 2) if self._batches else 0,
+            }
+
+
+# instancia global
+batcher = None
+_batcher_lock = threading.Lock()
+
+def get_batcher():
+
+    global batcher
+    if batcher is None:
+        with _batcher_lock:
+            if batcher is None:
+                from django.conf import settings
+                batcher = MicroBatcher(
+                    get_predictor(),
+                    max_batch_size=getattr(settings, 'PREDICTOR_MAX_BATCH_SIZE', DEFAULT_MAX_BATCH_SIZE),
+                    window_ms=getattr(settings, 'PREDICTOR_BATCH_WINDOW_MS', DEFAULT_BATCH_WINDOW_MS),
+                )
+    return batcher
+
+
+def predict_image(image):
+    """predice una imagen usando el micro-batcher si esta activado"""
+    from django.conf import settings
+    if getattr(settings, 'PREDICTOR_MICROBATCHING', False):
+        return get_batcher().predict(image)
+    return get_predictor().predict(image)
@@ -0,0 +1,271 @@
+# predictorThing/benchmarks.py
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from PIL import Image
+
+from .preprocessing import INPUT_SIZE, MEAN, STD, Preprocessor
+
+# resoluciones tipicas de screenshots
+DEFAULT_RESOLUTIONS = ((1280, 720), (1920, 1080), (3840, 2160))
+DEFAULT_FORMATS = ('PNG', 'JPEG')
+
+DEFAULT_BATCH_SIZES = (1, 4, 8, 16, 32)
+DEFAULT_ENDPOINTS = ('/api/predict/', '/api/save/')
+
+
+def synthetic_image_bytes(width, height, fmt, seed=0):
+    """imagen sintetica (gradiente + ruido) codificada en memoria; comprime parecido a una foto"""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, (x * 0.5 + y * 0.5) + 0 * x, y + 0 * x], axis=-1)
+    noise = rng.normal(0, 12, size=(height, width, 3))
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, 'RGB').save(buffer, format=fmt, quality=90)
+    return buffer.getvalue()
+
+
+def legacy_preprocess():
+    """el pipeline anterior: PIL completo + transforms.Compose de torchvision"""
+    from torchvision import transforms
+
+    transform = transforms.Compose([
+        transforms.Resize(INPUT_SIZE),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=MEAN, std=STD),
+    ])
+
+    def run(data):
+        return transform(Image.open(io.BytesIO(data)).convert('RGB'))
+
+    return run
+
+
+def _time_ms(fn, data, repeats):
+    fn(data)  # warm-up
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn(data)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def _summary(samples):
+    ordered = sorted(samples)
+    return {
+        'mean_ms': round(statistics.fmean(ordered), 3),
+        'p50_ms': round(_percentile(ordered, 0.50), 3),
+        'p95_ms': round(_percentile(ordered, 0.95), 3),
+        'p99_ms': round(_percentile(ordered, 0.99), 3),
+    }
+
+
+def benchmark_preprocessing(resolutions=DEFAULT_RESOLUTIONS, formats=DEFAULT_FORMATS,
+                            repeats=20, include_legacy=True):
+    """tiempo por imagen del preprocesamiento (antes/despues) por resolucion y formato"""
+    preprocessor = Preprocessor()
+    legacy = legacy_preprocess() if include_legacy else None
+
+    results = []
+    for width, height in resolutions:
+        for fmt in formats:
+            data = synthetic_image_bytes(width, height, fmt)
+            row = {
+                'resolution': f'{width}x{height}',
+                'format': fmt,
+                'bytes': len(data),
+                'fast': _summary(_time_ms(preprocessor, data, repeats)),
+            }
+            if legacy is not None:
+                row['legacy'] = _summary(_time_ms(legacy, data, repeats))
+                row['speedup'] = round(row['legacy']['mean_ms'] / row['fast']['mean_ms'], 2)
+            results.append(row)
+    return results
+
+
+# --- modelo, latencia y throughput ----------------------------------------------
+
+def random_predictor(max_batch_size=32, seed=0):
+    """predictor con un MultiTaskFaceModel de pesos aleatorios: no necesita el checkpoint"""
+    from .predictor import MODELS_DIR, FaceAttributePredictor, MultiTaskFaceModel
+
+    with open(MODELS_DIR / 'model_info.json') as f:
+        num_classes = json.load(f)['num_classes']
+
+    torch.manual_seed(seed)
+    model = MultiTaskFaceModel(num_classes)
+    return FaceAttributePredictor.from_model(model, max_batch_size, model_version=f'random-{seed}')
+
+
+def benchmark_latency(predictor, repeats=50, resolution=(640, 480), fmt='JPEG'):
+    """latencia de una sola imagen de punta a punta (decode + preprocess + forward + postprocess)"""
+    data = synthetic_image_bytes(*resolution, fmt)
+    samples = _time_ms(lambda d: predictor.predict(io.BytesIO(d)), data, repeats)
+    return {
+        'resolution': f'{resolution[0]}x{resolution[1]}',
+        'format': fmt,
+        'repeats': repeats,
+        **_summary(samples),
+    }
+
+
+def benchmark_throughput(predictor, batch_sizes=DEFAULT_BATCH_SIZES, iterations=10):
+    """imagenes por segundo del forward + postprocess por tamaño de batch (tensores ya listos)"""
+    results = []
+    for batch_size in batch_sizes:
+        tensors = list(torch.randn(batch_size, 3, INPUT_SIZE[1], INPUT_SIZE[0]))
+        samples = _time_ms(
+            lambda t: predictor.predict_tensors(t, max_batch_size=batch_size), tensors, iterations
+        )
+        results.append({
+            'batch_size': batch_size,
+            'iterations': iterations,
+            'images_per_s': round(batch_size * 1000 / statistics.fmean(samples), 2),
+            **_summary(samples),
+        })
+    return results
+
+
+# --- endpoints HTTP ---------------------------------------------------------------
+
+def _post_image(client, path, data, index):
+    upload = io.BytesIO(data)
+    upload.name = f'bench_{index}.jpg'
+    started = time.perf_counter()
+    response = client.post(path, {'image': upload})
+    return (time.perf_counter() - started) * 1000, response.status_code
+
+
+def benchmark_endpoints(predictor, endpoints=DEFAULT_ENDPOINTS, concurrency=(1, 4, 8),
+                        requests=64, distinct_images=32):
+    """
+    throughput de los endpoints con el stack completo de Django (test Client, en
+    proceso) y varios hilos a la vez. todo lo que escriben los requests queda fuera
+    de los datos reales: una BD de prueba (create_test_db) que se destruye al final,
+    y media, embeddings y registro de modelos en un directorio temporal. el cache de
+    predicciones se apaga
+    """
+    from django.db import connection, connections
+    from django.test import Client, override_settings
+
+    from . import batching, embeddings, registry, predictor as predictor_module
+
+    images = [synthetic_image_bytes(640, 480, 'JPEG', seed=seed) for seed in range(distinct_images)]
+    scratch = tempfile.mkdtemp(prefix='reciface-bench-')
+
+    # el predictor global (y el del micro-batcher) pasan a ser el de pesos aleatorios; el
+    # registro, vacio, para que un cambio de version no lo reemplace a media corrida
+    previous = predictor_module.predictor, batching.batcher, embeddings.stores, registry.manager
+    predictor_module.predictor, batching.batcher, embeddings.stores, registry.manager = predictor, None, {}, None
+
+    old_database = None
+    results = []
+    try:
+        # create_test_db cambia el NAME de la conexion (y de settings.DATABASES, para los hilos)
+        old_database = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        with override_settings(
+            ALLOWED_HOSTS=['*'],
+            MEDIA_ROOT=os.path.join(scratch, 'media'),
+            EMBEDDINGS_DIR=os.path.join(scratch, 'embeddings'),
+            MODEL_REGISTRY_DIR=os.path.join(scratch, 'registry'),
+            PREDICTION_CACHE_ENABLED=False,
+            JOBS_LOCAL_WORKER=False,
+        ):
+            for path in endpoints:
+                for workers in concurrency:
+                    def call(index):
+                        # un Client por request: no comparten cookies entre hilos
+                        try:
+                            return _post_image(Client(), path, images[index % len(images)], index)
+                        finally:
+                            # la BD de prueba no se puede borrar con conexiones abiertas
+                            connections.close_all()
+
+                    started = time.perf_counter()
+                    with ThreadPoolExecutor(max_workers=workers) as pool:
+                        outcomes = list(pool.map(call, range(requests)))
+                    wall = time.perf_counter() - started
+
+                    results.append({
+                        'endpoint': path,
+                        'concurrency': workers,
+                        'requests': requests,
+                        'errors': sum(1 for _, status in outcomes if status != 200),
+                        'requests_per_s': round(requests / wall, 2),
+                        **_summary([elapsed for elapsed, _ in outcomes]),
+                    })
+    finally:
+        # el micro-batcher que se creo para el benchmark no debe quedar con su hilo vivo
+        if batching.batcher is not None and batching.batcher is not previous[1]:
+            batching.batcher.close()
+        predictor_module.predictor, batching.batcher, embeddings.stores, registry.manager = previous
+        if old_database is not None:
+            connection.creation.destroy_test_db(old_database, verbosity=0)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return results
+
+
+# --- reporte completo -------------------------------------------------------------
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """datos para comparar corridas entre commits y maquinas"""
+    return {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'torch_threads': torch.get_num_threads(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def run_all(seed=0, max_batch_size=32, repeats=50, batch_sizes=DEFAULT_BATCH_SIZES, iterations=10,
+            preprocessing_repeats=20, endpoints=DEFAULT_ENDPOINTS, concurrency=(1, 4, 8), requests=64):
+    """corre todos los benchmarks y regresa un dict serializable a JSON"""
+    predictor = random_predictor(max_batch_size, seed)
+    report = {
+        'environment': environment(),
+        'config': {
+            'seed': seed,
+            'max_batch_size': max_batch_size,
+            'repeats': repeats,
+            'iterations': iterations,
+        },
+        'latency': benchmark_latency(predictor, repeats),
+        'throughput': benchmark_throughput(predictor, batch_sizes, iterations),
+        'preprocessing': benchmark_preprocessing(repeats=preprocessing_repeats, include_legacy=False),
+    }
+    if endpoints:
+        report['endpoints'] = benchmark_endpoints(predictor, endpoints, concurrency, requests)
+    return report
@@ -0,0 +1,159 @@
+# predictorThing/cache.py
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .predictor import MODEL_VERSION_KEY, get_predictor
+from .preprocessing import load_image
+
+DEFAULT_LRU_SIZE = 1024
+DEFAULT_BACKEND_TIMEOUT = 60 * 60 * 24
+
+# cambia cuando cambia la forma del resultado o de la llave
+# (v2: 'probabilities' por cabeza, v3: 'embedding', v4: hash de la imagen ya reducida)
+RESULT_FORMAT = 'v4'
+
+
+class PredictionCache:
+    """
+    cache de predicciones por hash de los pixeles decodificados + version del modelo.
+    primer nivel: LRU en memoria del proceso; segundo nivel (opcional): cache de Django
+    """
+
+    def __init__(self, max_size=DEFAULT_LRU_SIZE, backend_alias=None,
+                 backend_timeout=DEFAULT_BACKEND_TIMEOUT):
+        self.max_size = max(0, int(max_size))
+        self.backend_alias = backend_alias
+        self.backend_timeout = backend_timeout
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+
+        self._hits = 0
+        self._backend_hits = 0
+        self._misses = 0
+
+    @property
+    def backend(self):
+        return caches[self.backend_alias] if self.backend_alias else None
+
+    def digest(self, image):
+        """hash de la imagen ya reducida a RGB de entrada (tamaño + pixeles)"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{image.width}x{image.height}".encode())
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
+    def key_for(self, digest, model_version):
+        return f"prediction:{RESULT_FORMAT}:{model_version}:{digest}"
+
+    def _check_version(self, model_version):
+        # si cambio el checkpoint, lo del LRU ya no sirve
+        if self._version != model_version:
+            self._lru.clear()
+            self._version = model_version
+
+    def get(self, key, model_version):
+        with self._lock:
+            self._check_version(model_version)
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                self._hits += 1
+                return copy.deepcopy(self._lru[key])
+
+        backend = self.backend
+        if backend is not None:
+            result = backend.get(key)
+            if result is not None:
+                with self._lock:
+                    self._backend_hits += 1
+                    self._store(key, result)
+                return copy.deepcopy(result)
+
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def set(self, key, model_version, result):
+        with self._lock:
+            # un resultado de la version anterior (llego justo despues de un cambio) va
+            # solo al backend, con su propia llave; no vacia el LRU de la version actual
+            if self._version is None or self._version == model_version:
+                self._check_version(model_version)
+                self._store(key, copy.deepcopy(result))
+
+        backend = self.backend
+        if backend is not None:
+            backend.set(key, result, self.backend_timeout)
+
+    def _store(self, key, result):
+        if self.max_size == 0:
+            return
+        self._lru[key] = result
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._backend_hits + self._misses
+            return {
+                'model_version': self._version,
+                'size': len(self._lru),
+                'max_size': self.max_size,
+                'backend': self.backend_alias,
+                'hits': self._hits,
+                'backend_hits': self._backend_hits,
+                'misses': self._misses,
+                'hit_rate': round((self._hits + self._backend_hits) / lookups, 4) if lookups else 0,
+            }
+
+
+# instancia global
+prediction_cache = None
+_cache_lock = threading.Lock()
+
+def get_prediction_cache():
+
+    global prediction_cache
+    if prediction_cache is None:
+        with _cache_lock:
+            if prediction_cache is None:
+                prediction_cache = PredictionCache(
+                    max_size=getattr(settings, 'PREDICTION_CACHE_SIZE', DEFAULT_LRU_SIZE),
+                    backend_alias=getattr(settings, 'PREDICTION_CACHE_BACKEND', None),
+                    backend_timeout=getattr(settings, 'PREDICTION_CACHE_TIMEOUT', DEFAULT_BACKEND_TIMEOUT),
+                )
+    return prediction_cache
+
+
+def cached_predict(image, predict):
+    """
+    regresa la prediccion cacheada para esta imagen o llama predict(image)
+    y guarda el resultado. la imagen se reduce con load_image antes del hash
+    (draft del JPEG + resize), asi no se decodifica la resolucion completa
+    """
+    image = load_image(image)
+    if not getattr(settings, 'PREDICTION_CACHE_ENABLED', True):
+        return predict(image)
+
+    cache = get_prediction_cache()
+    digest = cache.digest(image)
+    model_version = get_predictor().model_version
+
+    result = cache.get(cache.key_for(digest, model_version), model_version)
+    if result is None:
+        result = predict(image)
+        # predict puede correr otra version (el batcher en medio de un cambio en caliente):
+        # se guarda con la version que de verdad produjo el resultado
+        model_version = result.get(MODEL_VERSION_KEY) or model_version
+        cache.set(cache.key_for(digest, model_version), model_version, result)
+    return result
@@ -0,0 +1,198 @@
+# predictorThing/cleanup.py
+import posixpath
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .jobs import enqueue, enqueue_many
+from .models import BackgroundJob, FaceAnalysis, StagedPrediction
+
+# directorio de las imagenes (upload_to de FaceAnalysis y StagedPrediction)
+MEDIA_PREFIX = 'face_images'
+
+# filas por request de borrado en bulk
+DEFAULT_BULK_DELETE_MAX = 5000
+
+# filas por trabajo de borrado de archivos
+MEDIA_JOB_ROWS = 500
+
+# un archivo sin fila no se borra hasta tener esta edad: el upload se guarda antes del INSERT
+DEFAULT_SWEEP_GRACE = 60 * 60
+
+DEFAULT_SWEEP_BATCH_SIZE = 1000
+
+
+def media_names(image, derivatives):
+    """el original y todas sus versiones generadas (display y miniaturas) en el storage"""
+    names = [image] if image else []
+    derivatives = derivatives or {}
+    if derivatives.get('display'):
+        names.append(derivatives['display'])
+    for formats in derivatives.get('thumbnails', {}).values():
+        names.extend(name for name in formats.values() if name)
+    return names
+
+
+def delete_analyses(queryset, limit=None):
+    """
+    borra hasta limit analisis del queryset en una transaccion (el resumen diario se
+    ajusta en FaceAnalysisQuerySet.delete) y encola el borrado de sus archivos y
+    embeddings en la misma transaccion: o se borra la fila y queda el trabajo, o nada.
+    regresa (ids borrados, si quedan mas filas que coinciden)
+    """
+    limit = limit or getattr(settings, 'BULK_DELETE_MAX', DEFAULT_BULK_DELETE_MAX)
+
+    with transaction.atomic():
+        rows = list(
+            queryset.select_for_update().order_by('id')
+            .values_list('id', 'image', 'derivatives')[:limit + 1]
+        )
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if not rows:
+            return [], False
+
+        ids = [pk for pk, _, _ in rows]
+        FaceAnalysis.objects.filter(pk__in=ids).delete()
+        enqueue_many('delete_media', [
+            {
+                'analysis_ids': [pk for pk, _, _ in chunk],
+                'names': [name for _, image, derivatives in chunk for name in media_names(image, derivatives)],
+            }
+            for chunk in (rows[start:start + MEDIA_JOB_ROWS] for start in range(0, len(rows), MEDIA_JOB_ROWS))
+        ])
+    return ids, more
+
+
+def _walk(directory):
+    """(directorio, archivos) de cada directorio bajo directory, uno a la vez"""
+    try:
+        dirs, files = default_storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    if files:
+        yield directory, files
+    for name in sorted(dirs):
+        yield from _walk(posixpath.join(directory, name))
+
+
+def _referenced(directory):
+    """nombres de ese directorio que usa alguna fila (analisis con sus derivados, o un token vigente)"""
+    prefix = directory + '/'
+    names = set()
+    for image, derivatives in (
+        FaceAnalysis.objects.filter(image__startswith=prefix)
+        .values_list('image', 'derivatives').iterator(chunk_size=2000)
+    ):
+        names.update(media_names(image, derivatives))
+    names.update(StagedPrediction.objects.filter(image__startswith=prefix).values_list('image', flat=True))
+    return names
+
+
+def sweep_files(grace=DEFAULT_SWEEP_GRACE, dry_run=False, report=None):
+    """
+    borra los archivos de face_images/ que ninguna fila referencia, un directorio
+    (un dia de uploads) a la vez; regresa cuantos borro
+    """
+    cutoff = timezone.now() - timedelta(seconds=grace)
+    removed = 0
+    for directory, files in _walk(MEDIA_PREFIX):
+        referenced = _referenced(directory)
+        for filename in files:
+            name = posixpath.join(directory, filename)
+            if name in referenced:
+                continue
+            try:
+                if default_storage.get_modified_time(name) > cutoff:
+                    continue
+                if not dry_run:
+                    default_storage.delete(name)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            if report:
+                report(f'archivo huerfano: {name}')
+    return removed
+
+
+def _existing(names):
+    """los nombres de la lista que existen, con un listdir por directorio en vez de un stat por archivo"""
+    by_directory = {}
+    for name in names:
+        by_directory.setdefault(posixpath.dirname(name), []).append(name)
+
+    existing = set()
+    for directory, directory_names in by_directory.items():
+        try:
+            _, files = default_storage.listdir(directory)
+        except FileNotFoundError:
+            continue
+        files = set(files)
+        existing.update(name for name in directory_names if posixpath.basename(name) in files)
+    return existing
+
+
+def sweep_rows(batch_size=DEFAULT_SWEEP_BATCH_SIZE, dry_run=False, report=None):
+    """
+    borra los analisis cuya imagen ya no esta en el storage, recorriendo la tabla
+    por rangos de id; regresa cuantos borro
+    """
+    removed = 0
+    last_id = 0
+    while True:
+        rows = list(
+            FaceAnalysis.objects.filter(pk__gt=last_id).exclude(image='')
+            .order_by('id').values_list('id', 'image')[:batch_size]
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        existing = _existing([image for _, image in rows])
+        dangling = [(pk, image) for pk, image in rows if image not in existing]
+        if not dangling:
+            continue
+        if dry_run:
+            removed += len(dangling)
+            if report:
+                for pk, _ in dangling:
+                    report(f'analisis sin imagen: {pk}')
+            continue
+
+        # se revisa otra vez cada una: el listado del directorio pudo ser anterior al upload
+        ids = [pk for pk, image in dangling if not default_storage.exists(image)]
+        if ids:
+            ids, _ = delete_analyses(FaceAnalysis.objects.filter(pk__in=ids), limit=len(ids))
+            removed += len(ids)
+            if report:
+                for pk in ids:
+                    report(f'analisis sin imagen borrado: {pk}')
+    return removed
+
+
+def sweep(batch_size=DEFAULT_SWEEP_BATCH_SIZE, grace=DEFAULT_SWEEP_GRACE, files=True, rows=True,
+          dry_run=False, report=None):
+    """concilia face_images/ con la tabla en las dos direcciones"""
+    started = time.monotonic()
+    result = {'orphaned_files': 0, 'dangling_rows': 0}
+    # primero las filas: sus archivos derivados quedan huerfanos y los borra el trabajo de media
+    if rows:
+        result['dangling_rows'] = sweep_rows(batch_size, dry_run, report)
+    if files:
+        result['orphaned_files'] = sweep_files(grace, dry_run, report)
+    result['seconds'] = round(time.monotonic() - started, 2)
+    return result
+
+
+def schedule_sweep(interval=None):
+    """encola el siguiente barrido si no hay uno pendiente"""
+    interval = interval or getattr(settings, 'MEDIA_SWEEP_INTERVAL', None)
+    if not interval:
+        return None
+    if BackgroundJob.objects.filter(kind='sweep_media', status=BackgroundJob.PENDING).exists():
+        return None
+    return enqueue('sweep_media', delay=timedelta(seconds=interval))
@@ -0,0 +1,178 @@
+# predictorThing/detection.py
+import math
+import threading
+
+import numpy as np
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from .metrics import timed
+from .preprocessing import INPUT_SIZE
+
+DEFAULT_SCORE_THRESHOLD = 0.8
+DEFAULT_MIN_FACE_SIZE = 32
+DEFAULT_MAX_FACES = 16
+
+# la deteccion corre sobre una copia reducida; las cajas se regresan en coords originales
+DETECTION_MAX_SIDE = 1280
+
+# holgura alrededor de la caja al recortar (fraccion del lado), el modelo se entreno con cabeza completa
+CROP_MARGIN = 0.3
+
+
+class FaceDetector:
+    """
+    detector de caras en CPU con OpenCV: YuNet si se da el modelo onnx (regresa
+    5 landmarks, con los que se alinean los ojos) o, si no, el Haar cascade frontal
+    que ya viene con opencv (sin landmarks, solo recorte)
+    """
+
+    def __init__(self, model_path=None, score_threshold=DEFAULT_SCORE_THRESHOLD,
+                 min_size=DEFAULT_MIN_FACE_SIZE, max_side=DETECTION_MAX_SIDE):
+        try:
+            import cv2
+        except ImportError:
+            raise ImportError("la deteccion de caras necesita opencv (pip install opencv-python-headless)")
+
+        self.cv2 = cv2
+        self.score_threshold = score_threshold
+        self.min_size = min_size
+        self.max_side = max_side
+        # YuNet guarda el tamaño de entrada en el objeto: una deteccion a la vez
+        self._lock = threading.Lock()
+
+        if model_path:
+            self._yunet = cv2.FaceDetectorYN.create(str(model_path), '', (320, 320), score_threshold, 0.3, 5000)
+            self._haar = None
+        else:
+            self._yunet = None
+            self._haar = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+    def detect(self, image):
+        """
+        caras de una imagen PIL en RGB, de la mas grande a la mas chica:
+        [{'box': [x, y, w, h], 'score': float, 'landmarks': [[x, y] * 5] o None}]
+        """
+        scale = min(1.0, self.max_side / max(image.size))
+        small = image
+        if scale < 1.0:
+            small = image.resize(
+                (round(image.width * scale), round(image.height * scale)), Image.BILINEAR, reducing_gap=2.0
+            )
+        pixels = np.asarray(small)
+
+        faces = []
+        if self._yunet is not None:
+            bgr = np.ascontiguousarray(pixels[:, :, ::-1])
+            with self._lock:
+                self._yunet.setInputSize((bgr.shape[1], bgr.shape[0]))
+                _, rows = self._yunet.detect(bgr)
+            for row in (rows if rows is not None else []):
+                faces.append({
+                    'box': (row[:4] / scale).tolist(),
+                    'score': float(row[14]),
+                    'landmarks': (row[4:14].reshape(5, 2) / scale).tolist(),
+                })
+        else:
+            gray = self.cv2.cvtColor(pixels, self.cv2.COLOR_RGB2GRAY)
+            min_side = max(1, round(self.min_size * scale))
+            with self._lock:
+                rects = self._haar.detectMultiScale(
+                    gray, scaleFactor=1.1, minNeighbors=5, minSize=(min_side, min_side)
+                )
+            for rect in rects:
+                faces.append({
+                    'box': (np.asarray(rect, dtype=np.float64) / scale).tolist(),
+                    'score': None,
+                    'landmarks': None,
+                })
+
+        faces = [face for face in faces if min(face['box'][2], face['box'][3]) >= self.min_size]
+        for face in faces:
+            face['box'] = [round(v) for v in face['box']]
+        faces.sort(key=lambda face: face['box'][2] * face['box'][3], reverse=True)
+        return faces
+
+
+def crop_face(image, face, size=INPUT_SIZE, margin=CROP_MARGIN):
+    """
+    recorte cuadrado de la cara con holgura, ya del tamaño de entrada del modelo.
+    con landmarks se rota para que los ojos queden horizontales
+    """
+    x, y, w, h = face['box']
+    side = max(w, h) * (1 + 2 * margin)
+    cx, cy = x + w / 2, y + h / 2
+
+    landmarks = face.get('landmarks')
+    if not landmarks:
+        box = (cx - side / 2, cy - side / 2, cx + side / 2, cy + side / 2)
+        return image.crop(tuple(round(v) for v in box)).resize(size, Image.BILINEAR)
+
+    # ojo derecho y ojo izquierdo de la persona (izquierda y derecha en la imagen)
+    (rx, ry), (lx, ly) = landmarks[0], landmarks[1]
+    angle = math.degrees(math.atan2(ly - ry, lx - rx))
+
+    # se rota solo una region alrededor de la cara, con lugar para las esquinas
+    region_side = side * math.sqrt(2)
+    left, top = round(cx - region_side / 2), round(cy - region_side / 2)
+    region = image.crop((left, top, left + round(region_side), top + round(region_side)))
+    center = (cx - left, cy - top)
+    region = region.rotate(angle, resample=Image.BILINEAR, center=center)
+
+    box = (center[0] - side / 2, center[1] - side / 2, center[0] + side / 2, center[1] + side / 2)
+    return region.crop(tuple(round(v) for v in box)).resize(size, Image.BILINEAR)
+
+
+def detect_and_classify(image, predictor, detector=None, max_faces=None):
+    """
+    detecta todas las caras y las clasifica juntas en un solo forward pass.
+    regresa (resultado principal, caras): la principal es la cara mas grande; si no
+    hay ninguna se clasifica la imagen completa como antes y caras queda vacia
+    """
+    detector = detector or get_face_detector()
+    max_faces = max_faces or getattr(settings, 'FACE_DETECTION_MAX_FACES', DEFAULT_MAX_FACES)
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    with timed('detect'):
+        faces = detector.detect(image)[:max_faces]
+
+    if not faces:
+        return predictor.predict(image), []
+
+    crops = [crop_face(image, face) for face in faces]
+    # con max_faces <= max_batch_size todas las caras van en el mismo batch
+    results = predictor.predict_batch(crops)
+    for face, result in zip(faces, results):
+        face['results'] = result
+    return results[0], faces
+
+
+def faces_for_storage(faces):
+    """caras sin los embeddings (arrays de numpy), listas para JSON"""
+    from .predictor import TASKS
+
+    return [
+        {**face, 'results': {task: face['results'][task] for task in TASKS}}
+        for face in faces
+    ]
+
+
+# instancia global
+detector = None
+_detector_lock = threading.Lock()
+
+def get_face_detector():
+
+    global detector
+    if detector is None:
+        with _detector_lock:
+            if detector is None:
+                detector = FaceDetector(
+                    model_path=getattr(settings, 'FACE_DETECTOR_MODEL', None),
+                    score_threshold=getattr(settings, 'FACE_DETECTION_SCORE_THRESHOLD', DEFAULT_SCORE_THRESHOLD),
+                    min_size=getattr(settings, 'FACE_DETECTION_MIN_SIZE', DEFAULT_MIN_FACE_SIZE),
+                )
+    return detector
@@ -0,0 +1,258 @@
+# predictorThing/embeddings.py
+import re
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .predictor import EMBEDDING_DIM, EMBEDDING_KEY
+from .preprocessing import load_image
+
+try:
+    import fcntl
+except ImportError:  # windows: solo el lock entre hilos
+    fcntl = None
+
+# arriba de esta similitud coseno se considera la misma imagen
+DEFAULT_DUPLICATE_THRESHOLD = 0.97
+
+# filas por bloque al calcular similitudes (bloque float32 de ~20 MB)
+SEARCH_CHUNK_ROWS = 4096
+
+# id de una fila borrada
+TOMBSTONE = -1
+
+# caracteres que no van en el nombre del directorio de una version
+_UNSAFE = re.compile(r'[^A-Za-z0-9._-]')
+
+
+class EmbeddingStore:
+    """
+    embeddings del backbone por analisis en dos archivos de solo-append:
+    ids.i64 (int64) y vectors.f16 ([N, 1280] float16, norma 1). la busqueda es
+    fuerza bruta vectorizada sobre un memmap, suficiente para cientos de miles de filas
+    """
+
+    def __init__(self, directory, dim=EMBEDDING_DIM):
+        self.directory = Path(directory)
+        self.dim = dim
+        self.ids_path = self.directory / 'ids.i64'
+        self.vectors_path = self.directory / 'vectors.f16'
+        self._lock = threading.Lock()
+        self._view = None
+
+    @contextmanager
+    def _write_lock(self):
+        """lock entre hilos y, con fcntl, entre procesos (workers de gunicorn)"""
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(self.directory / '.lock', 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __len__(self):
+        if not self.ids_path.exists() or not self.vectors_path.exists():
+            return 0
+        # los vectores se escriben antes que los ids: una fila cuenta cuando ya estan ambos
+        return min(self.ids_path.stat().st_size // 8, self.vectors_path.stat().st_size // (self.dim * 2))
+
+    def _arrays(self):
+        """(ids, vectors) como memmaps de solo lectura; se reabren si el archivo crecio"""
+        count = len(self)
+        view = self._view
+        if view is not None and view[0] == count:
+            return view[1], view[2]
+        if count == 0:
+            return np.empty(0, dtype=np.int64), np.empty((0, self.dim), dtype=np.float16)
+
+        ids = np.memmap(self.ids_path, dtype=np.int64, mode='r', shape=(count,))
+        vectors = np.memmap(self.vectors_path, dtype=np.float16, mode='r', shape=(count, self.dim))
+        self._view = (count, ids, vectors)
+        return ids, vectors
+
+    def add(self, ids, vectors):
+        """agrega una fila por analisis; vectors [N, dim] ya normalizados"""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float16).reshape(-1, self.dim)
+        if len(ids) != len(vectors):
+            raise ValueError(f'{len(ids)} ids para {len(vectors)} vectores')
+        if not len(ids):
+            return
+
+        with self._write_lock():
+            # recorta una escritura a medias de un proceso que murio
+            count = len(self)
+            with open(self.vectors_path, 'ab') as f:
+                f.truncate(count * self.dim * 2)
+                f.write(vectors.tobytes())
+            with open(self.ids_path, 'ab') as f:
+                f.truncate(count * 8)
+                f.write(ids.tobytes())
+
+    def remove(self, ids):
+        """marca las filas de esos analisis como borradas (no compacta el archivo)"""
+        with self._write_lock():
+            count = len(self)
+            if not count:
+                return 0
+            stored = np.memmap(self.ids_path, dtype=np.int64, mode='r+', shape=(count,))
+            mask = np.isin(stored, np.asarray(list(ids), dtype=np.int64))
+            stored[mask] = TOMBSTONE
+            stored.flush()
+            return int(mask.sum())
+
+    def stored_ids(self):
+        ids, _ = self._arrays()
+        return set(np.unique(ids[ids != TOMBSTONE]).tolist())
+
+    def vector(self, analysis_id):
+        """el embedding guardado de un analisis (la ultima fila si se agrego dos veces)"""
+        ids, vectors = self._arrays()
+        rows = np.flatnonzero(ids == analysis_id)
+        if not len(rows):
+            return None
+        return np.array(vectors[rows[-1]], dtype=np.float32)
+
+    def search(self, query, k=10, exclude=()):
+        """
+        los k analisis mas parecidos a query: [(analysis_id, similitud coseno)],
+        de mayor a menor
+        """
+        ids, vectors = self._arrays()
+        if not len(ids) or k <= 0:
+            return []
+
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        scores = np.empty(len(ids), dtype=np.float32)
+        for start in range(0, len(ids), SEARCH_CHUNK_ROWS):
+            block = np.asarray(vectors[start:start + SEARCH_CHUNK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ query
+
+        scores[ids == TOMBSTONE] = -np.inf
+        if exclude:
+            scores[np.isin(ids, np.asarray(list(exclude), dtype=np.int64))] = -np.inf
+
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+
+def embeddings_root():
+    return Path(getattr(settings, 'EMBEDDINGS_DIR', Path(settings.BASE_DIR) / 'embeddings'))
+
+
+def version_directory(model_version):
+    """
+    EMBEDDINGS_DIR/<version>: cada version del modelo tiene su propio espacio de
+    embeddings, los vectores de dos versiones no se pueden comparar
+    """
+    name = _UNSAFE.sub('_', model_version or '') or 'unversioned'
+    return embeddings_root() / name
+
+
+# instancias globales, una por version del modelo
+stores = {}
+_store_lock = threading.Lock()
+
+def get_embedding_store(model_version=None):
+    """el indice de la version dada o, sin version, el de la que contesta en este proceso"""
+    if model_version is None:
+        from .predictor import get_predictor
+        model_version = get_predictor().model_version
+
+    store = stores.get(model_version)
+    if store is None:
+        with _store_lock:
+            store = stores.get(model_version)
+            if store is None:
+                store = stores[model_version] = EmbeddingStore(version_directory(model_version))
+    return store
+
+
+def all_embedding_stores():
+    """los indices de todas las versiones que tienen algo en disco (para borrar en todas)"""
+    root = embeddings_root()
+    if not root.is_dir():
+        return []
+    with _store_lock:
+        known = {store.directory: store for store in stores.values()}
+    return [
+        known.get(path) or EmbeddingStore(path)
+        for path in sorted(root.iterdir())
+        if path.is_dir() and (path / 'ids.i64').exists()
+    ]
+
+
+def backfill(predictor, limit=None, batch_size=None, report=None):
+    """
+    calcula con predictor el embedding de los analisis que aun no estan en el
+    indice de su version; regresa (agregados, con error). los que no se pueden
+    leer o decodificar cuentan como error y se saltan
+    """
+    from itertools import islice
+
+    from django.core.files.storage import default_storage
+
+    from .models import FaceAnalysis
+
+    store = get_embedding_store(predictor.model_version)
+    batch_size = batch_size or predictor.max_batch_size
+    done = store.stored_ids()
+    rows = (
+        (pk, name)
+        for pk, name in FaceAnalysis.objects.exclude(image='').order_by('id')
+            .values_list('id', 'image').iterator(chunk_size=2000)
+        if pk not in done
+    )
+    if limit:
+        rows = islice(rows, limit)
+
+    total = 0
+    failed = 0
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            break
+
+        ids = []
+        images = []
+        for pk, name in chunk:
+            try:
+                with default_storage.open(name, 'rb') as f:
+                    # se decodifica aqui, una por una: un archivo corrupto no tumba todo el batch
+                    image = load_image(f.read(), predictor.preprocessor.size)
+                    image.load()
+                images.append(image)
+                ids.append(pk)
+            except Exception as e:
+                failed += 1
+                if report:
+                    report(f'error en analisis {pk}: {e}')
+
+        if not ids:
+            continue
+
+        results = predictor.predict_batch(images)
+        if results[0].get(EMBEDDING_KEY) is None:
+            raise ValueError('el modelo cargado no da embeddings (re-exportar con manage.py export_model)')
+
+        store.add(ids, [result[EMBEDDING_KEY] for result in results])
+        total += len(ids)
+        if report:
+            report(f'{total} embeddings guardados')
+    return total, failed
@@ -0,0 +1,95 @@
+# predictorThing/executor.py
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 16
+
+
+class ExecutorFull(Exception):
+    """no hay lugar en el pool ni en su cola; el request debe contestar 503"""
+
+
+class BoundedExecutor:
+    """
+    pool de hilos para decode + inferencia con un limite de trabajos en vuelo
+    (corriendo + en cola); lo que excede se rechaza en vez de acumularse
+    """
+
+    def __init__(self, max_workers=DEFAULT_WORKERS, max_queue=DEFAULT_QUEUE_SIZE):
+        self.max_workers = max(1, int(max_workers))
+        self.capacity = self.max_workers + max(0, int(max_queue))
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='inference')
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+
+    def submit(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise ExecutorFull()
+        return self._submit(fn, args, kwargs)
+
+    def submit_wait(self, timeout, fn, *args, **kwargs):
+        """
+        como submit, pero espera hasta timeout segundos a que haya lugar; para trabajo
+        que ya esta en curso (ej. el siguiente batch de un video) y no debe cortarse
+        """
+        if not self._slots.acquire(timeout=timeout):
+            with self._lock:
+                self._rejected += 1
+            raise ExecutorFull()
+        return self._submit(fn, args, kwargs)
+
+    def _submit(self, fn, args, kwargs):
+        with self._lock:
+            self._in_flight += 1
+        try:
+            # copia el contexto para que el desglose de tiempos del request siga en el hilo
+            future = self._pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    async def run(self, fn, *args, **kwargs):
+        """version async de submit: espera el resultado sin bloquear el event loop"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'capacity': self.capacity,
+                'in_flight': self._in_flight,
+                'rejected': self._rejected,
+            }
+
+
+# instancia global
+executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+
+    global executor
+    if executor is None:
+        with _executor_lock:
+            if executor is None:
+                executor = BoundedExecutor(
+                    max_workers=getattr(settings, 'ASYNC_INFERENCE_WORKERS', DEFAULT_WORKERS),
+                    max_queue=getattr(settings, 'ASYNC_INFERENCE_QUEUE', DEFAULT_QUEUE_SIZE),
+                )
+    return executor
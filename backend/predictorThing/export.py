@@ -0,0 +1,79 @@
+# predictorThing/export.py
+import torch
+import torch.nn as nn
+
+from .predictor import OUTPUTS, TASKS
+
+
+class TupleOutputModel(nn.Module):
+    """envuelve MultiTaskFaceModel para que regrese una tupla (orden de OUTPUTS) en vez de un dict"""
+
+    def __init__(self, model):
+        super(TupleOutputModel, self).__init__()
+        self.model = model
+
+    def forward(self, x):
+        outputs = self.model(x)
+        return tuple(outputs[name] for name in OUTPUTS)
+
+
+def _example_input(batch_size=2):
+    return torch.randn(batch_size, 3, 224, 224)
+
+
+def export_torchscript(model, path):
+    """exporta con torch.jit.trace; el grafo queda independiente de timm"""
+    wrapped = TupleOutputModel(model).cpu().eval()
+    with torch.no_grad():
+        traced = torch.jit.trace(wrapped, _example_input())
+    traced = torch.jit.freeze(traced)
+    traced.save(str(path))
+    return path
+
+
+def export_onnx(model, path, opset=17):
+    """exporta a ONNX con el eje de batch dinamico"""
+    wrapped = TupleOutputModel(model).cpu().eval()
+    dynamic_axes = {'input': {0: 'batch'}}
+    dynamic_axes.update({name: {0: 'batch'} for name in OUTPUTS})
+
+    with torch.no_grad():
+        torch.onnx.export(
+            wrapped,
+            _example_input(),
+            str(path),
+            input_names=['input'],
+            output_names=list(OUTPUTS),
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+    return path
+
+
+def check_parity(reference, candidate, batch_sizes=(1, 4, 16), atol=1e-3, seed=0):
+    """
+    compara los logits de dos FaceAttributePredictor (eager vs exportado) con
+    entradas aleatorias; regresa un reporte por tarea y si todo quedo dentro de atol
+    """
+    generator = torch.Generator().manual_seed(seed)
+    report = {task: {'max_abs_diff': 0.0, 'argmax_agreement': 0} for task in TASKS}
+    total = 0
+
+    for batch_size in batch_sizes:
+        batch = torch.randn(batch_size, 3, 224, 224, generator=generator)
+        expected = reference.forward_logits(batch)
+        actual = candidate.forward_logits(batch)
+
+        for task in TASKS:
+            exp = expected[task].float().cpu()
+            act = actual[task].float().cpu()
+            diff = (exp - act).abs().max().item()
+            report[task]['max_abs_diff'] = max(report[task]['max_abs_diff'], diff)
+            report[task]['argmax_agreement'] += (exp.argmax(dim=1) == act.argmax(dim=1)).sum().item()
+        total += batch_size
+
+    for task in TASKS:
+        report[task]['argmax_agreement'] = report[task]['argmax_agreement'] / total
+
+    passed = all(report[task]['max_abs_diff'] <= atol for task in TASKS)
+    return passed, report
@@ -0,0 +1,69 @@
+# predictorThing/images.py
+import io
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# version para mostrar (comprimida y reducida)
+DISPLAY_MAX_SIDE = 1600
+
+# miniaturas del historial: lado maximo en px y formatos
+THUMBNAIL_SIZES = (128, 256, 512)
+THUMBNAIL_FORMATS = ('WEBP', 'JPEG')
+DEFAULT_THUMBNAIL_SIZE = 256
+
+FORMAT_EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp', 'PNG': 'png'}
+CONTENT_TYPES = {'jpg': 'image/jpeg', 'webp': 'image/webp', 'png': 'image/png'}
+
+
+def derivative_name(original_name, suffix, fmt):
+    """face_images/2025/11/13/foto.png -> face_images/2025/11/13/foto_<suffix>.<ext>"""
+    stem, _ = posixpath.splitext(original_name)
+    return f"{stem}_{suffix}.{FORMAT_EXTENSIONS[fmt]}"
+
+
+def open_original(name):
+    """abre la imagen del storage con la orientacion EXIF ya aplicada"""
+    with default_storage.open(name, 'rb') as f:
+        image = Image.open(f)
+        image.load()
+    return ImageOps.exif_transpose(image)
+
+
+def save_variant(image, original_name, suffix, max_side, fmt='JPEG', quality=85):
+    """
+    guarda una copia reducida junto al original y regresa su nombre en el storage.
+    nunca sobreescribe: si el nombre ya existe (un upload que se llama asi, o la
+    version anterior) el storage escoge otro libre
+    """
+    variant = image.copy()
+    variant.thumbnail((max_side, max_side), Image.LANCZOS)
+    if variant.mode not in ('RGB', 'RGBA') or (fmt == 'JPEG' and variant.mode != 'RGB'):
+        variant = variant.convert('RGB')
+
+    buffer = io.BytesIO()
+    variant.save(buffer, format=fmt, quality=quality, optimize=True)
+
+    return default_storage.save(derivative_name(original_name, suffix, fmt), ContentFile(buffer.getvalue()))
+
+
+def save_thumbnails(image, original_name, sizes=THUMBNAIL_SIZES, formats=THUMBNAIL_FORMATS):
+    """
+    genera las miniaturas junto al original; regresa {'256': {'webp': nombre, 'jpg': nombre}, ...}
+    """
+    thumbnails = {}
+    for size in sizes:
+        entry = thumbnails[str(size)] = {}
+        for fmt in formats:
+            quality = 80 if fmt == 'JPEG' else 75
+            entry[FORMAT_EXTENSIONS[fmt]] = save_variant(
+                image, original_name, f'thumb{size}', size, fmt, quality=quality
+            )
+    return thumbnails
+
+
+def thumbnail_name(derivatives, size=DEFAULT_THUMBNAIL_SIZE, ext='webp'):
+    """nombre en el storage de una miniatura, o None si todavia no se genera"""
+    return (derivatives or {}).get('thumbnails', {}).get(str(size), {}).get(ext)
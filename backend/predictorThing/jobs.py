@@ -0,0 +1,220 @@
+# predictorThing/jobs.py
+import os
+import threading
+import time
+import traceback
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import BackgroundJob
+
+DEFAULT_POLL_INTERVAL = 2.0
+
+# un trabajo 'running' que no se actualiza en este tiempo se considera abandonado
+STALE_AFTER = timedelta(minutes=10)
+
+# cada cuanto (segundos) el worker marca updated_at de lo que esta corriendo; muy por
+# debajo de STALE_AFTER para que un trabajo largo nunca parezca abandonado
+DEFAULT_HEARTBEAT_INTERVAL = 60.0
+
+# kind -> funcion(**payload)
+HANDLERS = {}
+
+
+def job(kind):
+    """registra una funcion como manejador de trabajos de tipo kind"""
+    def decorator(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+def _load_handlers():
+    # los manejadores viven en tasks.py y se registran al importarlo
+    import_module('predictorThing.tasks')
+
+
+def enqueue(kind, delay=None, **payload):
+    """
+    crea el trabajo en la BD (dentro de la transaccion actual si hay una)
+    y despierta al worker local cuando se hace commit
+    """
+    job = BackgroundJob.objects.create(
+        kind=kind,
+        payload=payload,
+        run_after=timezone.now() + (delay or timedelta(0)),
+    )
+    if getattr(settings, 'JOBS_LOCAL_WORKER', False):
+        transaction.on_commit(lambda: get_local_worker().wake())
+    return job
+
+
+def enqueue_many(kind, payloads):
+    """encola varios trabajos del mismo tipo con un solo bulk_create"""
+    jobs = BackgroundJob.objects.bulk_create(
+        [BackgroundJob(kind=kind, payload=payload) for payload in payloads],
+        batch_size=500,
+    )
+    if jobs and getattr(settings, 'JOBS_LOCAL_WORKER', False):
+        transaction.on_commit(lambda: get_local_worker().wake())
+    return jobs
+
+
+def _claim(limit):
+    """toma hasta limit trabajos pendientes; skip_locked deja correr varios workers a la vez"""
+    now = timezone.now()
+    with transaction.atomic():
+        # recupera los que quedaron colgados por un worker que murio
+        BackgroundJob.objects.filter(
+            status=BackgroundJob.RUNNING, updated_at__lt=now - STALE_AFTER
+        ).update(status=BackgroundJob.PENDING, updated_at=now)
+
+        jobs = list(
+            BackgroundJob.objects.select_for_update(skip_locked=True)
+            .filter(status=BackgroundJob.PENDING, run_after__lte=now)
+            .order_by('id')[:limit]
+        )
+        if jobs:
+            BackgroundJob.objects.filter(pk__in=[j.pk for j in jobs]).update(
+                status=BackgroundJob.RUNNING, updated_at=now
+            )
+    return jobs
+
+
+class _Heartbeat:
+    """
+    mientras corre el manejador, otro hilo actualiza updated_at del trabajo cada
+    interval segundos; si el proceso muere deja de latir y _claim lo recupera
+    """
+
+    def __init__(self, job_id, interval):
+        self.job_id = job_id
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._loop, name=f'job-heartbeat-{self.job_id}', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _loop(self):
+        try:
+            while not self._stop.wait(self.interval):
+                BackgroundJob.objects.filter(pk=self.job_id, status=BackgroundJob.RUNNING).update(
+                    updated_at=timezone.now()
+                )
+        except Exception:
+            print(f"ERROR en el heartbeat del trabajo {self.job_id}:")
+            print(traceback.format_exc())
+        finally:
+            # la conexion de este hilo no la cierra nadie mas
+            connection.close()
+
+
+def _run(job):
+    handler = HANDLERS.get(job.kind)
+    job.attempts += 1
+    try:
+        if handler is None:
+            raise LookupError(f"no hay manejador para el trabajo '{job.kind}'")
+        interval = getattr(settings, 'JOBS_HEARTBEAT_INTERVAL', DEFAULT_HEARTBEAT_INTERVAL)
+        with _Heartbeat(job.pk, interval):
+            handler(**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = BackgroundJob.FAILED
+        else:
+            # reintento con espera exponencial
+            job.status = BackgroundJob.PENDING
+            job.run_after = timezone.now() + timedelta(seconds=5 * 2 ** job.attempts)
+        print(f"ERROR en trabajo {job}:")
+        print(job.last_error)
+    else:
+        job.status = BackgroundJob.DONE
+        job.last_error = ''
+    job.save(update_fields=['status', 'attempts', 'run_after', 'last_error', 'updated_at'])
+    return job.status == BackgroundJob.DONE
+
+
+def run_pending(limit=10):
+    """corre un lote de trabajos pendientes; regresa cuantos se procesaron"""
+    _load_handlers()
+    jobs = _claim(limit)
+    for job in jobs:
+        _run(job)
+    return len(jobs)
+
+
+class LocalWorker:
+    """
+    worker en un hilo del mismo proceso, para desarrollo o despliegues chicos;
+    en produccion se usa manage.py run_jobs
+    """
+
+    def __init__(self, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name='local-job-worker', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        self._ensure_started()
+        self._event.set()
+
+    def _loop(self):
+        try:
+            close_old_connections()
+            _load_handlers()
+            import_module('predictorThing.tasks').schedule_periodic()
+        except Exception:
+            print("ERROR al encolar los trabajos periodicos:")
+            print(traceback.format_exc())
+
+        while True:
+            self._event.wait(self.poll_interval)
+            self._event.clear()
+            try:
+                close_old_connections()
+                while run_pending():
+                    pass
+            except Exception:
+                print("ERROR en el worker local de trabajos:")
+                print(traceback.format_exc())
+                time.sleep(self.poll_interval)
+
+
+# instancia global
+local_worker = None
+_worker_lock = threading.Lock()
+
+def get_local_worker():
+
+    global local_worker
+    if local_worker is None:
+        with _worker_lock:
+            if local_worker is None:
+                local_worker = LocalWorker(
+                    poll_interval=getattr(settings, 'JOBS_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)
+                )
+    return local_worker
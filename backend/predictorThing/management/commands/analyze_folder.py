@@ -0,0 +1,212 @@
+# predictorThing/management/commands/analyze_folder.py
+import os
+import time
+from multiprocessing import Pool
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from predictorThing.embeddings import get_embedding_store
+from predictorThing.jobs import enqueue_many
+from predictorThing.models import FaceAnalysis
+from predictorThing.predictor import EMBEDDING_KEY, MODEL_VERSION_KEY, get_predictor, TASKS
+from predictorThing.preprocessing import load_image
+from predictorThing.topk import DEFAULT_STORED_TOP_K, stored_top_k
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.gif', '.tif', '.tiff')
+
+
+def _decode(path):
+    """
+    corre en el pool de procesos: abre la imagen y la deja en RGB 224x224
+    para mandar poco por el pipe
+    """
+    try:
+        return path, load_image(path), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+class Command(BaseCommand):
+    help = 'Analiza todas las imagenes de un directorio y guarda los resultados en FaceAnalysis'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='directorio raiz a recorrer')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='imagenes por forward pass (default: PREDICTOR_MAX_BATCH_SIZE)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='procesos para decodificar imagenes')
+        parser.add_argument('--commit-size', type=int, default=1000,
+                            help='filas por transaccion de bulk_create')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='corre la inferencia pero no escribe en la BD ni copia archivos')
+        parser.add_argument('--report-every', type=int, default=500,
+                            help='cada cuantas imagenes reportar progreso')
+
+    def handle(self, *args, **options):
+        root = Path(options['directory']).resolve()
+        if not root.is_dir():
+            raise CommandError(f'no existe el directorio: {root}')
+
+        predictor = get_predictor()
+        batch_size = options['batch_size'] or predictor.max_batch_size
+        commit_size = max(1, options['commit_size'])
+        dry_run = options['dry_run']
+        report_every = max(1, options['report_every'])
+        self.stored_top_k = getattr(settings, 'PREDICTION_STORED_TOP_K', DEFAULT_STORED_TOP_K)
+
+        paths = self._find_images(root)
+        total_found = len(paths)
+
+        # resume: salta lo que ya se ingesto en una corrida anterior, por ruta absoluta
+        # (no depende de --root ni choca con uploads que tengan el mismo nombre)
+        done = set(
+            FaceAnalysis.objects.filter(source_path__startswith=str(root) + os.sep)
+            .values_list('source_path', flat=True).iterator(chunk_size=5000)
+        )
+        paths = [p for p in paths if self._source_path(p) not in done]
+        skipped = total_found - len(paths)
+
+        self.stdout.write(
+            f'{total_found} imagenes encontradas, {skipped} ya ingestadas, {len(paths)} por procesar'
+            + (' (dry-run)' if dry_run else '')
+        )
+        if not paths:
+            return
+
+        processed = 0
+        failed = 0
+        pending = []
+        chunk = []
+        started = time.monotonic()
+
+        with Pool(processes=max(1, options['workers'])) as pool:
+            for path, image, error in pool.imap(_decode, paths, chunksize=8):
+                if error is not None:
+                    failed += 1
+                    self.stderr.write(f'error al decodificar {path}: {error}')
+                    continue
+
+                chunk.append((path, predictor.preprocess(image)))
+
+                if len(chunk) == batch_size:
+                    pending.extend(self._predict_chunk(root, predictor, chunk, dry_run))
+                    processed += len(chunk)
+                    chunk = []
+
+                    if len(pending) >= commit_size:
+                        self._write(pending, dry_run)
+                        pending = []
+
+                    if processed % report_every < batch_size:
+                        self._report(processed, failed, len(paths), started)
+
+            if chunk:
+                pending.extend(self._predict_chunk(root, predictor, chunk, dry_run))
+                processed += len(chunk)
+
+        if pending:
+            self._write(pending, dry_run)
+
+        self._report(processed, failed, len(paths), started)
+        self.stdout.write(self.style.SUCCESS(
+            f'listo: {processed} analizadas, {failed} con error, {skipped} saltadas'
+        ))
+
+    def _find_images(self, root):
+        paths = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(dirpath, filename))
+        return paths
+
+    def _image_name(self, root, path):
+        """nombre con el que se muestra la fila: la ruta relativa a la raiz"""
+        return Path(path).relative_to(root).as_posix()[:255]
+
+    def _source_path(self, path):
+        return str(Path(path).resolve())
+
+    def _predict_chunk(self, root, predictor, chunk, dry_run):
+        results = predictor.predict_tensors([tensor for _, tensor in chunk])
+
+        rows = []
+        for (path, _), result in zip(chunk, results):
+            fields = {}
+            for task in TASKS:
+                fields[task] = result[task]['prediction']
+                fields[f'{task}_confidence'] = result[task]['confidence']
+
+            # el archivo se copia hasta _write, dentro de la transaccion del INSERT
+            row = FaceAnalysis(
+                image_name=self._image_name(root, path),
+                source_path=self._source_path(path),
+                top_k=stored_top_k(result, predictor.class_names, self.stored_top_k),
+                model_version=result.get(MODEL_VERSION_KEY, ''),
+                **fields
+            )
+            # se agrega al indice de similitud despues del INSERT, cuando ya hay id
+            row._embedding = result.get(EMBEDDING_KEY)
+            rows.append(row)
+        return rows
+
+    def _store_image(self, path):
+        """
+        referencia el archivo si ya vive en MEDIA_ROOT, si no lo copia al storage;
+        regresa (nombre en el storage, si se copio)
+        """
+        media_root = Path(settings.MEDIA_ROOT).resolve()
+        resolved = Path(path).resolve()
+        if resolved.is_relative_to(media_root):
+            return resolved.relative_to(media_root).as_posix(), False
+
+        image_field = FaceAnalysis._meta.get_field('image')
+        name = image_field.generate_filename(None, os.path.basename(path))
+        with open(path, 'rb') as f:
+            return default_storage.save(name, File(f)), True
+
+    def _write(self, rows, dry_run):
+        if dry_run:
+            return
+
+        # las copias se hacen junto con el INSERT; si el lote falla se borran y
+        # la siguiente corrida las vuelve a hacer sin dejar duplicados
+        copied = []
+        try:
+            with transaction.atomic():
+                for row in rows:
+                    name, was_copied = self._store_image(row.source_path)
+                    row.image = name
+                    if was_copied:
+                        copied.append(name)
+                created = FaceAnalysis.objects.bulk_create(rows, batch_size=500)
+                # miniaturas y version comprimida en segundo plano, igual que en save_analysis
+                enqueue_many('make_derivatives', [{'analysis_id': row.pk} for row in created if row.pk])
+        except Exception:
+            for name in copied:
+                default_storage.delete(name)
+            raise
+
+        # cada embedding al indice de la version que lo calculo
+        by_version = {}
+        for row in created:
+            if row.pk and row._embedding is not None:
+                by_version.setdefault(row.model_version or None, []).append(row)
+        for model_version, embedded in by_version.items():
+            get_embedding_store(model_version).add([row.pk for row in embedded], [row._embedding for row in embedded])
+
+    def _report(self, processed, failed, total, started):
+        elapsed = time.monotonic() - started
+        rate = processed / elapsed if elapsed > 0 else 0
+        remaining = total - processed - failed
+        eta = remaining / rate if rate > 0 else 0
+        self.stdout.write(
+            f'{processed}/{total} analizadas ({failed} errores) - '
+            f'{rate:.1f} img/s - eta {eta:.0f}s'
+        )
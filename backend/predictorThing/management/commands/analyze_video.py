@@ -0,0 +1,91 @@
+# predictorThing/management/commands/analyze_video.py
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from predictorThing.predictor import get_predictor
+from predictorThing.video import (
+    DEFAULT_DIFF_THRESHOLD, DEFAULT_SAMPLE_FPS, VideoAnalyzer, iter_sequence_frames, iter_video_frames
+)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.gif', '.tif', '.tiff')
+
+
+class Command(BaseCommand):
+    help = 'Analiza un video (o un directorio de frames) y reporta los atributos por persona'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='archivo de video o directorio con los frames en orden de nombre')
+        parser.add_argument('--sample-fps', type=float, default=None,
+                            help='frames por segundo a muestrear (default: VIDEO_SAMPLE_FPS)')
+        parser.add_argument('--fps', type=float, default=None,
+                            help='fps de la secuencia de imagenes (sin esto se usa cada imagen)')
+        parser.add_argument('--diff-threshold', type=float, default=None,
+                            help='diferencia minima contra el ultimo frame clasificado (default: VIDEO_DIFF_THRESHOLD)')
+        parser.add_argument('--max-frames', type=int, default=None,
+                            help='tope de frames muestreados (default: sin tope)')
+        parser.add_argument('--faces', action='store_true',
+                            help='detecta caras y sigue a cada persona por separado')
+        parser.add_argument('--frames', action='store_true',
+                            help='imprime tambien el resultado de cada frame clasificado')
+        parser.add_argument('--json', action='store_true',
+                            help='salida en NDJSON en lugar de texto')
+
+    def handle(self, *args, **options):
+        path = Path(options['path']).resolve()
+        if not path.exists():
+            raise CommandError(f'no existe: {path}')
+
+        sample_fps = options['sample_fps'] or getattr(settings, 'VIDEO_SAMPLE_FPS', DEFAULT_SAMPLE_FPS)
+        diff_threshold = options['diff_threshold']
+        if diff_threshold is None:
+            diff_threshold = getattr(settings, 'VIDEO_DIFF_THRESHOLD', DEFAULT_DIFF_THRESHOLD)
+
+        if path.is_dir():
+            frames = iter_sequence_frames(
+                (
+                    (str(item), lambda item=item: open(item, 'rb'))
+                    for item in sorted(path.iterdir())
+                    if item.suffix.lower() in IMAGE_EXTENSIONS
+                ),
+                fps=options['fps'],
+                sample_fps=sample_fps,
+            )
+        else:
+            frames = iter_video_frames(path, sample_fps)
+
+        analyzer = VideoAnalyzer(
+            get_predictor(),
+            diff_threshold=diff_threshold,
+            detect_faces=options['faces'],
+            max_frames=options['max_frames'],
+        )
+
+        try:
+            for event in analyzer.process(frames):
+                if not options['frames']:
+                    continue
+                if options['json']:
+                    self.stdout.write(json.dumps(event))
+                else:
+                    for face in event['faces']:
+                        self.stdout.write(f"frame {event['frame']} ({event['time']}s) track {face['track']}: {face['data']}")
+        except (ImportError, ValueError) as e:
+            raise CommandError(str(e))
+
+        summary = analyzer.summary()
+        if options['json']:
+            self.stdout.write(json.dumps({'done': True, **summary}))
+            return
+
+        for track in summary['tracks']:
+            self.stdout.write(f"track {track['track']}: {track['frames']} frames, {track['start']}s - {track['end']}s")
+            for task, attribute in track['attributes'].items():
+                self.stdout.write(f"  {task}: {attribute['prediction']} ({attribute['confidence']}%) votos {attribute['votes']}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['frames_sampled']} frames muestreados, {summary['frames_duplicated']} descartados "
+            f"por repetidos, {summary['frames_classified']} clasificados, {len(summary['tracks'])} tracks"
+        ))
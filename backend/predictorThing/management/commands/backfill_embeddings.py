@@ -0,0 +1,40 @@
+# predictorThing/management/commands/backfill_embeddings.py
+from django.core.management.base import BaseCommand, CommandError
+
+from predictorThing.embeddings import backfill
+from predictorThing.predictor import get_predictor
+from predictorThing.registry import get_model_manager
+
+
+class Command(BaseCommand):
+    help = (
+        'Calcula y guarda el embedding de los analisis que aun no estan en el indice de similitud '
+        'de la version del modelo (cada version tiene su propio indice, ver embeddings.py)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None)
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='imagenes por forward pass (default: PREDICTOR_MAX_BATCH_SIZE)')
+        parser.add_argument('--version', default=None,
+                            help='version del registro para la que se calculan (default: la activa)')
+
+    def handle(self, *args, **options):
+        try:
+            if options['version']:
+                predictor = get_model_manager().predictor_for(options['version'])
+            else:
+                predictor = get_predictor()
+
+            total, failed = backfill(
+                predictor,
+                limit=options['limit'],
+                batch_size=options['batch_size'],
+                report=self.stdout.write,
+            )
+        except (ValueError, FileNotFoundError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} analisis agregados al indice de {predictor.model_version}, {failed} con error'
+        ))
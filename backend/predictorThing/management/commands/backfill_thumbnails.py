@@ -0,0 +1,55 @@
+# predictorThing/management/commands/backfill_thumbnails.py
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from predictorThing.jobs import enqueue_many
+from predictorThing.models import FaceAnalysis
+from predictorThing.tasks import make_derivatives
+
+
+class Command(BaseCommand):
+    help = 'Genera las miniaturas (y la version comprimida) de los analisis que aun no las tienen'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inline', action='store_true',
+                            help='generarlas en este proceso en vez de encolar trabajos')
+        parser.add_argument('--all', action='store_true',
+                            help='regenerar tambien las que ya existen')
+        parser.add_argument('--limit', type=int, default=None)
+        parser.add_argument('--batch', type=int, default=500, help='trabajos por bulk_create')
+
+    def handle(self, *args, **options):
+        queryset = FaceAnalysis.objects.exclude(image='').order_by('id')
+        if not options['all']:
+            queryset = queryset.exclude(derivatives__has_key='thumbnails')
+
+        ids = queryset.values_list('id', flat=True).iterator(chunk_size=2000)
+        if options['limit']:
+            ids = islice(ids, options['limit'])
+
+        total = 0
+        failed = 0
+        pending = []
+        for pk in ids:
+            total += 1
+            if options['inline']:
+                try:
+                    make_derivatives(analysis_id=pk)
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'error en analisis {pk}: {e}')
+                if total % 100 == 0:
+                    self.stdout.write(f'{total} procesados')
+                continue
+
+            pending.append({'analysis_id': pk})
+            if len(pending) >= options['batch']:
+                enqueue_many('make_derivatives', pending)
+                pending = []
+
+        if pending:
+            enqueue_many('make_derivatives', pending)
+
+        action = 'generados' if options['inline'] else 'encolados (correr manage.py run_jobs)'
+        self.stdout.write(self.style.SUCCESS(f'{total - failed} analisis {action}, {failed} con error'))
@@ -0,0 +1,57 @@
+# predictorThing/management/commands/benchmark.py
+import json
+
+from django.core.management.base import BaseCommand
+
+from predictorThing.benchmarks import DEFAULT_BATCH_SIZES, DEFAULT_ENDPOINTS, run_all
+
+
+def _int_list(value):
+    return tuple(int(v) for v in value.split(',') if v.strip())
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark reproducible con un modelo de pesos aleatorios (no necesita el checkpoint): '
+        'latencia por imagen, throughput por tamaño de batch, preprocesamiento y endpoints. '
+        'Imprime JSON para comparar entre commits'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--max-batch-size', type=int, default=32)
+        parser.add_argument('--repeats', type=int, default=50,
+                            help='repeticiones para la latencia de una imagen')
+        parser.add_argument('--batch-sizes', type=_int_list, default=DEFAULT_BATCH_SIZES,
+                            help='tamaños de batch separados por coma (default: 1,4,8,16,32)')
+        parser.add_argument('--iterations', type=int, default=10,
+                            help='forward passes por tamaño de batch')
+        parser.add_argument('--preprocessing-repeats', type=int, default=20)
+        parser.add_argument('--concurrency', type=_int_list, default=(1, 4, 8),
+                            help='hilos concurrentes contra los endpoints (default: 1,4,8)')
+        parser.add_argument('--requests', type=int, default=64,
+                            help='requests por endpoint y nivel de concurrencia')
+        parser.add_argument('--skip-endpoints', action='store_true',
+                            help='no medir /api/predict/ ni /api/save/')
+        parser.add_argument('--output', help='escribe el JSON en este archivo en vez de stdout')
+
+    def handle(self, *args, **options):
+        report = run_all(
+            seed=options['seed'],
+            max_batch_size=options['max_batch_size'],
+            repeats=options['repeats'],
+            batch_sizes=options['batch_sizes'],
+            iterations=options['iterations'],
+            preprocessing_repeats=options['preprocessing_repeats'],
+            endpoints=() if options['skip_endpoints'] else DEFAULT_ENDPOINTS,
+            concurrency=options['concurrency'],
+            requests=options['requests'],
+        )
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f"resultados en {options['output']}"))
+        else:
+            self.stdout.write(output)
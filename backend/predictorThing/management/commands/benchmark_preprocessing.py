@@ -0,0 +1,32 @@
+# predictorThing/management/commands/benchmark_preprocessing.py
+import json
+
+from django.core.management.base import BaseCommand
+
+from predictorThing.benchmarks import benchmark_preprocessing
+
+
+class Command(BaseCommand):
+    help = 'Mide el tiempo de preprocesamiento por imagen (pipeline anterior vs actual) en PNG y JPEG grandes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeats', type=int, default=20)
+        parser.add_argument('--no-legacy', action='store_true',
+                            help='no medir el pipeline anterior (torchvision)')
+        parser.add_argument('--json', action='store_true', help='imprime los resultados como JSON')
+
+    def handle(self, *args, **options):
+        results = benchmark_preprocessing(
+            repeats=options['repeats'],
+            include_legacy=not options['no_legacy'],
+        )
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for row in results:
+            line = f"{row['resolution']:>10} {row['format']:<5} actual {row['fast']['mean_ms']:8.2f} ms"
+            if 'legacy' in row:
+                line += f"  anterior {row['legacy']['mean_ms']:8.2f} ms  (x{row['speedup']})"
+            self.stdout.write(line)
@@ -0,0 +1,63 @@
+# predictorThing/management/commands/export_model.py
+import copy
+
+from django.core.management.base import BaseCommand, CommandError
+
+from predictorThing.export import check_parity, export_onnx, export_torchscript
+from predictorThing.predictor import EXPORTED_PATHS, MODELS_DIR, FaceAttributePredictor, TASKS
+from predictorThing.registry import get_model_manager
+
+
+class Command(BaseCommand):
+    help = 'Exporta el checkpoint a TorchScript y/o ONNX y verifica que coincida con el modelo eager'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['torchscript', 'onnx', 'all'], default='all')
+        parser.add_argument('--opset', type=int, default=17, help='opset de ONNX')
+        parser.add_argument('--atol', type=float, default=1e-3,
+                            help='diferencia maxima permitida en los logits')
+        parser.add_argument('--skip-check', action='store_true',
+                            help='no correr la verificacion de paridad')
+        parser.add_argument('--version', default=None,
+                            help='exporta esa version del registro (default: los archivos de ml_models/)')
+
+    def handle(self, *args, **options):
+        formats = ['torchscript', 'onnx'] if options['format'] == 'all' else [options['format']]
+
+        model_dir = MODELS_DIR
+        if options['version']:
+            registry = get_model_manager().registry
+            if not registry.exists(options['version']):
+                raise CommandError(f"no existe la version {options['version']}")
+            model_dir = registry.version_dir(options['version'])
+
+        reference = FaceAttributePredictor(backend='torch', model_dir=model_dir)
+        # copia en cpu para exportar; el de referencia se queda en su device
+        model = copy.deepcopy(reference.model).cpu()
+
+        failed = []
+        for fmt in formats:
+            path = model_dir / EXPORTED_PATHS[fmt].name
+            if fmt == 'torchscript':
+                export_torchscript(model, path)
+            else:
+                export_onnx(model, path, opset=options['opset'])
+            self.stdout.write(f'{fmt}: exportado a {path}')
+
+            if options['skip_check']:
+                continue
+
+            passed, report = check_parity(reference, FaceAttributePredictor(backend=fmt, model_dir=model_dir), atol=options['atol'])
+            for task in TASKS:
+                self.stdout.write(
+                    f"  {task}: max |diff| = {report[task]['max_abs_diff']:.2e}, "
+                    f"argmax igual en {report[task]['argmax_agreement'] * 100:.1f}%"
+                )
+            if passed:
+                self.stdout.write(self.style.SUCCESS(f'  {fmt}: paridad ok (atol={options["atol"]})'))
+            else:
+                self.stdout.write(self.style.ERROR(f'  {fmt}: fuera de tolerancia (atol={options["atol"]})'))
+                failed.append(fmt)
+
+        if failed:
+            raise CommandError(f'la verificacion de paridad fallo para: {", ".join(failed)}')
@@ -0,0 +1,97 @@
+# predictorThing/management/commands/model_registry.py
+from django.core.management.base import BaseCommand, CommandError
+
+from predictorThing.jobs import enqueue
+from predictorThing.registry import get_model_manager
+
+
+class Command(BaseCommand):
+    help = (
+        'Administra las versiones del modelo: registrar un checkpoint, activarlo (los procesos '
+        'lo cargan y cambian en caliente) o correrlo en sombra sobre una muestra del trafico'
+    )
+
+    def add_arguments(self, parser):
+        actions = parser.add_subparsers(dest='action', required=True)
+
+        actions.add_parser('list', help='versiones registradas y estado actual')
+
+        register = actions.add_parser('register', help='registra un checkpoint como version nueva')
+        register.add_argument('version')
+        register.add_argument('checkpoint', help='ruta al .pth (model_state_dict + num_classes)')
+        register.add_argument('--model-info', default=None,
+                              help='model_info.json de esta version (default: el de ml_models/)')
+        register.add_argument('--description', default='')
+        register.add_argument('--activate', action='store_true', help='activarla en cuanto se registre')
+
+        activate = actions.add_parser('activate', help='cambia la version activa')
+        activate.add_argument('version')
+
+        for subparser in (register, activate):
+            subparser.add_argument('--no-backfill', action='store_true',
+                                   help='no encolar el calculo de embeddings de la version activada '
+                                        '(hasta correrlo, su indice de similitud esta vacio)')
+
+        shadow = actions.add_parser('shadow', help='corre una version en sombra (o la quita con --off)')
+        shadow.add_argument('version', nargs='?')
+        shadow.add_argument('--rate', type=float, default=0.05, help='fraccion del trafico (0-1)')
+        shadow.add_argument('--off', action='store_true')
+
+    def handle(self, *args, **options):
+        registry = get_model_manager().registry
+        action = options['action']
+
+        try:
+            if action == 'register':
+                path = registry.register(
+                    options['version'], options['checkpoint'],
+                    model_info=options['model_info'], description=options['description']
+                )
+                self.stdout.write(self.style.SUCCESS(f"version {options['version']} registrada en {path}"))
+                if options['activate']:
+                    self._activate(registry, options)
+
+            elif action == 'activate':
+                self._activate(registry, options)
+
+            elif action == 'shadow':
+                if options['off'] or not options['version']:
+                    registry.set_shadow(None, 0)
+                    self.stdout.write(self.style.SUCCESS('sin version sombra'))
+                else:
+                    registry.set_shadow(options['version'], options['rate'])
+                    self.stdout.write(self.style.SUCCESS(
+                        f"version sombra: {options['version']} ({options['rate'] * 100:.1f}% del trafico)"
+                    ))
+        except (ValueError, FileNotFoundError) as e:
+            raise CommandError(str(e))
+
+        if action != 'list':
+            return
+
+        state = registry.state()
+        versions = registry.versions()
+        if not versions:
+            self.stdout.write(f'no hay versiones en {registry.root} (se usan los archivos de ml_models/)')
+        for item in versions:
+            marks = []
+            if item['version'] == state['active']:
+                marks.append('activa')
+            if item['version'] == state['shadow']:
+                marks.append(f"sombra {state['shadow_rate'] * 100:.1f}%")
+            self.stdout.write(
+                f"{item['version']:<24} {item['registered_at'] or '-':<26} {', '.join(item['backends']):<28}"
+                f" {' '.join(f'[{mark}]' for mark in marks)} {item['description']}"
+            )
+
+    def _activate(self, registry, options):
+        version = options['version']
+        registry.activate(version)
+        self.stdout.write(self.style.SUCCESS(f'version activa: {version}'))
+
+        # los embeddings de otra version no se comparan con los de esta: su indice se llena aparte
+        if options['no_backfill']:
+            self.stdout.write(f'sin backfill: correr manage.py backfill_embeddings --version {version}')
+        else:
+            job = enqueue('backfill_embeddings', model_version=version)
+            self.stdout.write(f'backfill de embeddings encolado (trabajo #{job.pk}, lo corre run_jobs)')
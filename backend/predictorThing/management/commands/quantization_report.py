@@ -0,0 +1,191 @@
+# predictorThing/management/commands/quantization_report.py
+import csv
+import json
+import time
+from pathlib import Path
+
+import torch
+from django.core.management.base import BaseCommand, CommandError
+
+from predictorThing.predictor import CALIBRATION_IMAGES, FaceAttributePredictor, TASKS
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp')
+
+# sin --calibration-dir se aparta esta fraccion de directory (hasta CALIBRATION_IMAGES) para calibrar
+CALIBRATION_HOLDOUT = 0.2
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el modelo fp32 contra un modo optimizado para cpu (INT8 / channels_last) '
+        'y reporta la diferencia por tarea'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='imagenes de evaluacion')
+        parser.add_argument('--quantization', choices=['dynamic', 'static'], default=None)
+        parser.add_argument('--channels-last', action='store_true')
+        parser.add_argument('--num-threads', type=int, default=None)
+        parser.add_argument('--calibration-dir', default=None,
+                            help='imagenes para calibrar la cuantizacion estatica (default: una parte de '
+                                 'directory que se saca de la evaluacion)')
+        parser.add_argument('--labels', default=None,
+                            help='csv opcional con columnas path,sex,eyes,race,hair para medir accuracy real')
+        parser.add_argument('--limit', type=int, default=None)
+        parser.add_argument('--json', action='store_true', help='imprime el reporte como JSON')
+
+    def handle(self, *args, **options):
+        root = Path(options['directory'])
+        if not root.is_dir():
+            raise CommandError(f'no existe el directorio: {root}')
+        if not options['quantization'] and not options['channels_last']:
+            raise CommandError('indica --quantization y/o --channels-last')
+
+        paths = sorted(p for p in root.rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)
+        if not paths:
+            raise CommandError('no se encontraron imagenes')
+
+        # calibrar con las mismas imagenes que se evaluan infla la coincidencia con fp32:
+        # las de calibracion nunca entran a la evaluacion
+        calibration = None
+        if options['quantization'] == 'static':
+            calibration, paths = self._split_calibration(paths, options['calibration_dir'])
+
+        if options['limit']:
+            paths = paths[:options['limit']]
+        if not paths:
+            raise CommandError('no quedaron imagenes para evaluar fuera de la calibracion')
+
+        labels = self._load_labels(options['labels'], root) if options['labels'] else None
+
+        # referencia fp32 en cpu, mismos hilos que el candidato
+        reference = FaceAttributePredictor(num_threads=options['num_threads'])
+        reference.model.cpu()
+        reference.device = torch.device('cpu')
+
+        candidate = FaceAttributePredictor(
+            quantization=options['quantization'],
+            channels_last=options['channels_last'],
+            num_threads=options['num_threads'],
+            calibration_dir=calibration['paths'] if calibration else None,
+        )
+
+        tensors = [reference.preprocess(str(p)) for p in paths]
+        expected, ref_seconds = self._timed(reference, tensors)
+        actual, cand_seconds = self._timed(candidate, tensors)
+
+        report = {
+            'images': len(paths),
+            'quantization': options['quantization'],
+            'channels_last': options['channels_last'],
+            'fp32_ms_per_image': round(ref_seconds / len(paths) * 1000, 3),
+            'optimized_ms_per_image': round(cand_seconds / len(paths) * 1000, 3),
+            'speedup': round(ref_seconds / cand_seconds, 3) if cand_seconds else None,
+            'calibration': {k: v for k, v in calibration.items() if k != 'paths'} if calibration else None,
+            'tasks': {},
+        }
+
+        for task in TASKS:
+            agree = sum(e[task]['prediction'] == a[task]['prediction'] for e, a in zip(expected, actual))
+            conf_delta = [abs(e[task]['confidence'] - a[task]['confidence']) for e, a in zip(expected, actual)]
+            task_report = {
+                'agreement_with_fp32': round(agree / len(paths), 4),
+                'mean_abs_confidence_delta': round(sum(conf_delta) / len(conf_delta), 3),
+                'max_abs_confidence_delta': round(max(conf_delta), 3),
+            }
+
+            if labels is not None:
+                labeled = [(i, labels[str(p)][task]) for i, p in enumerate(paths)
+                           if str(p) in labels and labels[str(p)].get(task)]
+                if labeled:
+                    fp32_acc = sum(expected[i][task]['prediction'] == y for i, y in labeled) / len(labeled)
+                    opt_acc = sum(actual[i][task]['prediction'] == y for i, y in labeled) / len(labeled)
+                    task_report.update({
+                        'labeled': len(labeled),
+                        'fp32_accuracy': round(fp32_acc, 4),
+                        'optimized_accuracy': round(opt_acc, 4),
+                        'accuracy_delta': round(opt_acc - fp32_acc, 4),
+                    })
+
+            report['tasks'][task] = task_report
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(
+            f"{report['images']} imagenes - fp32 {report['fp32_ms_per_image']} ms/img, "
+            f"optimizado {report['optimized_ms_per_image']} ms/img (x{report['speedup']})"
+        )
+        if calibration:
+            if calibration['source'] == 'holdout':
+                line = f"calibracion: {calibration['images']} imagenes apartadas de {root} (no se evaluan)"
+            else:
+                line = f"calibracion: {calibration['images']} imagenes de {calibration['source']}"
+                if calibration['excluded_from_evaluation']:
+                    line += f" ({calibration['excluded_from_evaluation']} quitadas de la evaluacion)"
+            self.stdout.write(line)
+        for task, task_report in report['tasks'].items():
+            line = (
+                f"  {task}: coincide con fp32 {task_report['agreement_with_fp32'] * 100:.2f}%, "
+                f"|Δconfianza| media {task_report['mean_abs_confidence_delta']:.2f}"
+            )
+            if 'accuracy_delta' in task_report:
+                line += (
+                    f", accuracy {task_report['fp32_accuracy'] * 100:.2f}% -> "
+                    f"{task_report['optimized_accuracy'] * 100:.2f}% "
+                    f"({task_report['accuracy_delta'] * 100:+.2f} pts)"
+                )
+            self.stdout.write(line)
+
+    def _split_calibration(self, paths, calibration_dir):
+        """
+        regresa (calibracion, paths de evaluacion). con calibration_dir se quitan de la
+        evaluacion las imagenes que tambien esten ahi; sin el se aparta una de cada n
+        imagenes de directory (determinista, repartida por todo el arbol)
+        """
+        if calibration_dir:
+            calibration_root = Path(calibration_dir)
+            if not calibration_root.is_dir():
+                raise CommandError(f'no existe el directorio: {calibration_root}')
+            calibration_paths = sorted(
+                p for p in calibration_root.rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS
+            )[:CALIBRATION_IMAGES]
+            if not calibration_paths:
+                raise CommandError(f'no se encontraron imagenes de calibracion en {calibration_root}')
+            held = {p.resolve() for p in calibration_root.rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS}
+            evaluation = [p for p in paths if p.resolve() not in held]
+            return {
+                'source': str(calibration_root),
+                'images': len(calibration_paths),
+                'excluded_from_evaluation': len(paths) - len(evaluation),
+                'paths': calibration_paths,
+            }, evaluation
+
+        count = min(CALIBRATION_IMAGES, int(len(paths) * CALIBRATION_HOLDOUT))
+        if count == 0:
+            raise CommandError('muy pocas imagenes para apartar calibracion; usa --calibration-dir')
+        step = len(paths) // count
+        calibration_paths = paths[::step][:count]
+        held = set(calibration_paths)
+        return {
+            'source': 'holdout',
+            'images': count,
+            'excluded_from_evaluation': count,
+            'paths': calibration_paths,
+        }, [p for p in paths if p not in held]
+
+    def _timed(self, predictor, tensors):
+        started = time.perf_counter()
+        results = predictor.predict_tensors(tensors)
+        return results, time.perf_counter() - started
+
+    def _load_labels(self, labels_path, root):
+        labels = {}
+        with open(labels_path, newline='') as f:
+            for row in csv.DictReader(f):
+                path = Path(row['path'])
+                if not path.is_absolute():
+                    path = root / path
+                labels[str(path)] = {task: row.get(task, '').strip() for task in TASKS}
+        return labels
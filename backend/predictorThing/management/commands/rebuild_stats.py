@@ -0,0 +1,39 @@
+# predictorThing/management/commands/rebuild_stats.py
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from predictorThing.stats import fold_daily_deltas, rebuild_daily_summaries, schedule_fold
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el resumen diario (face_analysis_daily_summary) a partir de face_analysis'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', default=None, help='fecha inicial YYYY-MM-DD')
+        parser.add_argument('--to', dest='end', default=None, help='fecha final YYYY-MM-DD')
+        parser.add_argument('--fold', action='store_true',
+                            help='en vez de recalcular, pliega los deltas pendientes en el resumen')
+        parser.add_argument('--schedule', action='store_true',
+                            help='encola el plegado periodico (DAILY_SUMMARY_FOLD_INTERVAL)')
+
+    def handle(self, *args, **options):
+        if options['schedule']:
+            job = schedule_fold()
+            if job is None:
+                self.stdout.write('no se encolo: DAILY_SUMMARY_FOLD_INTERVAL no esta configurado o ya hay uno pendiente')
+            else:
+                self.stdout.write(self.style.SUCCESS(f'plegado encolado para {job.run_after}'))
+            return
+
+        if options['fold']:
+            folded = fold_daily_deltas()
+            self.stdout.write(self.style.SUCCESS(f'{folded} deltas plegados'))
+            return
+
+        start = parse_date(options['start']) if options['start'] else None
+        end = parse_date(options['end']) if options['end'] else None
+        if (options['start'] and start is None) or (options['end'] and end is None):
+            raise CommandError('fecha invalida, usar YYYY-MM-DD')
+
+        days = rebuild_daily_summaries(start, end)
+        self.stdout.write(self.style.SUCCESS(f'{days} dias recalculados'))
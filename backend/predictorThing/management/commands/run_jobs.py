@@ -0,0 +1,38 @@
+# predictorThing/management/commands/run_jobs.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from predictorThing.jobs import run_pending
+from predictorThing.tasks import schedule_periodic
+
+
+class Command(BaseCommand):
+    help = 'Worker de la cola de trabajos en segundo plano (miniaturas, derivados, etc.)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='procesa lo pendiente y termina')
+        parser.add_argument('--batch', type=int, default=10, help='trabajos por lote')
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='segundos de espera cuando no hay trabajos')
+
+    def handle(self, *args, **options):
+        # los periodicos se re-encolan solos; al arrancar se encola el primero si no hay
+        for job in schedule_periodic():
+            self.stdout.write(f'{job.kind} encolado para {job.run_after}')
+
+        total = 0
+        while True:
+            close_old_connections()
+            processed = run_pending(limit=options['batch'])
+            total += processed
+
+            if processed:
+                self.stdout.write(f'{processed} trabajos procesados ({total} en total)')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'listo: {total} trabajos procesados'))
@@ -0,0 +1,35 @@
+# predictorThing/management/commands/serve_inference.py
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from predictorThing.predictor import create_predictor
+from predictorThing.registry import get_model_manager
+from predictorThing.serving import serve
+
+
+class Command(BaseCommand):
+    help = (
+        'Levanta el pool local de inferencia: N procesos fijados a sus cores que comparten '
+        'los pesos y reciben los tensores por memoria compartida'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'INFERENCE_POOL_WORKERS', 2))
+        parser.add_argument('--socket', default=getattr(settings, 'INFERENCE_POOL_SOCKET', None),
+                            help='ruta base de los sockets unix (default: INFERENCE_POOL_SOCKET)')
+
+    def handle(self, *args, **options):
+        if not options['socket']:
+            raise CommandError('indica --socket o configura INFERENCE_POOL_SOCKET')
+        if options['workers'] != getattr(settings, 'INFERENCE_POOL_WORKERS', options['workers']):
+            self.stderr.write('aviso: --workers no coincide con INFERENCE_POOL_WORKERS de los clientes')
+
+        # el modelo se carga una vez en el master y los workers reciben los pesos en memoria
+        # compartida; cada worker hace su warm-up. es la version activa del registro: un
+        # cambio de version aqui requiere reiniciar el pool
+        predictor = create_predictor(**get_model_manager().initial_options())
+
+        self.stdout.write(self.style.SUCCESS(
+            f"pool de inferencia con {options['workers']} workers en {options['socket']}.*"
+        ))
+        serve(predictor, options['socket'], options['workers'])
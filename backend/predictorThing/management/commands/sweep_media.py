@@ -0,0 +1,50 @@
+# predictorThing/management/commands/sweep_media.py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from predictorThing.cleanup import DEFAULT_SWEEP_BATCH_SIZE, DEFAULT_SWEEP_GRACE, schedule_sweep, sweep
+
+
+class Command(BaseCommand):
+    help = (
+        'Concilia media/face_images con la tabla face_analysis: borra archivos que ninguna '
+        'fila usa y analisis cuya imagen ya no existe'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=getattr(settings, 'MEDIA_SWEEP_BATCH_SIZE', DEFAULT_SWEEP_BATCH_SIZE),
+                            help='filas revisadas por consulta')
+        parser.add_argument('--grace', type=int,
+                            default=getattr(settings, 'MEDIA_SWEEP_GRACE', DEFAULT_SWEEP_GRACE),
+                            help='segundos que un archivo sin fila se respeta (uploads en curso)')
+        parser.add_argument('--dry-run', action='store_true', help='solo reporta, no borra nada')
+        parser.add_argument('--files-only', action='store_true', help='solo archivos huerfanos')
+        parser.add_argument('--rows-only', action='store_true', help='solo analisis sin imagen')
+        parser.add_argument('--schedule', action='store_true',
+                            help='en vez de barrer ahora, encola el barrido periodico (MEDIA_SWEEP_INTERVAL)')
+
+    def handle(self, *args, **options):
+        if options['schedule']:
+            job = schedule_sweep()
+            if job is None:
+                self.stdout.write('no se encolo: MEDIA_SWEEP_INTERVAL no esta configurado o ya hay uno pendiente')
+            else:
+                self.stdout.write(self.style.SUCCESS(f'barrido encolado para {job.run_after}'))
+            return
+
+        verbose = options['verbosity'] > 1 or options['dry_run']
+        result = sweep(
+            batch_size=max(1, options['batch_size']),
+            grace=max(0, options['grace']),
+            files=not options['rows_only'],
+            rows=not options['files_only'],
+            dry_run=options['dry_run'],
+            report=self.stdout.write if verbose else None,
+        )
+
+        prefix = '(dry run) ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{result['orphaned_files']} archivos huerfanos, "
+            f"{result['dangling_rows']} analisis sin imagen en {result['seconds']}s"
+        ))
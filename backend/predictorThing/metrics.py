@@ -0,0 +1,293 @@
+# predictorThing/metrics.py
+import atexit
+import bisect
+import contextvars
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# buckets en segundos para latencias y en imagenes para tamaños de batch
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+# desglose por etapa del request actual (solo si pidio X-Timing)
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+REGISTRY = []
+
+# en modo multiproceso cada proceso escribe sus metricas a METRICS_MULTIPROC_DIR cada
+# tantos segundos y /metrics suma los archivos de todos
+DEFAULT_FLUSH_INTERVAL = 5.0
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values))
+    return '{' + pairs + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def snapshot(self):
+        """{labels: valor} de este proceso"""
+        with self._lock:
+            return dict(self._values)
+
+    def render(self, data=None):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples(self.snapshot() if data is None else data))
+        return lines
+
+    def _samples(self, data):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {value}' for key, value in data.items()]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    @staticmethod
+    def merge(total, value):
+        return total + value
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    @staticmethod
+    def merge(total, value):
+        # entre procesos se reporta el mayor
+        return max(total, value)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                # conteos por bucket (no acumulados) + el de +Inf, suma, total
+                data = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            data[0][index] += 1
+            data[1] += value
+            data[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {key: [list(counts), total, count] for key, (counts, total, count) in self._values.items()}
+
+    @staticmethod
+    def merge(total, value):
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1], total[2] + value[2]]
+
+    def _samples(self, data):
+        lines = []
+        for key, (counts, total, count) in data.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames + ('le',), key + (bound,))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+# --- metricas de la app ---------------------------------------------------------
+
+STAGE_SECONDS = Histogram(
+    'reciface_stage_seconds',
+    'Tiempo por etapa (upload_read, decode, preprocess, forward, postprocess, db_write, image_save)',
+    ['stage'],
+)
+REQUEST_SECONDS = Histogram('reciface_request_seconds', 'Latencia total por endpoint', ['endpoint'])
+REQUESTS_TOTAL = Counter('reciface_requests_total', 'Requests por endpoint y resultado', ['endpoint', 'method', 'outcome'])
+BATCH_SIZE = Histogram('reciface_batch_size', 'Imagenes por forward pass', buckets=BATCH_SIZE_BUCKETS)
+MODEL_LOAD_SECONDS = Gauge('reciface_model_load_seconds', 'Tiempo de carga del modelo', ['backend'])
+MODEL_SWAPS = Counter('reciface_model_swaps_total', 'Versiones del modelo activadas en caliente', ['version'])
+SHADOW_PREDICTIONS = Counter(
+    'reciface_shadow_predictions_total',
+    'Predicciones de la version sombra por cabeza, iguales o no a la activa',
+    ['version', 'task', 'outcome'],
+)
+
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage):
+    """mide un bloque como etapa; cuesta dos perf_counter y un lock"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def start_request_timing():
+    """activa el desglose por etapa para el request actual; regresa el token para reset"""
+    return _request_timings.set({})
+
+
+def finish_request_timing(token):
+    timings = _request_timings.get()
+    _request_timings.reset(token)
+    return timings or {}
+
+
+def format_timing_header(timings, total):
+    parts = [f'{stage};dur={seconds * 1000:.2f}' for stage, seconds in timings.items()]
+    parts.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(parts)
+
+
+# --- modo multiproceso ------------------------------------------------------------
+
+def multiproc_dir():
+    """directorio compartido por los workers (METRICS_MULTIPROC_DIR) o None si cada proceso reporta lo suyo"""
+    from django.conf import settings
+    return getattr(settings, 'METRICS_MULTIPROC_DIR', None)
+
+
+def write_snapshot(directory):
+    """escribe las metricas de este proceso en directory/metrics_<pid>.json (reemplazo atomico)"""
+    data = {
+        metric.name: [[list(key), value] for key, value in metric.snapshot().items()]
+        for metric in REGISTRY
+    }
+    path = os.path.join(directory, f'metrics_{os.getpid()}.json')
+    # el hilo de flush y un scrape del mismo proceso pueden escribir a la vez
+    temporary = f'{path}.{threading.get_ident()}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def _read_snapshots(directory):
+    """{nombre: {labels: valor}} sumando los archivos de todos los procesos (vivos o no)"""
+    merged = {metric.name: {} for metric in REGISTRY}
+    kinds = {metric.name: metric for metric in REGISTRY}
+    for path in sorted(glob.glob(os.path.join(directory, 'metrics_*.json'))):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, samples in data.items():
+            metric = kinds.get(name)
+            if metric is None:
+                continue
+            values = merged[name]
+            for key, value in samples:
+                key = tuple(key)
+                values[key] = metric.merge(values[key], value) if key in values else value
+    return merged
+
+
+class _Flusher:
+    """hilo que escribe el snapshot de este proceso cada interval segundos (uno por proceso)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def ensure_started(self, directory, interval=DEFAULT_FLUSH_INTERVAL):
+        # el hilo no sobrevive al fork de gunicorn: se arranca en cada worker
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            os.makedirs(directory, exist_ok=True)
+            threading.Thread(
+                target=self._loop, args=(directory, interval), name='metrics-flush', daemon=True
+            ).start()
+            # lo ultimo que conto un worker que se recicla tampoco se pierde
+            atexit.register(write_snapshot, directory)
+
+    def _loop(self, directory, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                write_snapshot(directory)
+            except OSError as e:
+                print(f"ERROR al escribir las metricas en {directory}: {e}")
+
+
+flusher = _Flusher()
+
+
+def ensure_flushing():
+    """en modo multiproceso arranca el hilo que publica las metricas de este proceso"""
+    directory = multiproc_dir()
+    if directory:
+        from django.conf import settings
+        flusher.ensure_started(directory, getattr(settings, 'METRICS_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL))
+
+
+def render():
+    """
+    todas las metricas en el formato de texto de Prometheus; con METRICS_MULTIPROC_DIR
+    la suma de todos los procesos (los de este, al dia; los demas, a su ultimo flush)
+    """
+    directory = multiproc_dir()
+    merged = None
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        write_snapshot(directory)
+        merged = _read_snapshots(directory)
+
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render(None if merged is None else merged[metric.name]))
+    return '\n'.join(lines) + '\n'
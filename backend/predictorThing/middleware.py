@@ -0,0 +1,79 @@
+# predictorThing/middleware.py
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .metrics import (
+    REQUEST_SECONDS, REQUESTS_TOTAL, ensure_flushing, finish_request_timing, format_timing_header,
+    start_request_timing
+)
+
+# el metodo va como label tal cual solo si es uno de estos; cualquier otro cuenta como
+# 'other' para que un cliente no pueda crear series nuevas sin limite
+METHOD_LABELS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
+
+class MetricsMiddleware:
+    """
+    cuenta requests por endpoint y resultado, mide la latencia total y, si el
+    cliente manda el header X-Timing, regresa el desglose por etapa en X-Timing
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        started, token = self._start(request)
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            self._finish(request, response, started, token)
+        return response
+
+    async def __acall__(self, request):
+        started, token = self._start(request)
+        response = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            self._finish(request, response, started, token)
+        return response
+
+    def _start(self, request):
+        ensure_flushing()
+        token = start_request_timing() if 'X-Timing' in request.headers else None
+        return time.perf_counter(), token
+
+    def _finish(self, request, response, started, token):
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        endpoint = match.url_name if match and match.url_name else 'unmatched'
+
+        if response is None:
+            outcome = 'exception'
+        elif response.status_code >= 500:
+            outcome = 'server_error'
+        elif response.status_code >= 400:
+            outcome = 'client_error'
+        else:
+            outcome = 'ok'
+
+        method = request.method if request.method in METHOD_LABELS else 'other'
+        REQUESTS_TOTAL.inc(endpoint=endpoint, method=method, outcome=outcome)
+        # las respuestas en streaming solo miden hasta el primer byte
+        REQUEST_SECONDS.observe(elapsed, endpoint=endpoint)
+
+        if token is not None:
+            timings = finish_request_timing(token)
+            if response is not None:
+                response['X-Timing'] = format_timing_header(timings, elapsed)
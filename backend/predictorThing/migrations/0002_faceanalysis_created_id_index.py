@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictorThing', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='faceanalysis',
+            index=models.Index(fields=['-created_at', '-id'], name='face_analysis_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:30
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Least
+
+
+def fill_confidence_columns(apps, schema_editor):
+    FaceAnalysis = apps.get_model('predictorThing', 'FaceAnalysis')
+    FaceAnalysis.objects.update(
+        average_confidence=(
+            F('sex_confidence') + F('eyes_confidence') + F('race_confidence') + F('hair_confidence')
+        ) / 4,
+        min_confidence=Least('sex_confidence', 'eyes_confidence', 'race_confidence', 'hair_confidence'),
+    )
+
+
+def build_daily_summaries(apps, schema_editor):
+    """
+    backfill del resumen con los modelos historicos (no importa stats.py: el codigo
+    actual puede no coincidir con el esquema en este punto de las migraciones)
+    """
+    from django.utils import timezone
+
+    FaceAnalysis = apps.get_model('predictorThing', 'FaceAnalysis')
+    DailyAnalysisSummary = apps.get_model('predictorThing', 'DailyAnalysisSummary')
+    attributes = ['sex', 'eyes', 'race', 'hair']
+    buckets = 100
+
+    summaries = {}
+    fields = ['created_at', 'average_confidence', 'min_confidence'] + attributes + [
+        f'{attr}_confidence' for attr in attributes
+    ]
+    for row in FaceAnalysis.objects.values(*fields).iterator(chunk_size=2000):
+        date = timezone.localdate(row['created_at'])
+        summary = summaries.get(date)
+        if summary is None:
+            summary = summaries[date] = DailyAnalysisSummary(
+                date=date, class_counts={}, confidence_histograms={}
+            )
+
+        summary.total += 1
+        summary.low_confidence += row['min_confidence'] < 70
+        summary.average_confidence_sum += row['average_confidence']
+
+        values = {attr: row[f'{attr}_confidence'] for attr in attributes}
+        values['average'] = row['average_confidence']
+        values['min'] = row['min_confidence']
+        for key, confidence in values.items():
+            histogram = summary.confidence_histograms.setdefault(key, [0] * buckets)
+            histogram[min(buckets - 1, max(0, int(confidence)))] += 1
+
+        for attr in attributes:
+            counts = summary.class_counts.setdefault(attr, {})
+            counts[row[attr]] = counts.get(row[attr], 0) + 1
+
+    DailyAnalysisSummary.objects.bulk_create(summaries.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictorThing', '0002_faceanalysis_created_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceanalysis',
+            name='average_confidence',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='faceanalysis',
+            name='min_confidence',
+            field=models.FloatField(default=0),
+        ),
+        migrations.CreateModel(
+            name='DailyAnalysisSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('low_confidence', models.PositiveIntegerField(default=0)),
+                ('average_confidence_sum', models.FloatField(default=0)),
+                ('class_counts', models.JSONField(default=dict)),
+                ('confidence_histograms', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Resumen diario',
+                'verbose_name_plural': 'Resumenes diarios',
+                'db_table': 'face_analysis_daily_summary',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.RunPython(fill_confidence_columns, migrations.RunPython.noop),
+        migrations.RunPython(build_daily_summaries, migrations.RunPython.noop),
+    ]
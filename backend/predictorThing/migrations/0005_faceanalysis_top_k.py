@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictorThing', '0004_derivatives_background_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceanalysis',
+            name='top_k',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictorThing', '0005_faceanalysis_top_k'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StagedPrediction',
+            fields=[
+                ('token', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('results', models.JSONField()),
+                ('embedding', models.BinaryField(blank=True, null=True)),
+                ('image', models.ImageField(blank=True, upload_to='face_images/%Y/%m/%d/')),
+                ('image_name', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Prediccion pendiente',
+                'verbose_name_plural': 'Predicciones pendientes',
+                'db_table': 'staged_prediction',
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictorThing', '0006_stagedprediction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetectedFace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('box_x', models.IntegerField()),
+                ('box_y', models.IntegerField()),
+                ('box_width', models.PositiveIntegerField()),
+                ('box_height', models.PositiveIntegerField()),
+                ('detection_score', models.FloatField(blank=True, null=True)),
+                ('landmarks', models.JSONField(blank=True, null=True)),
+                ('sex', models.CharField(max_length=20)),
+                ('sex_confidence', models.FloatField()),
+                ('eyes', models.CharField(max_length=50)),
+                ('eyes_confidence', models.FloatField()),
+                ('race', models.CharField(max_length=50)),
+                ('race_confidence', models.FloatField()),
+                ('hair', models.CharField(max_length=50)),
+                ('hair_confidence', models.FloatField()),
+                ('top_k', models.JSONField(blank=True, default=dict)),
+                ('analysis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='faces', to='predictorThing.faceanalysis')),
+            ],
+            options={
+                'verbose_name': 'Cara detectada',
+                'verbose_name_plural': 'Caras detectadas',
+                'db_table': 'face_analysis_face',
+                'ordering': ['analysis', 'index'],
+                'constraints': [models.UniqueConstraint(fields=('analysis', 'index'), name='face_analysis_face_unique_index')],
+            },
+        ),
+    ]
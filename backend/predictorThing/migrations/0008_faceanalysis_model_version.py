@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictorThing', '0007_detectedface'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceanalysis',
+            name='model_version',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictorThing', '0008_faceanalysis_model_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='faceanalysis',
+            name='image',
+            field=models.ImageField(db_index=True, upload_to='face_images/%Y/%m/%d/'),
+        ),
+    ]
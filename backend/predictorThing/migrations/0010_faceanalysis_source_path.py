@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictorThing', '0009_faceanalysis_image_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceanalysis',
+            name='source_path',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=1024),
+        ),
+    ]
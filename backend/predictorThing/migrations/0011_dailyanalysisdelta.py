@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictorThing', '0010_faceanalysis_source_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAnalysisDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True)),
+                ('total', models.IntegerField(default=0)),
+                ('low_confidence', models.IntegerField(default=0)),
+                ('average_confidence_sum', models.FloatField(default=0)),
+                ('class_counts', models.JSONField(default=dict)),
+                ('confidence_histograms', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Cambio diario pendiente',
+                'verbose_name_plural': 'Cambios diarios pendientes',
+                'db_table': 'face_analysis_daily_delta',
+                'ordering': ['id'],
+            },
+        ),
+    ]
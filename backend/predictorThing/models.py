@@ -1,9 +1,52 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
+# debajo de este % de certeza la prediccion se marca como dudosa
+LOW_CONFIDENCE_THRESHOLD = 70
+
+ATTRIBUTES = ['sex', 'eyes', 'race', 'hair']
+
+# cubetas de 1 punto (0-99) para los histogramas de certeza del resumen diario
+CONFIDENCE_BUCKETS = 100
+
+# columnas que necesita DailyAnalysisSummary para restar una fila
+SUMMARY_FIELDS = ATTRIBUTES + [f'{attr}_confidence' for attr in ATTRIBUTES]
+
+
+class FaceAnalysisQuerySet(models.QuerySet):
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        """llena las columnas de certeza y actualiza el resumen diario tambien en bulk"""
+        objs = list(objs)
+        for obj in objs:
+            obj.update_confidence_summary()
+        
+        with transaction.atomic():
+            created = super().bulk_create(objs, *args, **kwargs)
+            DailyAnalysisSummary.record(created)
+        return created
+    
+    def delete(self):
+        """
+        borra en bulk restando las filas del resumen diario, como FaceAnalysis.delete
+        (el delete del queryset no pasa por el del modelo). los archivos no se tocan
+        """
+        with transaction.atomic():
+            rows = list(
+                self.select_for_update()
+                .only('id', 'created_at', 'average_confidence', 'min_confidence', *SUMMARY_FIELDS)
+            )
+            if not rows:
+                return 0, {}
+            DailyAnalysisSummary.record(rows, sign=-1)
+            # solo las filas bloqueadas, aunque otra transaccion haya agregado filas que coincidan
+            return super(FaceAnalysisQuerySet, self.model.objects.filter(pk__in=[row.pk for row in rows])).delete()
+
+
 class FaceAnalysis(models.Model):
     # image
-    image = models.ImageField(upload_to='face_images/%Y/%m/%d/')
+    # indexada: el barrido de media (cleanup.py) busca las filas de cada directorio por prefijo
+    image = models.ImageField(upload_to='face_images/%Y/%m/%d/', db_index=True)
     
     # prediction results
     sex = models.CharField(max_length=20)
@@ -18,35 +61,283 @@ class FaceAnalysis(models.Model):
     hair = models.CharField(max_length=50)
     hair_confidence = models.FloatField()
     
+    # certeza desnormalizada (se llena en save y bulk_create)
+    average_confidence = models.FloatField(default=0)
+    min_confidence = models.FloatField(default=0)
+    
     # metadata and sh
     created_at = models.DateTimeField(default=timezone.now)
     image_name = models.CharField(max_length=255, blank=True)
+    # ruta absoluta del archivo original en una ingesta con analyze_folder (llave de resume)
+    source_path = models.CharField(max_length=1024, blank=True, default='', db_index=True)
+    
+    # clases mas probables por cabeza para revision, {'sex': [['Male', 87.2], ['Female', 12.8]], ...}
+    top_k = models.JSONField(default=dict, blank=True)
+    
+    # version del modelo que hizo la prediccion (ver registry.py)
+    model_version = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    
+    # versiones generadas en segundo plano junto al original, {'display': nombre, 'thumbnail': nombre}
+    derivatives = models.JSONField(default=dict, blank=True)
+    
+    objects = FaceAnalysisQuerySet.as_manager()
     
     class Meta:
         db_table = 'face_analysis'
         ordering = ['-created_at']
         verbose_name = 'Analisis facial'
         verbose_name_plural = 'Analisis faciales'
+        indexes = [
+            # paginacion por cursor del listado (orden -created_at, -id)
+            models.Index(fields=['-created_at', '-id'], name='face_analysis_created_id_idx'),
+        ]
     
     def __str__(self):
         return f"Analisis {self.id} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
     
+    def update_confidence_summary(self):
+        """saca el promedio y el minimo de certeza de todas las predicciones"""
+        confidences = [getattr(self, f'{attr}_confidence') for attr in ATTRIBUTES]
+        self.average_confidence = sum(confidences) / len(confidences)
+        self.min_confidence = min(confidences)
+    
+    def save(self, *args, **kwargs):
+        self.update_confidence_summary()
+        adding = self._state.adding
+        
+        with transaction.atomic():
+            # en una edicion se quita la version anterior del resumen
+            if not adding:
+                previous = type(self).objects.filter(pk=self.pk).first()
+                if previous is not None:
+                    DailyAnalysisSummary.record([previous], sign=-1)
+            
+            super().save(*args, **kwargs)
+            DailyAnalysisSummary.record([self])
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            DailyAnalysisSummary.record([self], sign=-1)
+            return super().delete(*args, **kwargs)
+    
     @property
     def has_low_confidence(self):
         """regresa "True" si la prediccion tiene  < 70% de certeza"""
-        return any([
-            self.sex_confidence < 70,
-            self.eyes_confidence < 70,
-            self.race_confidence < 70,
-            self.hair_confidence < 70
-        ])
+        return self.min_confidence < LOW_CONFIDENCE_THRESHOLD
+
+
+def confidence_bucket(confidence):
+    return min(CONFIDENCE_BUCKETS - 1, max(0, int(confidence)))
+
+
+class SummaryCounters:
+    """suma de analisis de un dia; la comparten el resumen y sus deltas"""
     
-    @property
-    def average_confidence(self):
-        """saca el promedio de certeza de todas las predicciones"""
-        return (
-            self.sex_confidence + 
-            self.eyes_confidence + 
-            self.race_confidence + 
-            self.hair_confidence
-        ) / 4
\ No newline at end of file
+    def _add(self, analysis, sign):
+        self.total += sign
+        self.low_confidence += sign * (analysis.min_confidence < LOW_CONFIDENCE_THRESHOLD)
+        self.average_confidence_sum += sign * analysis.average_confidence
+        
+        values = {attr: getattr(analysis, f'{attr}_confidence') for attr in ATTRIBUTES}
+        values['average'] = analysis.average_confidence
+        values['min'] = analysis.min_confidence
+        
+        for key, confidence in values.items():
+            histogram = self.confidence_histograms.setdefault(key, [0] * CONFIDENCE_BUCKETS)
+            histogram[confidence_bucket(confidence)] += sign
+        
+        for attr in ATTRIBUTES:
+            counts = self.class_counts.setdefault(attr, {})
+            label = getattr(analysis, attr)
+            counts[label] = counts.get(label, 0) + sign
+            if counts[label] == 0:
+                del counts[label]
+    
+    def _merge(self, other):
+        """suma otro resumen o delta (con conteos negativos si fueron borrados)"""
+        self.total += other.total
+        self.low_confidence += other.low_confidence
+        self.average_confidence_sum += other.average_confidence_sum
+        
+        for key, other_histogram in other.confidence_histograms.items():
+            histogram = self.confidence_histograms.setdefault(key, [0] * CONFIDENCE_BUCKETS)
+            for bucket, count in enumerate(other_histogram):
+                histogram[bucket] += count
+        
+        for attr, other_counts in other.class_counts.items():
+            counts = self.class_counts.setdefault(attr, {})
+            for label, count in other_counts.items():
+                counts[label] = counts.get(label, 0) + count
+                if counts[label] == 0:
+                    del counts[label]
+
+
+class DailyAnalysisSummary(SummaryCounters, models.Model):
+    """
+    resumen por dia de face_analysis (conteos por clase, histogramas de certeza);
+    los cambios llegan como DailyAnalysisDelta y se pliegan aqui (stats.fold_daily_deltas)
+    para que las estadisticas no escaneen la tabla
+    """
+    date = models.DateField(unique=True)
+    total = models.PositiveIntegerField(default=0)
+    low_confidence = models.PositiveIntegerField(default=0)
+    average_confidence_sum = models.FloatField(default=0)
+    
+    # {'sex': {'Male': 3, ...}, ...}
+    class_counts = models.JSONField(default=dict)
+    # {'sex': [100 cubetas], ..., 'average': [...], 'min': [...]}
+    confidence_histograms = models.JSONField(default=dict)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'face_analysis_daily_summary'
+        ordering = ['-date']
+        verbose_name = 'Resumen diario'
+        verbose_name_plural = 'Resumenes diarios'
+    
+    def __str__(self):
+        return f"Resumen {self.date} ({self.total})"
+    
+    @classmethod
+    def record(cls, analyses, sign=1):
+        """
+        suma (o resta con sign=-1) los analisis al dia que les toca. solo inserta un
+        delta por dia: no bloquea la fila del resumen, que con trafico seria la misma
+        para todos los requests
+        """
+        deltas = {}
+        for analysis in analyses:
+            date = timezone.localdate(analysis.created_at)
+            delta = deltas.get(date)
+            if delta is None:
+                delta = deltas[date] = DailyAnalysisDelta(date=date)
+            delta._add(analysis, sign)
+        
+        DailyAnalysisDelta.objects.bulk_create(deltas.values())
+
+
+class DailyAnalysisDelta(SummaryCounters, models.Model):
+    """
+    cambio pendiente de un dia (solo se insertan); stats.aggregate los suma al resumen
+    al leer y stats.fold_daily_deltas los pliega en DailyAnalysisSummary
+    """
+    date = models.DateField(db_index=True)
+    # con signo: un borrado resta
+    total = models.IntegerField(default=0)
+    low_confidence = models.IntegerField(default=0)
+    average_confidence_sum = models.FloatField(default=0)
+    class_counts = models.JSONField(default=dict)
+    confidence_histograms = models.JSONField(default=dict)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'face_analysis_daily_delta'
+        ordering = ['id']
+        verbose_name = 'Cambio diario pendiente'
+        verbose_name_plural = 'Cambios diarios pendientes'
+    
+    def __str__(self):
+        return f"Delta {self.date} ({self.total:+d})"
+
+
+class BackgroundJob(models.Model):
+    """cola de trabajos en la BD (ver jobs.py y manage.py run_jobs)"""
+    
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pendiente'),
+        (RUNNING, 'En proceso'),
+        (DONE, 'Terminado'),
+        (FAILED, 'Fallido'),
+    ]
+    
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'background_job'
+        ordering = ['id']
+        verbose_name = 'Trabajo en segundo plano'
+        verbose_name_plural = 'Trabajos en segundo plano'
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='background_job_status_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
+
+
+class StagedPrediction(models.Model):
+    """
+    resultado de /api/predict/ guardado unos minutos bajo un token, para que
+    /api/save/ lo confirme sin volver a subir la imagen ni correr el modelo
+    """
+    token = models.CharField(max_length=64, primary_key=True)
+    # salida del predictor sin el embedding: {'sex': {'prediction', 'confidence', 'probabilities'}, ...}
+    # y, con deteccion de caras, 'faces': [{'box', 'score', 'landmarks', 'results'}, ...]
+    results = models.JSONField()
+    # embedding float16 en bytes (ver embeddings.py)
+    embedding = models.BinaryField(null=True, blank=True)
+    # la imagen ya queda en su ruta final; al confirmar solo se referencia
+    image = models.ImageField(upload_to='face_images/%Y/%m/%d/', blank=True)
+    image_name = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        db_table = 'staged_prediction'
+        verbose_name = 'Prediccion pendiente'
+        verbose_name_plural = 'Predicciones pendientes'
+    
+    def __str__(self):
+        return f"{self.token[:8]}... (expira {self.expires_at.strftime('%H:%M')})"
+
+
+class DetectedFace(models.Model):
+    """una cara encontrada por el detector dentro de la imagen de un FaceAnalysis"""
+    analysis = models.ForeignKey(FaceAnalysis, on_delete=models.CASCADE, related_name='faces')
+    # 0 = la cara principal (la mas grande), la misma que quedo en FaceAnalysis
+    index = models.PositiveSmallIntegerField()
+    
+    # caja en pixeles de la imagen original (ya con la orientacion EXIF aplicada)
+    box_x = models.IntegerField()
+    box_y = models.IntegerField()
+    box_width = models.PositiveIntegerField()
+    box_height = models.PositiveIntegerField()
+    detection_score = models.FloatField(null=True, blank=True)
+    # ojos, nariz y comisuras [[x, y] * 5], solo con el detector YuNet
+    landmarks = models.JSONField(null=True, blank=True)
+    
+    sex = models.CharField(max_length=20)
+    sex_confidence = models.FloatField()
+    eyes = models.CharField(max_length=50)
+    eyes_confidence = models.FloatField()
+    race = models.CharField(max_length=50)
+    race_confidence = models.FloatField()
+    hair = models.CharField(max_length=50)
+    hair_confidence = models.FloatField()
+    
+    top_k = models.JSONField(default=dict, blank=True)
+    
+    class Meta:
+        db_table = 'face_analysis_face'
+        ordering = ['analysis', 'index']
+        verbose_name = 'Cara detectada'
+        verbose_name_plural = 'Caras detectadas'
+        constraints = [
+            models.UniqueConstraint(fields=['analysis', 'index'], name='face_analysis_face_unique_index'),
+        ]
+    
+    def __str__(self):
+        return f"Cara {self.index} de analisis {self.analysis_id}"
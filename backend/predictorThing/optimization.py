@@ -0,0 +1,59 @@
+# predictorThing/optimization.py
+import torch
+import torch.nn as nn
+
+# modos de cuantizacion para inferencia en cpu
+QUANTIZATION_MODES = (None, 'dynamic', 'static')
+
+
+def set_num_threads(num_threads):
+    """fija los hilos intra-op de torch (None = default de torch)"""
+    if num_threads:
+        torch.set_num_threads(int(num_threads))
+
+
+def quantize_dynamic(model):
+    """INT8 dinamico para las capas Linear (las 4 cabezas de clasificacion)"""
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_static(model, calibration_batches):
+    """
+    INT8 estatico (FX graph mode) de todo el modelo, backbone incluido;
+    calibration_batches son tensores [N, 3, 224, 224] ya normalizados
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    example = calibration_batches[0][:1]
+    prepared = prepare_fx(model, get_default_qconfig_mapping('x86'), example_inputs=(example,))
+
+    with torch.inference_mode():
+        for batch in calibration_batches:
+            prepared(batch)
+
+    return convert_fx(prepared)
+
+
+def optimize_for_cpu(model, quantization=None, channels_last=False, calibration_batches=None):
+    """aplica el modo de optimizacion configurado a un MultiTaskFaceModel en eval"""
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"cuantizacion desconocida: {quantization} (opciones: dynamic, static)")
+
+    model = model.eval()
+    if quantization:
+        model = model.cpu()
+
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+
+    if quantization == 'dynamic':
+        model = quantize_dynamic(model)
+    elif quantization == 'static':
+        if not calibration_batches:
+            raise ValueError("la cuantizacion estatica necesita imagenes de calibracion")
+        if channels_last:
+            calibration_batches = [b.contiguous(memory_format=torch.channels_last) for b in calibration_batches]
+        model = quantize_static(model, calibration_batches)
+
+    return model
@@ -1,19 +1,53 @@
 # predictor/predictor.py
 import torch
 import torch.nn as nn
-from torchvision import transforms
-from PIL import Image
-import timm
-import pickle
+import numpy as np
 import json
 import os
+import threading
+import time
 from pathlib import Path
 
+from .metrics import BATCH_SIZE, MODEL_LOAD_SECONDS, timed
+from .optimization import optimize_for_cpu, set_num_threads
+from .preprocessing import Preprocessor
+
+TASKS = ['sex', 'eyes', 'race', 'hair']
+
+# el vector del backbone (antes del clasificador) tambien sale del forward
+EMBEDDING_KEY = 'embedding'
+EMBEDDING_DIM = 1280
+OUTPUTS = TASKS + [EMBEDDING_KEY]
+
+# cada resultado dice que version del modelo lo produjo (ver registry.py)
+MODEL_VERSION_KEY = 'model_version'
+
+MODELS_DIR = Path(__file__).parent / 'ml_models'
+CHECKPOINT_PATH = MODELS_DIR / 'face_model_for_django.pth'
+# nombres de clase (en el orden de los indices del modelo), tamaño de entrada y normalizacion
+MODEL_INFO_PATH = MODELS_DIR / 'model_info.json'
+
+# motores de inferencia: eager de PyTorch o el grafo exportado (manage.py export_model)
+BACKENDS = ('torch', 'torchscript', 'onnx')
+EXPORTED_PATHS = {
+    'torchscript': MODELS_DIR / 'face_model_for_django.torchscript.pt',
+    'onnx': MODELS_DIR / 'face_model_for_django.onnx',
+}
+
+# cuantas imagenes se apilan como maximo en un forward pass
+DEFAULT_MAX_BATCH_SIZE = 32
+
+# imagenes que se usan como maximo para calibrar la cuantizacion estatica
+CALIBRATION_IMAGES = 64
+
 class MultiTaskFaceModel(nn.Module):
     
     def __init__(self, num_classes_dict):
         super(MultiTaskFaceModel, self).__init__()
         
+        # timm solo hace falta para construir el modelo eager
+        import timm
+        
         self.backbone = timm.create_model('efficientnet_b0', pretrained=False)
         num_features = self.backbone.classifier.in_features
         self.backbone.classifier = nn.Identity()
@@ -45,101 +79,350 @@ class MultiTaskFaceModel(nn.Module):
             'sex': self.sex_classifier(features),
             'eyes': self.eyes_classifier(features),
             'race': self.race_classifier(features),
-            'hair': self.hair_classifier(features)
+            'hair': self.hair_classifier(features),
+            EMBEDDING_KEY: features
         }
 
 
 class FaceAttributePredictor:
     """clase de predicciones en Django"""
     
-    def __init__(self):
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    def __init__(self, max_batch_size=DEFAULT_MAX_BATCH_SIZE, backend='torch',
+                 quantization=None, channels_last=False, num_threads=None,
+                 calibration_dir=None, model_dir=None, model_version=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"backend desconocido: {backend} (opciones: {', '.join(BACKENDS)})")
+        
+        self.backend = backend
+        self.quantization = quantization
+        self.channels_last = channels_last
+        self.calibration_dir = calibration_dir
+        # directorio de una version del registro; sin el, los archivos de siempre en ml_models/
+        self.model_dir = Path(model_dir) if model_dir else MODELS_DIR
+        self.model_info_path = self.model_dir / MODEL_INFO_PATH.name
+        # onnxruntime y los modelos cuantizados corren solo en cpu
+        use_cuda = torch.cuda.is_available() and backend != 'onnx' and not quantization
+        self.device = torch.device('cuda' if use_cuda else 'cpu')
+        self.max_batch_size = max(1, int(max_batch_size))
+        set_num_threads(num_threads)
         self.model = None
-        self.encoders = None
-        self.transform = None
+        self.session = None
+        self.model_version = model_version
+        self.class_names = None
+        self.preprocessor = None
+        started = time.perf_counter()
         self._load_model()
+        MODEL_LOAD_SECONDS.set(round(time.perf_counter() - started, 3), backend=self.backend)
     
     def _load_model(self):
-        """carga el modelo y los encoders"""
-        base_path = Path(__file__).parent / 'ml_models' 
-        model_path = base_path / 'face_model_for_django.pth'
-        encoders_path = base_path / 'label_encoders.pkl'
+        """carga el modelo y las tablas de clases"""
+        model_path = self.model_dir / (
+            CHECKPOINT_PATH.name if self.backend == 'torch' else EXPORTED_PATHS[self.backend].name
+        )
         
         # Verificacion de archivos
         if not model_path.exists():
+            if self.backend != 'torch':
+                raise FileNotFoundError(
+                    f"no se encontro el modelo en: {model_path} (correr manage.py export_model --format {self.backend})"
+                )
             raise FileNotFoundError(f"no se encontro el modelo en: {model_path}")
-        if not encoders_path.exists():
-            raise FileNotFoundError(f"no se encontraron los encoders en: {encoders_path}")
+        if not self.model_info_path.exists():
+            raise FileNotFoundError(f"no se encontro model_info.json en: {self.model_info_path}")
         
         print(f"modelo cargado de: {model_path}")
         
+        # version del registro o, sin registro, la del checkpoint (cambia si se reemplaza el archivo)
+        if not self.model_version:
+            stat = model_path.stat()
+            self.model_version = f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+        if self.quantization:
+            # un modelo cuantizado no da exactamente los mismos resultados
+            self.model_version += f"-{self.quantization}"
+        
         # Carga el modelo
-        checkpoint = torch.load(model_path, map_location=self.device)
-        self.model = MultiTaskFaceModel(checkpoint['num_classes'])
-        self.model.load_state_dict(checkpoint['model_state_dict'])
-        self.model.to(self.device)
-        self.model.eval()
-        
-        # encoders
-        with open(encoders_path, 'rb') as f:
-            self.encoders = pickle.load(f)
-        
-        # define las transformaciones
-        self.transform = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(
-                mean=[0.485, 0.456, 0.406],
-                std=[0.229, 0.224, 0.225]
+        if self.backend == 'torch':
+            checkpoint = torch.load(model_path, map_location=self.device)
+            self.model = MultiTaskFaceModel(checkpoint['num_classes'])
+            self.model.load_state_dict(checkpoint['model_state_dict'])
+            self.model.to(self.device)
+            self.model.eval()
+            num_classes = checkpoint['num_classes']
+        else:
+            self._load_exported(model_path)
+        
+        self._load_labels()
+        if self.backend == 'torch':
+            for task in TASKS:
+                if num_classes[task] != len(self.class_names[task]):
+                    raise ValueError(
+                        f"model_info.json tiene {len(self.class_names[task])} clases de '{task}' "
+                        f"pero el checkpoint tiene {num_classes[task]}"
+                    )
+        
+        # modo de optimizacion para cpu (solo aplica al modelo eager)
+        if self.backend == 'torch' and (self.quantization or self.channels_last):
+            self.model = optimize_for_cpu(
+                self.model,
+                quantization=self.quantization,
+                channels_last=self.channels_last,
+                calibration_batches=self._calibration_batches() if self.quantization == 'static' else None
             )
-        ])
         
-        print(f"modelo cargado en {self.device}")
+        print(f"modelo cargado en {self.device} ({self.backend})")
     
-    def predict(self, image_path_or_pil):
-
-        # cargar imagen
-        if isinstance(image_path_or_pil, str):
-            image = Image.open(image_path_or_pil).convert('RGB')
+    def _load_exported(self, model_path):
+        """carga el grafo de manage.py export_model (torchscript u onnx)"""
+        if self.backend == 'torchscript':
+            self.model = torch.jit.load(str(model_path), map_location=self.device)
+            self.model.eval()
         else:
-            image = image_path_or_pil.convert('RGB')
-        
-        # preprocesar
-        image_tensor = self.transform(image).unsqueeze(0).to(self.device)
+            try:
+                import onnxruntime
+            except ImportError:
+                raise ImportError("el backend 'onnx' necesita onnxruntime (pip install onnxruntime)")
+            self.session = onnxruntime.InferenceSession(
+                str(model_path), providers=['CPUExecutionProvider']
+            )
+    
+    def __getstate__(self):
+        """
+        para pasar el predictor a un proceso nuevo (pool de serving.py, con spawn): el
+        modelo eager viaja por los reducers de torch.multiprocessing (si ya esta en
+        memoria compartida no se copia); el grafo exportado, la sesion de onnxruntime
+        y el buffer por hilo del preprocessor se vuelven a crear del otro lado
+        """
+        state = self.__dict__.copy()
+        state['session'] = None
+        state['preprocessor'] = None
+        if self.backend != 'torch':
+            state['model'] = None
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.backend != 'torch':
+            self._load_exported(self.model_dir / EXPORTED_PATHS[self.backend].name)
+        self._load_labels()
+    
+    def _load_labels(self):
+        """
+        nombres de clase de model_info.json en una sola tabla plana: el indice de la
+        cabeza t es offsets[t] + idx, asi las 4 cabezas se decodifican con un indexado
+        """
+        with open(self.model_info_path) as f:
+            info = json.load(f)
         
-        # predicción
-        with torch.no_grad():
-            outputs = self.model(image_tensor)
+        self.class_names = {task: list(info['class_names'][task]) for task in TASKS}
+        self._label_table = np.array(
+            [name for task in TASKS for name in self.class_names[task]], dtype=object
+        )
+        sizes = [len(self.class_names[task]) for task in TASKS]
+        self._label_offsets = np.cumsum([0] + sizes[:-1]).reshape(-1, 1)
+        self._label_slices = [
+            (int(start), int(start) + size) for start, size in zip(self._label_offsets[:, 0], sizes)
+        ]
         
-        # procesar resultados
-        results = {}
+        # resize + normalizacion (ver preprocessing.py)
+        normalization = info.get('normalization', {})
+        self.preprocessor = Preprocessor(
+            size=tuple(info.get('input_size', (224, 224))),
+            mean=normalization.get('mean', [0.485, 0.456, 0.406]),
+            std=normalization.get('std', [0.229, 0.224, 0.225])
+        )
+    
+    @classmethod
+    def from_model(cls, model, max_batch_size=DEFAULT_MAX_BATCH_SIZE, model_version='in-memory'):
+        """envuelve un MultiTaskFaceModel ya construido (ej. pesos aleatorios para benchmarks)"""
+        self = cls.__new__(cls)
+        self.backend = 'torch'
+        self.quantization = None
+        self.channels_last = False
+        self.calibration_dir = None
+        self.device = next(model.parameters()).device
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.model = model.eval()
+        self.session = None
+        self.model_version = model_version
+        self.model_dir = MODELS_DIR
+        self.model_info_path = MODEL_INFO_PATH
+        self._load_labels()
+        return self
+    
+    def _calibration_batches(self, limit=CALIBRATION_IMAGES):
+        """
+        imagenes de calibration_dir ya preprocesadas, para la cuantizacion estatica;
+        calibration_dir puede ser un directorio o una lista de rutas de imagenes
+        """
+        if not self.calibration_dir:
+            return []
         
-        for task in ['sex', 'eyes', 'race', 'hair']:
+        if isinstance(self.calibration_dir, (list, tuple)):
+            paths = list(self.calibration_dir)[:limit]
+        else:
+            paths = sorted(
+                p for p in Path(self.calibration_dir).rglob('*')
+                if p.suffix.lower() in ('.png', '.jpg', '.jpeg', '.webp')
+            )[:limit]
+        tensors = [self.preprocess(str(p)) for p in paths]
+        return [
+            torch.stack(tensors[start:start + self.max_batch_size])
+            for start in range(0, len(tensors), self.max_batch_size)
+        ]
+    
+    def preprocess(self, image_path_or_pil):
+        """abre la imagen (ruta o PIL) y regresa el tensor [3, 224, 224]"""
+        return self.preprocessor(image_path_or_pil)
+    
+    def _postprocess(self, outputs):
+        """
+        softmax/argmax/confianza de las 4 cabezas para todo el batch de una vez; cada
+        cabeza trae tambien la distribucion completa (en %, orden de class_names) y,
+        si el modelo lo da, el resultado lleva el embedding normalizado en float16
+        """
+        confidences = []
+        indices = []
+        all_probs = []
+        for task in TASKS:
             probs = torch.softmax(outputs[task], dim=1)
-            pred_idx = torch.argmax(probs, dim=1).item()
-            confidence = probs[0][pred_idx].item() * 100
-            
-            results[task] = {
-                'prediction': self.encoders[task].inverse_transform([pred_idx])[0],
-                'confidence': round(confidence, 2)
+            conf, idx = probs.max(dim=1)
+            confidences.append(conf)
+            indices.append(idx)
+            all_probs.append(probs)
+        
+        # una sola copia a cpu para las 4 cabezas; [4, N] y [N, total de clases]
+        confidences = (torch.stack(confidences).double() * 100).round(decimals=2).cpu().tolist()
+        indices = torch.stack(indices).cpu().numpy()
+        all_probs = (torch.cat(all_probs, dim=1).double() * 100).round(decimals=2).cpu().tolist()
+        
+        # nombres de las 4 cabezas en un solo indexado sobre la tabla plana
+        labels = self._label_table[indices + self._label_offsets].tolist()
+        
+        # norma 1 para que la similitud coseno sea un producto punto (ver embeddings.py)
+        embeddings = None
+        if outputs.get(EMBEDDING_KEY) is not None:
+            features = torch.nn.functional.normalize(outputs[EMBEDDING_KEY].float(), dim=1)
+            embeddings = features.cpu().numpy().astype(np.float16)
+        
+        batch_size = indices.shape[1]
+        results = []
+        for i in range(batch_size):
+            result = {
+                task: {
+                    'prediction': labels[t][i],
+                    'confidence': confidences[t][i],
+                    'probabilities': all_probs[i][start:end]
+                }
+                for t, (task, (start, end)) in enumerate(zip(TASKS, self._label_slices))
             }
+            result[MODEL_VERSION_KEY] = self.model_version
+            if embeddings is not None:
+                result[EMBEDDING_KEY] = embeddings[i]
+            results.append(result)
+        return results
+    
+    def forward_logits(self, batch_tensor):
+        """logits crudos por tarea para un batch [N, 3, 224, 224], sin importar el backend"""
+        with timed('forward'):
+            return self._run_model(batch_tensor)
+    
+    def _run_model(self, batch_tensor):
+        if self.backend == 'onnx':
+            outputs = self.session.run(None, {'input': batch_tensor.cpu().numpy()})
+            # los grafos exportados antes del embedding solo traen las 4 cabezas
+            return {name: torch.from_numpy(out) for name, out in zip(OUTPUTS, outputs)}
+        
+        batch_tensor = batch_tensor.to(self.device)
+        if self.channels_last:
+            batch_tensor = batch_tensor.contiguous(memory_format=torch.channels_last)
+        
+        with torch.inference_mode():
+            outputs = self.model(batch_tensor)
+        
+        # el grafo exportado regresa una tupla en el orden de OUTPUTS
+        if self.backend == 'torchscript':
+            return dict(zip(OUTPUTS, outputs))
+        return outputs
+    
+    def _forward(self, batch_tensor):
+        """un solo forward pass para un batch ya apilado [N, 3, 224, 224]"""
+        BATCH_SIZE.observe(batch_tensor.shape[0])
+        outputs = self.forward_logits(batch_tensor)
+        with timed('postprocess'):
+            return self._postprocess(outputs)
+    
+    def predict(self, image_path_or_pil):
+        return self.predict_batch([image_path_or_pil])[0]
+    
+    def predict_batch(self, image_paths, max_batch_size=None):
+        """
+        predice varias imagenes (rutas o PIL) apilandolas en batches de
+        hasta max_batch_size, un forward pass por batch
+        """
+        max_batch_size = max(1, int(max_batch_size or self.max_batch_size))
+        image_paths = list(image_paths)
+        
+        # cada chunk se decodifica directo en el buffer del preprocessor
+        results = []
+        for start in range(0, len(image_paths), max_batch_size):
+            batch = self.preprocessor.preprocess_batch(image_paths[start:start + max_batch_size])
+            results.extend(self._forward(batch))
         
         return results
     
-    def predict_batch(self, image_paths):
+    def predict_tensors(self, tensors, max_batch_size=None):
+        """predice tensores ya preprocesados (de preprocess), en batches de max_batch_size"""
+        max_batch_size = max(1, int(max_batch_size or self.max_batch_size))
         
         results = []
-        for img_path in image_paths:
-            results.append(self.predict(img_path))
+        for start in range(0, len(tensors), max_batch_size):
+            results.extend(self._forward(torch.stack(tensors[start:start + max_batch_size])))
         return results
 
 
+def create_predictor(**overrides):
+    """construye un FaceAttributePredictor local con la configuracion de settings"""
+    from django.conf import settings
+    options = {
+        'max_batch_size': getattr(settings, 'PREDICTOR_MAX_BATCH_SIZE', DEFAULT_MAX_BATCH_SIZE),
+        'backend': getattr(settings, 'PREDICTOR_BACKEND', 'torch'),
+        'quantization': getattr(settings, 'PREDICTOR_QUANTIZATION', None),
+        'channels_last': getattr(settings, 'PREDICTOR_CHANNELS_LAST', False),
+        'num_threads': getattr(settings, 'PREDICTOR_NUM_THREADS', None),
+        'calibration_dir': getattr(settings, 'PREDICTOR_CALIBRATION_DIR', None),
+    }
+    options.update(overrides)
+    return FaceAttributePredictor(**options)
+
+
 # global instance and shi
 predictor = None
+_predictor_lock = threading.Lock()
 
 def get_predictor():
     
     global predictor
     if predictor is None:
-        predictor = FaceAttributePredictor()
-    return predictor    
\ No newline at end of file
+        with _predictor_lock:
+            if predictor is None:
+                predictor = _create_global_predictor()
+    if isinstance(predictor, FaceAttributePredictor):
+        # el hilo del manager cambia de version en caliente si registry.json apunta a otra;
+        # aqui solo se compara el pid (el hilo no sobrevive al fork de gunicorn)
+        from .registry import get_model_manager
+        get_model_manager().ensure_watching()
+    return predictor
+
+
+def _create_global_predictor():
+    from django.conf import settings
+    if getattr(settings, 'INFERENCE_POOL_SOCKET', None):
+        # el modelo vive en el pool de manage.py serve_inference, aqui solo hay un cliente
+        from .serving import InferencePoolClient
+        return InferencePoolClient(
+            settings.INFERENCE_POOL_SOCKET,
+            getattr(settings, 'INFERENCE_POOL_WORKERS', 1)
+        )
+    # la version activa del registro (ver registry.py), o ml_models/ si no hay registro
+    from .registry import get_model_manager
+    return create_predictor(**get_model_manager().initial_options())
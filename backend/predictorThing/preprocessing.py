@@ -0,0 +1,88 @@
+# predictorThing/preprocessing.py
+import io
+import threading
+
+import numpy as np
+import torch
+from PIL import Image
+
+from .metrics import timed
+
+INPUT_SIZE = (224, 224)
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+
+
+def load_image(source, size=INPUT_SIZE):
+    """
+    abre una imagen (ruta, bytes, archivo o PIL) y la deja en RGB del tamaño de entrada.
+    los JPEG se decodifican en modo draft (escala reducida por DCT) y el resize se hace
+    en un solo paso con reducing_gap, asi no se procesa la resolucion completa
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    image = source if isinstance(source, Image.Image) else Image.open(source)
+
+    if image.format == 'JPEG':
+        # draft escoge la escala 1/2, 1/4 o 1/8 mas chica que siga siendo >= size
+        image.draft('RGB', size)
+
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    if image.size != size:
+        image = image.resize(size, Image.BILINEAR, reducing_gap=3.0)
+
+    return image
+
+
+class Preprocessor:
+    """
+    convierte imagenes al tensor normalizado del modelo; normaliza un batch completo
+    con una sola operacion sobre un buffer preasignado (uno por hilo)
+    """
+
+    def __init__(self, size=INPUT_SIZE, mean=MEAN, std=STD):
+        self.size = tuple(size)
+        # (x / 255 - mean) / std == (x - 255 * mean) / (255 * std)
+        self.offset = torch.tensor(mean, dtype=torch.float32).view(1, 3, 1, 1) * 255
+        self.scale = torch.tensor(std, dtype=torch.float32).view(1, 3, 1, 1) * 255
+        self._local = threading.local()
+
+    def _buffer(self, batch_size):
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or buffer.shape[0] < batch_size:
+            buffer = torch.empty((batch_size, 3, self.size[1], self.size[0]), dtype=torch.float32)
+            self._local.buffer = buffer
+        return buffer[:batch_size]
+
+    def _fill(self, out, index, image):
+        with timed('decode'):
+            pixels = np.asarray(load_image(image, self.size), dtype=np.uint8)
+        with timed('preprocess'):
+            # HWC uint8 -> CHW float, la conversion de tipo la hace copy_
+            out[index].copy_(torch.from_numpy(pixels).permute(2, 0, 1))
+
+    def preprocess_batch(self, images):
+        """
+        regresa un tensor [N, 3, H, W] normalizado. el tensor es una vista del buffer
+        del hilo: se sobreescribe en la siguiente llamada del mismo hilo
+        """
+        return self.preprocess_into(images, self._buffer(len(images)))
+
+    def preprocess_into(self, images, out):
+        """decodifica y normaliza las imagenes directo en out[:N] (ej. memoria compartida)"""
+        batch = out[:len(images)]
+        for index, image in enumerate(images):
+            self._fill(batch, index, image)
+        with timed('preprocess'):
+            batch.sub_(self.offset).div_(self.scale)
+        return batch
+
+    def __call__(self, image):
+        """un solo tensor [3, H, W] (memoria propia, se puede apilar o encolar)"""
+        tensor = torch.empty((1, 3, self.size[1], self.size[0]), dtype=torch.float32)
+        self._fill(tensor, 0, image)
+        with timed('preprocess'):
+            tensor.sub_(self.offset).div_(self.scale)
+        return tensor[0]
@@ -0,0 +1,127 @@
+# predictorThing/queries.py
+import base64
+from datetime import datetime
+
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.urls import reverse
+
+from .images import DEFAULT_THUMBNAIL_SIZE, thumbnail_name
+from .models import LOW_CONFIDENCE_THRESHOLD
+from .predictor import TASKS
+
+# solo las columnas que usa la respuesta del listado
+LIST_FIELDS = [
+    'id', 'image', 'image_name', 'created_at',
+    'sex', 'sex_confidence',
+    'eyes', 'eyes_confidence',
+    'race', 'race_confidence',
+    'hair', 'hair_confidence',
+    'average_confidence', 'min_confidence', 'derivatives', 'model_version',
+]
+
+# el export para revision lleva tambien el top-k guardado
+EXPORT_FIELDS = LIST_FIELDS + ['top_k']
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def low_confidence_q():
+    """filtro equivalente a FaceAnalysis.has_low_confidence"""
+    return Q(min_confidence__lt=LOW_CONFIDENCE_THRESHOLD)
+
+
+def filter_analyses(queryset, params):
+    """aplica los filtros sex/eyes/race/hair/low_confidence/model_version del query string"""
+    for task in TASKS:
+        value = params.get(task)
+        if value:
+            queryset = queryset.filter(**{task: value})
+
+    model_version = params.get('model_version')
+    if model_version:
+        queryset = queryset.filter(model_version=model_version)
+
+    low_confidence = params.get('low_confidence')
+    if low_confidence is not None:
+        if low_confidence.lower() in ('1', 'true', 'yes'):
+            queryset = queryset.filter(low_confidence_q())
+        elif low_confidence.lower() in ('0', 'false', 'no'):
+            queryset = queryset.exclude(low_confidence_q())
+
+    return queryset
+
+
+def encode_cursor(row):
+    raw = f"{row['created_at'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """regresa (created_at, id) o lanza ValueError si el cursor no es valido"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except Exception:
+        raise ValueError('cursor invalido')
+
+
+def paginate(queryset, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    paginacion keyset sobre (-created_at, -id): cada pagina es un range scan
+    del indice, sin OFFSET. regresa (filas, siguiente_cursor)
+    """
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        )
+
+    rows = list(queryset.values(*LIST_FIELDS)[:limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def thumbnail_url(row, media_base, size=DEFAULT_THUMBNAIL_SIZE, ext='webp'):
+    """url versionada de la miniatura (servida con cache larga), o None si aun no existe"""
+    derivatives = row.get('derivatives') or {}
+    if not thumbnail_name(derivatives, size, ext):
+        return None
+    path = reverse('predictorThing:thumbnail', args=[row['id'], size, ext])
+    return f"{media_base}{path}?v={derivatives.get('version', 0)}"
+
+
+def serialize_row(row, media_base, thumb_size=DEFAULT_THUMBNAIL_SIZE, thumb_ext='webp'):
+    """fila de .values() al formato de la API; media_base se calcula una vez por request"""
+    image_url = None
+    if row['image']:
+        image_url = default_storage.url(row['image'])
+        if not image_url.startswith(('http://', 'https://')):
+            image_url = media_base + image_url
+
+    data = {
+        'id': row['id'],
+        'image_url': image_url,
+        'thumbnail_url': thumbnail_url(row, media_base, thumb_size, thumb_ext),
+        'image_name': row['image_name'],
+    }
+    for task in TASKS:
+        data[task] = row[task]
+        data[f'{task}_confidence'] = row[f'{task}_confidence']
+    data.update({
+        'created_at': row['created_at'].isoformat(),
+        'average_confidence': round(row['average_confidence'], 2),
+        'has_low_confidence': row['min_confidence'] < LOW_CONFIDENCE_THRESHOLD,
+        'model_version': row['model_version'],
+    })
+    if 'top_k' in row:
+        data['top_k'] = row['top_k']
+    return data
+
+
+def iter_all_rows(queryset, chunk_size=2000):
+    """todas las filas en orden, sin materializar la tabla (cursor del lado del servidor)"""
+    return queryset.order_by('-created_at', '-id').values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
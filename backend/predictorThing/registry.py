@@ -0,0 +1,439 @@
+# predictorThing/registry.py
+import json
+import os
+import queue
+import random
+import re
+import shutil
+import threading
+import time
+import traceback
+import weakref
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+
+from . import predictor as predictor_module
+from .metrics import MODEL_SWAPS, SHADOW_PREDICTIONS, timed
+from .predictor import CHECKPOINT_PATH, EXPORTED_PATHS, MODEL_INFO_PATH, MODELS_DIR, TASKS, create_predictor
+
+DEFAULT_REGISTRY_DIR = MODELS_DIR / 'versions'
+STATE_FILE = 'registry.json'
+
+# cada cuanto (por proceso) se revisa si cambio la version activa o la sombra
+DEFAULT_RELOAD_INTERVAL = 5
+
+# imagenes esperando a la version sombra; lo que no cabe se descarta
+DEFAULT_SHADOW_QUEUE = 32
+
+VERSION_PATTERN = re.compile(r'[A-Za-z0-9][A-Za-z0-9._-]{0,63}')
+
+
+class ModelRegistry:
+    """
+    versiones del modelo en <root>/<version>/, cada una con su checkpoint (o los
+    exportados) y su model_info.json. registry.json dice cual es la activa y cual
+    corre en sombra; se reescribe completo con os.replace, nunca a medias
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.state_path = self.root / STATE_FILE
+
+    def version_dir(self, version):
+        if not VERSION_PATTERN.fullmatch(version or ''):
+            raise ValueError(f'nombre de version invalido: {version!r}')
+        return self.root / version
+
+    def exists(self, version):
+        return (self.version_dir(version) / MODEL_INFO_PATH.name).exists()
+
+    def versions(self):
+        """versiones registradas con su metadata de model_info.json, de la mas nueva a la mas vieja"""
+        if not self.root.is_dir():
+            return []
+        versions = []
+        for path in self.root.iterdir():
+            info_path = path / MODEL_INFO_PATH.name
+            if not path.is_dir() or not info_path.exists():
+                continue
+            with open(info_path) as f:
+                info = json.load(f)
+            versions.append({
+                'version': path.name,
+                'registered_at': info.get('registered_at'),
+                'description': info.get('description', ''),
+                'model_architecture': info.get('model_architecture'),
+                'num_classes': {task: len(info['class_names'][task]) for task in TASKS},
+                'backends': [
+                    backend for backend, name in [('torch', CHECKPOINT_PATH.name)] + [
+                        (backend, exported.name) for backend, exported in EXPORTED_PATHS.items()
+                    ]
+                    if (path / name).exists()
+                ],
+            })
+        versions.sort(key=lambda item: item['registered_at'] or '', reverse=True)
+        return versions
+
+    def state(self):
+        """{'active': version o None, 'shadow': version o None, 'shadow_rate': 0-1}"""
+        state = {'active': None, 'shadow': None, 'shadow_rate': 0.0}
+        try:
+            with open(self.state_path) as f:
+                state.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        return state
+
+    def stamp(self):
+        """cambia cada vez que se reescribe registry.json; un stat por revision"""
+        try:
+            return self.state_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _write_state(self, state):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_name(f'.{STATE_FILE}.{os.getpid()}')
+        with open(tmp, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, self.state_path)
+
+    def register(self, version, checkpoint, model_info=None, description=''):
+        """copia checkpoint + model_info.json a una version nueva (nunca sobreescribe una existente)"""
+        target = self.version_dir(version)
+        if target.exists():
+            raise ValueError(f'la version {version} ya existe')
+
+        with open(model_info or MODEL_INFO_PATH) as f:
+            info = json.load(f)
+        for task in TASKS:
+            if task not in info.get('class_names', {}):
+                raise ValueError(f"model_info.json no tiene class_names de '{task}'")
+        info['version'] = version
+        info['description'] = description
+        info['registered_at'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+        # se arma en un directorio temporal y se renombra: una version aparece completa o no aparece
+        staging = self.root / f'.{version}.tmp'
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir(parents=True)
+        try:
+            shutil.copy2(checkpoint, staging / CHECKPOINT_PATH.name)
+            with open(staging / MODEL_INFO_PATH.name, 'w') as f:
+                json.dump(info, f, indent=2)
+            os.replace(staging, target)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return target
+
+    def activate(self, version):
+        if not self.exists(version):
+            raise ValueError(f'no existe la version {version}')
+        state = self.state()
+        state['active'] = version
+        if state.get('shadow') == version:
+            state['shadow'] = None
+        self._write_state(state)
+
+    def set_shadow(self, version, rate):
+        """version None quita la sombra"""
+        if version is not None and not self.exists(version):
+            raise ValueError(f'no existe la version {version}')
+        state = self.state()
+        state['shadow'] = version
+        state['shadow_rate'] = max(0.0, min(1.0, float(rate))) if version else 0.0
+        self._write_state(state)
+
+
+class ShadowRunner:
+    """
+    corre una version candidata sobre una muestra del trafico en su propio hilo y
+    compara con lo que contesto la activa; nunca agrega latencia al request
+    """
+
+    def __init__(self, predictor, version, rate, max_queue=DEFAULT_SHADOW_QUEUE):
+        self.predictor = predictor
+        self.version = version
+        self.rate = rate
+        self._queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._runs = 0
+        self._dropped = 0
+        self._errors = 0
+        self._agree = {task: 0 for task in TASKS}
+        self._confidence_diff = {task: 0.0 for task in TASKS}
+        self._thread = threading.Thread(target=self._run, name=f'shadow-{version}', daemon=True)
+        self._thread.start()
+
+    def submit(self, image, primary):
+        if self._stopped or random.random() >= self.rate:
+            return
+        try:
+            # copia en memoria: el upload puede cerrarse antes de que corra la sombra
+            self._queue.put_nowait((image.copy(), primary))
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+
+    def stop(self):
+        self._stopped = True
+        self._queue.put(None)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            image, primary = item
+            try:
+                with timed('shadow_forward'):
+                    result = self.predictor.predict(image)
+            except Exception:
+                with self._lock:
+                    self._errors += 1
+                print(f"ERROR en la version sombra {self.version}:")
+                print(traceback.format_exc())
+                continue
+
+            with self._lock:
+                self._runs += 1
+                for task in TASKS:
+                    same = result[task]['prediction'] == primary[task]['prediction']
+                    self._agree[task] += same
+                    self._confidence_diff[task] += abs(result[task]['confidence'] - primary[task]['confidence'])
+                    SHADOW_PREDICTIONS.inc(
+                        version=self.version, task=task, outcome='agree' if same else 'disagree'
+                    )
+
+    def stats(self):
+        with self._lock:
+            runs = self._runs
+            return {
+                'version': self.version,
+                'rate': self.rate,
+                'runs': runs,
+                'dropped': self._dropped,
+                'errors': self._errors,
+                'queue_depth': self._queue.qsize(),
+                'agreement': {
+                    task: round(self._agree[task] / runs, 4) if runs else None for task in TASKS
+                },
+                'mean_confidence_diff': {
+                    task: round(self._confidence_diff[task] / runs, 2) if runs else None for task in TASKS
+                },
+            }
+
+
+class ModelManager:
+    """
+    la version del modelo de este proceso. un hilo revisa registry.json cada
+    reload_interval (fuera del camino de los requests); si cambio la activa, la carga
+    y calienta en otro hilo mientras la vieja sigue contestando, y luego cambia la
+    referencia global de golpe. la vieja se libera sola cuando terminan los requests
+    que aun la tienen (ya nadie mas la referencia)
+    """
+
+    def __init__(self, registry, reload_interval=DEFAULT_RELOAD_INTERVAL, shadow_queue=DEFAULT_SHADOW_QUEUE):
+        self.registry = registry
+        self.reload_interval = reload_interval
+        self.shadow_queue = shadow_queue
+        self.version = None
+        self.shadow = None
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._watcher_pid = None
+        self._checked = 0.0
+        self._stamp = None
+        self._loading = set()
+        self._draining = {}
+        self._swaps = 0
+        self._last_swap = None
+        self._error = None
+
+    def initial_options(self):
+        """argumentos de create_predictor para la version activa ({} = ml_models/ sin registro)"""
+        self._stamp = self.registry.stamp()
+        self._checked = time.monotonic()
+        active = self.registry.state()['active']
+        self.version = active
+        if not active:
+            return {}
+        return {'model_dir': self.registry.version_dir(active), 'model_version': active}
+
+    def ensure_watching(self):
+        """arranca el hilo que revisa registry.json (uno por proceso, se rearranca tras un fork)"""
+        if self._watcher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+            threading.Thread(target=self._watch, name='model-watch', daemon=True).start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.reload_interval)
+            try:
+                self.maybe_reload()
+            except Exception:
+                # un registry.json ilegible no debe matar al hilo; se reintenta en la siguiente vuelta
+                print("ERROR al revisar el registro de modelos:")
+                print(traceback.format_exc())
+
+    def maybe_reload(self):
+        """barato: a lo mucho un stat de registry.json cada reload_interval segundos"""
+        now = time.monotonic()
+        if now - self._checked < self.reload_interval:
+            return
+        with self._lock:
+            if now - self._checked < self.reload_interval:
+                return
+            self._checked = now
+            if self._pid != os.getpid():
+                # los hilos de carga no sobreviven a un fork
+                self._pid = os.getpid()
+                self._loading.clear()
+            stamp = self.registry.stamp()
+            if stamp == self._stamp:
+                return
+            self._stamp = stamp
+            state = self.registry.state()
+
+        active = state['active']
+        if active and active != self.version:
+            self._start(active, self._swap_in)
+
+        shadow = state['shadow']
+        current = self.shadow
+        if shadow and shadow != active and (current is None or current.version != shadow):
+            self._start(shadow, lambda version, predictor: self._set_shadow(
+                ShadowRunner(predictor, version, state['shadow_rate'], self.shadow_queue)
+            ))
+        elif current is not None and (not shadow or shadow == active):
+            self._set_shadow(None)
+        elif current is not None:
+            current.rate = state['shadow_rate']
+
+    def _start(self, version, install):
+        with self._lock:
+            if version in self._loading:
+                return
+            self._loading.add(version)
+        threading.Thread(
+            target=self._load, args=(version, install), name=f'model-load-{version}', daemon=True
+        ).start()
+
+    def _load(self, version, install):
+        from .warmup import DEFAULT_WARMUP_BATCH_SIZES, DEFAULT_WARMUP_ITERATIONS, warm_up
+
+        try:
+            started = time.monotonic()
+            predictor = create_predictor(model_dir=self.registry.version_dir(version), model_version=version)
+            # se calienta antes del cambio para que el primer request no pague la primera pasada
+            warm_up(
+                predictor,
+                batch_sizes=getattr(settings, 'PREDICTOR_WARMUP_BATCH_SIZES', DEFAULT_WARMUP_BATCH_SIZES),
+                iterations=getattr(settings, 'PREDICTOR_WARMUP_ITERATIONS', DEFAULT_WARMUP_ITERATIONS),
+            )
+            install(version, predictor)
+            print(f"modelo {version} listo en {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            # la version anterior sigue activa; se reintenta si registry.json vuelve a cambiar
+            self._error = f'{version}: {e}'
+            print(f"ERROR al cargar el modelo {version}:")
+            print(traceback.format_exc())
+        finally:
+            with self._lock:
+                self._loading.discard(version)
+
+    def predictor_for(self, version):
+        """
+        el predictor de una version sin cambiar la de este proceso: el actual si ya es
+        esa, si no uno nuevo (ej. para calcular sus embeddings en segundo plano)
+        """
+        current = predictor_module.predictor
+        if current is not None and current.model_version == version:
+            return current
+        if not self.registry.exists(version):
+            raise ValueError(f'no existe la version {version!r}')
+        return create_predictor(model_dir=self.registry.version_dir(version), model_version=version)
+
+    def _swap_in(self, version, predictor):
+        from . import batching
+
+        with self._lock:
+            old = predictor_module.predictor
+            predictor_module.predictor = predictor
+            # los requests nuevos ya entran al batcher con la version nueva
+            if batching.batcher is not None:
+                batching.batcher.predictor = predictor
+            self.version = version
+            self._swaps += 1
+            self._last_swap = datetime.now(timezone.utc).isoformat(timespec='seconds')
+            self._error = None
+            if old is not None:
+                self._retire(old)
+        MODEL_SWAPS.inc(version=version)
+
+    def _retire(self, old):
+        """la version vieja sale del global; se cuenta como drenando hasta que el GC la libere"""
+        label = old.model_version
+        self._draining[label] = weakref.ref(old)
+        weakref.finalize(old, _released, label, getattr(old, 'device', None))
+
+    def _set_shadow(self, runner):
+        with self._lock:
+            previous, self.shadow = self.shadow, runner
+        if previous is not None:
+            previous.stop()
+
+    def submit_shadow(self, image, primary):
+        runner = self.shadow
+        if runner is not None:
+            runner.submit(image, primary)
+
+    def stats(self):
+        with self._lock:
+            draining = [label for label, ref in self._draining.items() if ref() is not None]
+            self._draining = {label: self._draining[label] for label in draining}
+            runner = self.shadow
+            return {
+                'version': self.version,
+                'model_version': getattr(predictor_module.predictor, 'model_version', None),
+                'loading': sorted(self._loading),
+                'draining': draining,
+                'swaps': self._swaps,
+                'last_swap': self._last_swap,
+                'error': self._error,
+                'shadow': runner.stats() if runner is not None else None,
+            }
+
+
+def _released(label, device):
+    # sin referencias vivas: los pesos ya se liberaron, solo falta regresar la memoria de cuda
+    if device is not None and device.type == 'cuda':
+        import torch
+        torch.cuda.empty_cache()
+    print(f"modelo {label} liberado")
+
+
+# instancia global
+manager = None
+_manager_lock = threading.Lock()
+
+def get_model_manager():
+
+    global manager
+    if manager is None:
+        with _manager_lock:
+            if manager is None:
+                manager = ModelManager(
+                    ModelRegistry(getattr(settings, 'MODEL_REGISTRY_DIR', DEFAULT_REGISTRY_DIR)),
+                    reload_interval=getattr(settings, 'MODEL_RELOAD_INTERVAL', DEFAULT_RELOAD_INTERVAL),
+                    shadow_queue=getattr(settings, 'MODEL_SHADOW_QUEUE', DEFAULT_SHADOW_QUEUE),
+                )
+    return manager
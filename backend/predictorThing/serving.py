@@ -0,0 +1,454 @@
+# predictorThing/serving.py
+import atexit
+import hashlib
+import os
+import random
+import signal
+import threading
+import time
+import traceback
+from multiprocessing import AuthenticationError, resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import torch
+import torch.multiprocessing
+
+from .metrics import BATCH_SIZE, timed
+from .preprocessing import INPUT_SIZE, Preprocessor
+
+# bytes de una imagen ya preprocesada [3, 224, 224] float32
+IMAGE_BYTES = 3 * INPUT_SIZE[0] * INPUT_SIZE[1] * 4
+
+# conexiones (cada una con su segmento) por worker si no se configura INFERENCE_POOL_CONNECTIONS
+DEFAULT_CONNECTIONS_PER_WORKER = 4
+
+
+def worker_socket(socket_base, index):
+    return f"{socket_base}.{index}"
+
+
+def pool_authkey():
+    """
+    llave del handshake de los sockets: INFERENCE_POOL_AUTHKEY o, si no hay,
+    una derivada del SECRET_KEY (la misma en las vistas y en serve_inference)
+    """
+    from django.conf import settings
+
+    key = getattr(settings, 'INFERENCE_POOL_AUTHKEY', None) or settings.SECRET_KEY
+    if isinstance(key, str):
+        key = key.encode()
+    return hashlib.sha256(b'inference-pool:' + key).digest()
+
+
+def _batch_view(shm, max_batch_size):
+    """tensor [max_batch, 3, 224, 224] sobre el segmento compartido (sin copia)"""
+    array = np.ndarray((max_batch_size, 3, INPUT_SIZE[1], INPUT_SIZE[0]), dtype=np.float32, buffer=shm.buf)
+    return torch.from_numpy(array)
+
+
+def _attach(name):
+    """se conecta a un segmento creado por el cliente sin que este proceso lo borre al salir"""
+    shm = SharedMemory(name=name)
+    try:
+        # antes de 3.13 el resource_tracker haria unlink del segmento ajeno al terminar
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except Exception:
+        pass
+    return shm
+
+
+def split_cores(num_workers):
+    """reparte los cores disponibles en num_workers grupos contiguos"""
+    if hasattr(os, 'sched_getaffinity'):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count() or 1))
+    num_workers = max(1, num_workers)
+    size = max(1, len(cores) // num_workers)
+    groups = [cores[i * size:(i + 1) * size] for i in range(num_workers)]
+    # los cores sobrantes se van al ultimo worker
+    groups[-1].extend(cores[num_workers * size:])
+    return [group or cores for group in groups]
+
+
+# --- lado del servidor -------------------------------------------------------
+
+def _handle_connection(conn, predictor, lock):
+    """atiende a un cliente: un segmento compartido por conexion, un batch por mensaje"""
+    shm = None
+    batch = None
+    try:
+        while True:
+            message = conn.recv()
+            command = message[0]
+
+            if command == 'attach':
+                _, name, max_batch_size = message
+                shm = _attach(name)
+                batch = _batch_view(shm, max_batch_size)
+                conn.send(('ready', {
+                    'model_version': predictor.model_version,
+                    'max_batch_size': predictor.max_batch_size,
+                    'class_names': predictor.class_names,
+                    'pid': os.getpid(),
+                }))
+
+            elif command == 'predict':
+                _, count = message
+                try:
+                    # un forward a la vez por worker: cada uno ya tiene sus propios cores
+                    with lock:
+                        results = predictor.predict_tensors(list(batch[:count]))
+                    conn.send(('ok', results))
+                except Exception as e:
+                    print(f"ERROR en worker de inferencia {os.getpid()}:")
+                    print(traceback.format_exc())
+                    conn.send(('error', str(e)))
+
+            elif command == 'close':
+                break
+    except (EOFError, ConnectionError):
+        pass
+    finally:
+        batch = None
+        if shm is not None:
+            try:
+                shm.close()
+            except BufferError:
+                # queda alguna vista viva; el segmento se libera cuando el cliente haga unlink
+                pass
+        conn.close()
+
+
+def _worker_main(index, socket_path, predictor, cores, authkey):
+    """
+    proceso de inferencia: fijado a sus cores, con los pesos compartidos del master.
+    es un proceso nuevo (spawn), asi que el pool de hilos de torch se crea aqui y el
+    warm-up corre ya con los hilos de este worker
+    """
+    from .warmup import warm_up
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+    warm_up(predictor)
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    listener = Listener(socket_path, family='AF_UNIX', authkey=authkey)
+    lock = threading.Lock()
+    print(f"worker {index} (pid {os.getpid()}) en {socket_path}, cores {cores}")
+
+    while True:
+        try:
+            conn = listener.accept()
+        except (AuthenticationError, EOFError, OSError) as e:
+            # un cliente sin la llave (o que se fue a media negociacion) no tumba al worker
+            print(f"worker {index}: conexion rechazada ({e})")
+            continue
+        threading.Thread(target=_handle_connection, args=(conn, predictor, lock), daemon=True).start()
+
+
+def serve(predictor, socket_base, num_workers, authkey=None):
+    """
+    levanta num_workers procesos; los pesos se mueven a memoria compartida antes, asi
+    que todos los workers usan la misma copia. reinicia los que se caen.
+
+    los workers se crean con spawn y no con fork: el master ya pudo correr forwards
+    (calibracion, el warm-up de AppConfig.ready) y un fork con el pool de OpenMP/MKL
+    ya creado se puede colgar en la primera operacion en paralelo del hijo
+    """
+    authkey = authkey or pool_authkey()
+    if predictor.model is not None:
+        predictor.model.share_memory()
+
+    # el contexto de torch.multiprocessing manda los tensores compartidos sin copiarlos
+    context = torch.multiprocessing.get_context('spawn')
+    core_groups = split_cores(num_workers)
+    workers = {}
+
+    def start(index):
+        process = context.Process(
+            target=_worker_main,
+            args=(index, worker_socket(socket_base, index), predictor, core_groups[index], authkey),
+            name=f'inference-worker-{index}',
+            daemon=True,
+        )
+        process.start()
+        workers[index] = process
+
+    def shutdown(*_):
+        for process in workers.values():
+            process.terminate()
+        for index in workers:
+            path = worker_socket(socket_base, index)
+            if os.path.exists(path):
+                os.unlink(path)
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    for index in range(num_workers):
+        start(index)
+
+    while True:
+        time.sleep(1)
+        for index, process in list(workers.items()):
+            if not process.is_alive():
+                print(f"worker {index} termino (exit {process.exitcode}), reiniciando")
+                start(index)
+
+
+# --- lado del cliente (vistas de Django) --------------------------------------
+
+class _Slot:
+    """una conexion a un worker con su segmento compartido"""
+
+    def __init__(self, index, conn, shm, max_batch_size):
+        self.index = index
+        self.conn = conn
+        self.shm = shm
+        self.batch = _batch_view(shm, max_batch_size)
+        self.pid = os.getpid()
+        self.broken = False
+
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        self.batch = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class InferencePoolClient:
+    """
+    cliente del pool con la misma interfaz que FaceAttributePredictor; preprocesa
+    directo en un segmento de memoria compartida y solo manda por el socket cuantas
+    imagenes hay. las conexiones (con su segmento) son un pool acotado que comparten
+    todos los hilos: cada llamada toma una del worker menos ocupado y la regresa
+    """
+
+    def __init__(self, socket_base, num_workers, max_batch_size=None, timeout=30.0, max_connections=None):
+        from django.conf import settings
+        from .predictor import DEFAULT_MAX_BATCH_SIZE
+
+        self.socket_base = socket_base
+        self.num_workers = max(1, int(num_workers))
+        self.max_batch_size = max_batch_size or getattr(settings, 'PREDICTOR_MAX_BATCH_SIZE', DEFAULT_MAX_BATCH_SIZE)
+        self.timeout = timeout
+        self.max_connections = max(1, int(
+            max_connections
+            or getattr(settings, 'INFERENCE_POOL_CONNECTIONS', None)
+            or self.num_workers * DEFAULT_CONNECTIONS_PER_WORKER
+        ))
+        self.authkey = pool_authkey()
+        self.preprocessor = Preprocessor()
+        self.model = None
+        self.backend = 'pool'
+        self._model_version = None
+        self._class_names = None
+
+        self._lock = threading.Lock()
+        self._available = threading.BoundedSemaphore(self.max_connections)
+        self._idle = []
+        self._slots = set()
+        # conexiones abiertas o abriendose; nunca pasa de max_connections
+        self._opened = 0
+        # llamadas en curso por worker, para escoger el menos ocupado
+        self._in_flight = [0] * self.num_workers
+        self._pid = os.getpid()
+        atexit.register(self.close)
+
+    def _check_fork(self):
+        # despues de un fork las conexiones y segmentos son del padre: se olvidan sin cerrarlos
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = []
+            self._slots = set()
+            self._opened = 0
+            self._in_flight = [0] * self.num_workers
+            self._available = threading.BoundedSemaphore(self.max_connections)
+
+    def _open(self, index):
+        conn = Client(worker_socket(self.socket_base, index), family='AF_UNIX', authkey=self.authkey)
+        try:
+            shm = SharedMemory(create=True, size=self.max_batch_size * IMAGE_BYTES)
+        except Exception:
+            conn.close()
+            raise
+        slot = _Slot(index, conn, shm, self.max_batch_size)
+        try:
+            conn.send(('attach', shm.name, self.max_batch_size))
+            status, info = conn.recv()
+            if status != 'ready':
+                raise RuntimeError(f"el worker de inferencia no acepto la conexion: {info}")
+        except Exception:
+            slot.close()
+            raise
+        self._model_version = info['model_version']
+        self._class_names = info['class_names']
+        return slot
+
+    def _checkout(self, avoid=None):
+        """toma una conexion del worker con menos llamadas en curso (empates al azar)"""
+        with self._lock:
+            self._check_fork()
+            available = self._available
+        if not available.acquire(timeout=self.timeout):
+            raise TimeoutError('no hay conexiones libres al pool de inferencia')
+
+        try:
+            with self._lock:
+                candidates = [i for i in range(self.num_workers) if i != avoid] or [avoid]
+                least = min(self._in_flight[i] for i in candidates)
+                index = random.choice([i for i in candidates if self._in_flight[i] == least])
+                self._in_flight[index] += 1
+
+                slot = next((idle for idle in self._idle if idle.index == index), None)
+                evicted = None
+                if slot is not None:
+                    self._idle.remove(slot)
+                else:
+                    if self._opened >= self.max_connections:
+                        # lleno: se cierra una libre de otro worker para abrir la de este
+                        # (con el semaforo tomado siempre hay al menos una libre)
+                        evicted = self._idle.pop(0)
+                        self._slots.discard(evicted)
+                        self._opened -= 1
+                    self._opened += 1
+
+            if evicted is not None:
+                evicted.close()
+            if slot is None:
+                try:
+                    slot = self._open(index)
+                except Exception:
+                    with self._lock:
+                        self._in_flight[index] -= 1
+                        self._opened -= 1
+                    raise
+                with self._lock:
+                    self._slots.add(slot)
+            return slot
+        except Exception:
+            available.release()
+            raise
+
+    def _release(self, slot):
+        with self._lock:
+            if slot.pid != os.getpid():
+                return
+            self._in_flight[slot.index] -= 1
+            if slot.broken:
+                self._slots.discard(slot)
+                self._opened -= 1
+            else:
+                self._idle.append(slot)
+            available = self._available
+        if slot.broken:
+            slot.close()
+        available.release()
+
+    def close(self):
+        """cierra las conexiones y hace unlink de los segmentos (atexit)"""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            slots = list(self._slots)
+            self._slots = set()
+            self._idle = []
+            self._opened -= len(slots)
+        for slot in slots:
+            slot.close()
+
+    def _describe(self):
+        slot = self._checkout()
+        self._release(slot)
+
+    @property
+    def model_version(self):
+        if self._model_version is None:
+            self._describe()
+        return self._model_version
+
+    @property
+    def class_names(self):
+        if self._class_names is None:
+            self._describe()
+        return self._class_names
+
+    def preprocess(self, image_path_or_pil):
+        return self.preprocessor(image_path_or_pil)
+
+    def _run_chunk(self, fill, count):
+        """llena el segmento con fill(batch) y pide el forward; reintenta una vez con otro worker"""
+        failed = None
+        for attempt in range(2):
+            slot = self._checkout(avoid=failed)
+            try:
+                fill(slot.batch)
+                # el forward corre en el worker; aqui se mide la ida y vuelta completa
+                with timed('forward'):
+                    slot.conn.send(('predict', count))
+                    if not slot.conn.poll(self.timeout):
+                        raise TimeoutError('el worker de inferencia no respondio a tiempo')
+                    status, payload = slot.conn.recv()
+            except (EOFError, ConnectionError, TimeoutError, OSError):
+                # la respuesta pudo quedar a medias en el socket: la conexion ya no sirve
+                slot.broken = True
+                failed = slot.index
+                if attempt:
+                    raise
+                continue
+            finally:
+                self._release(slot)
+
+            if status != 'ok':
+                raise RuntimeError(payload)
+            BATCH_SIZE.observe(count)
+            return payload
+
+    def predict_tensors(self, tensors, max_batch_size=None):
+        max_batch_size = min(max_batch_size or self.max_batch_size, self.max_batch_size)
+
+        def copy_into(chunk):
+            def fill(batch):
+                for index, tensor in enumerate(chunk):
+                    batch[index].copy_(tensor)
+            return fill
+
+        results = []
+        for start in range(0, len(tensors), max_batch_size):
+            chunk = tensors[start:start + max_batch_size]
+            results.extend(self._run_chunk(copy_into(chunk), len(chunk)))
+        return results
+
+    def predict_batch(self, image_paths, max_batch_size=None):
+        max_batch_size = min(max_batch_size or self.max_batch_size, self.max_batch_size)
+        image_paths = list(image_paths)
+
+        results = []
+        for start in range(0, len(image_paths), max_batch_size):
+            chunk = image_paths[start:start + max_batch_size]
+            # decodifica directo en la memoria compartida, sin tensor intermedio
+            results.extend(self._run_chunk(
+                lambda batch, chunk=chunk: self.preprocessor.preprocess_into(chunk, batch),
+                len(chunk)
+            ))
+        return results
+
+    def predict(self, image_path_or_pil):
+        return self.predict_batch([image_path_or_pil])[0]
@@ -0,0 +1,100 @@
+# predictorThing/staging.py
+import secrets
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .detection import faces_for_storage
+from .jobs import enqueue
+from .models import BackgroundJob, StagedPrediction
+from .predictor import EMBEDDING_KEY, MODEL_VERSION_KEY, TASKS
+
+# cuanto vive un token de prediccion sin confirmar
+DEFAULT_TOKEN_TTL = 15 * 60
+
+# cada cuanto se borran los tokens vencidos (trabajo purge_staged_predictions)
+DEFAULT_PURGE_INTERVAL = 60
+
+
+class TokenExpired(Exception):
+    """el token no existe, ya se uso o ya vencio"""
+
+
+def stage(results, image_file=None):
+    """
+    guarda el resultado (y opcionalmente el upload, ya en su ruta final) y regresa
+    el token con el que /api/save/ lo confirma
+    """
+    ttl = getattr(settings, 'PREDICTION_TOKEN_TTL', DEFAULT_TOKEN_TTL)
+    embedding = results.get(EMBEDDING_KEY)
+    staged_results = {task: results[task] for task in TASKS}
+    staged_results[MODEL_VERSION_KEY] = results.get(MODEL_VERSION_KEY, '')
+    if results.get('faces') is not None:
+        staged_results['faces'] = faces_for_storage(results['faces'])
+
+    staged = StagedPrediction(
+        token=secrets.token_urlsafe(24),
+        results=staged_results,
+        embedding=np.asarray(embedding, dtype=np.float16).tobytes() if embedding is not None else None,
+        expires_at=timezone.now() + timedelta(seconds=ttl),
+    )
+    if image_file is not None:
+        image_file.seek(0)
+        staged.image_name = image_file.name
+        staged.image.save(image_file.name, image_file, save=False)
+    staged.save(force_insert=True)
+    return staged.token
+
+
+def claim(token):
+    """
+    toma el token dentro de la transaccion actual (queda borrado al hacer commit);
+    regresa (results, nombre de la imagen en el storage o '', nombre original)
+    """
+    staged = (
+        StagedPrediction.objects.select_for_update()
+        .filter(token=token, expires_at__gt=timezone.now())
+        .first()
+    )
+    if staged is None:
+        raise TokenExpired(token)
+
+    results = dict(staged.results)
+    if staged.embedding:
+        results[EMBEDDING_KEY] = np.frombuffer(bytes(staged.embedding), dtype=np.float16)
+
+    # la imagen pasa a ser del analisis, asi que solo se borra la fila
+    StagedPrediction.objects.filter(token=token).delete()
+    return results, staged.image.name or '', staged.image_name
+
+
+def purge_expired(limit=500):
+    """borra los tokens vencidos y sus imagenes; regresa cuantos se borraron"""
+    expired = list(
+        StagedPrediction.objects.filter(expires_at__lte=timezone.now())
+        .values_list('token', 'image')[:limit]
+    )
+    if not expired:
+        return 0
+
+    with transaction.atomic():
+        StagedPrediction.objects.filter(token__in=[token for token, _ in expired]).delete()
+
+    for _, name in expired:
+        if name:
+            default_storage.delete(name)
+    return len(expired)
+
+
+def schedule_purge(interval=None):
+    """encola la siguiente limpieza de tokens vencidos si no hay una pendiente"""
+    interval = interval or getattr(settings, 'PREDICTION_TOKEN_PURGE_INTERVAL', DEFAULT_PURGE_INTERVAL)
+    if not interval:
+        return None
+    if BackgroundJob.objects.filter(kind='purge_staged_predictions', status=BackgroundJob.PENDING).exists():
+        return None
+    return enqueue('purge_staged_predictions', delay=timedelta(seconds=interval))
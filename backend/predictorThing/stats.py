@@ -0,0 +1,168 @@
+# predictorThing/stats.py
+from datetime import timedelta
+from itertools import chain
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .jobs import enqueue
+from .models import ATTRIBUTES, CONFIDENCE_BUCKETS, BackgroundJob, DailyAnalysisDelta, DailyAnalysisSummary, FaceAnalysis
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+# deltas plegados por transaccion
+DEFAULT_FOLD_BATCH_SIZE = 5000
+
+SUMMARY_FIELDS = ['created_at', 'average_confidence', 'min_confidence'] + ATTRIBUTES + [
+    f'{attr}_confidence' for attr in ATTRIBUTES
+]
+
+
+def rebuild_daily_summaries(start=None, end=None):
+    """
+    recalcula desde cero los resumenes diarios en [start, end] (fechas locales);
+    sirve para el backfill inicial o si algo se salto el conteo incremental
+    """
+    # los deltas que se escriban durante el recorrido no estan contados en las filas
+    # leidas: el borrado de abajo solo toca los que ya existian antes de empezar
+    last_delta = DailyAnalysisDelta.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+    # __date convierte a la zona horaria local, igual que timezone.localdate
+    queryset = FaceAnalysis.objects.all()
+    if start:
+        queryset = queryset.filter(created_at__date__gte=start)
+    if end:
+        queryset = queryset.filter(created_at__date__lte=end)
+
+    summaries = {}
+    for row in queryset.values(*SUMMARY_FIELDS).iterator(chunk_size=2000):
+        date = timezone.localdate(row['created_at'])
+        summary = summaries.get(date)
+        if summary is None:
+            summary = summaries[date] = DailyAnalysisSummary(date=date)
+        summary._add(SimpleNamespace(**row), 1)
+
+    with transaction.atomic():
+        # los deltas pendientes del rango ya estan contados en las filas
+        for stale in (DailyAnalysisSummary.objects.all(), DailyAnalysisDelta.objects.filter(id__lte=last_delta)):
+            if start:
+                stale = stale.filter(date__gte=start)
+            if end:
+                stale = stale.filter(date__lte=end)
+            stale.delete()
+        DailyAnalysisSummary.objects.bulk_create(summaries.values(), batch_size=500)
+
+    return len(summaries)
+
+
+def fold_daily_deltas(batch_size=DEFAULT_FOLD_BATCH_SIZE):
+    """
+    pliega los deltas pendientes en DailyAnalysisSummary, un lote por transaccion;
+    solo aqui se bloquea la fila del dia. regresa cuantos deltas plego
+    """
+    folded = 0
+    while True:
+        with transaction.atomic():
+            deltas = list(
+                DailyAnalysisDelta.objects.select_for_update(skip_locked=True).order_by('id')[:batch_size]
+            )
+            if not deltas:
+                break
+
+            by_date = {}
+            for delta in deltas:
+                merged = by_date.get(delta.date)
+                if merged is None:
+                    merged = by_date[delta.date] = DailyAnalysisDelta(date=delta.date)
+                merged._merge(delta)
+
+            for date in sorted(by_date):
+                summary, _ = DailyAnalysisSummary.objects.select_for_update().get_or_create(date=date)
+                summary._merge(by_date[date])
+                summary.save()
+            DailyAnalysisDelta.objects.filter(pk__in=[delta.pk for delta in deltas]).delete()
+
+        folded += len(deltas)
+        if len(deltas) < batch_size:
+            break
+    return folded
+
+
+def schedule_fold(interval=None):
+    """encola el siguiente plegado si no hay uno pendiente"""
+    interval = interval or getattr(settings, 'DAILY_SUMMARY_FOLD_INTERVAL', None)
+    if not interval:
+        return None
+    if BackgroundJob.objects.filter(kind='fold_daily_summaries', status=BackgroundJob.PENDING).exists():
+        return None
+    return enqueue('fold_daily_summaries', delay=timedelta(seconds=interval))
+
+
+def histogram_percentile(histogram, percentile):
+    """percentil aproximado (a la cubeta de 1 punto) de un histograma de certeza"""
+    total = sum(histogram)
+    if total <= 0:
+        return None
+    target = total * percentile / 100
+    cumulative = 0
+    for bucket, count in enumerate(histogram):
+        cumulative += count
+        if cumulative >= target:
+            return bucket + 0.5
+    return CONFIDENCE_BUCKETS - 0.5
+
+
+def aggregate(start=None, end=None):
+    """
+    estadisticas de un rango de fechas sumando solo las filas del resumen diario
+    y los deltas que aun no se pliegan
+    """
+    summaries = DailyAnalysisSummary.objects.all()
+    deltas = DailyAnalysisDelta.objects.all()
+    if start:
+        summaries = summaries.filter(date__gte=start)
+        deltas = deltas.filter(date__gte=start)
+    if end:
+        summaries = summaries.filter(date__lte=end)
+        deltas = deltas.filter(date__lte=end)
+
+    total = 0
+    low_confidence = 0
+    average_sum = 0.0
+    class_counts = {attr: {} for attr in ATTRIBUTES}
+    histograms = {}
+
+    for summary in chain(summaries, deltas.iterator(chunk_size=2000)):
+        total += summary.total
+        low_confidence += summary.low_confidence
+        average_sum += summary.average_confidence_sum
+
+        for attr, counts in summary.class_counts.items():
+            merged = class_counts.setdefault(attr, {})
+            for label, count in counts.items():
+                merged[label] = merged.get(label, 0) + count
+
+        for key, histogram in summary.confidence_histograms.items():
+            merged = histograms.setdefault(key, [0] * CONFIDENCE_BUCKETS)
+            for bucket, count in enumerate(histogram):
+                merged[bucket] += count
+
+    return {
+        'from': start.isoformat() if start else None,
+        'to': end.isoformat() if end else None,
+        'total': total,
+        'low_confidence': low_confidence,
+        'low_confidence_rate': round(low_confidence / total, 4) if total else 0,
+        'average_confidence': round(average_sum / total, 2) if total else None,
+        'class_counts': {
+            attr: dict(sorted(((label, count) for label, count in counts.items() if count > 0),
+                              key=lambda item: -item[1]))
+            for attr, counts in class_counts.items()
+        },
+        'confidence_percentiles': {
+            key: {f'p{p}': histogram_percentile(histogram, p) for p in PERCENTILES}
+            for key, histogram in histograms.items()
+        },
+    }
@@ -0,0 +1,127 @@
+# predictorThing/tasks.py
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .cleanup import DEFAULT_SWEEP_BATCH_SIZE, DEFAULT_SWEEP_GRACE, media_names, schedule_sweep, sweep
+from .embeddings import all_embedding_stores, backfill
+from .images import DISPLAY_MAX_SIDE, open_original, save_thumbnails, save_variant
+from .jobs import job
+from .models import FaceAnalysis, StagedPrediction
+from .staging import purge_expired, schedule_purge
+from .stats import fold_daily_deltas, schedule_fold
+
+
+def _delete_unused(names):
+    """borra los archivos que ya ninguna fila usa (analisis o token pendiente)"""
+    # analyze_folder puede dejar dos filas con el mismo archivo: lo que otra fila aun usa se queda
+    in_use = set()
+    for image, derivatives in FaceAnalysis.objects.filter(image__in=names).values_list('image', 'derivatives'):
+        in_use.update(media_names(image, derivatives))
+    in_use.update(StagedPrediction.objects.filter(image__in=names).values_list('image', flat=True))
+
+    for name in names:
+        if name not in in_use:
+            # el storage de archivos ignora los que ya no existen
+            default_storage.delete(name)
+
+
+def schedule_periodic():
+    """
+    encola los trabajos que se vuelven a encolar solos (plegado del resumen diario,
+    limpieza de tokens vencidos y, si esta configurado, barrido de media) si no hay
+    uno pendiente; el worker lo llama al arrancar, asi no depende de que alguien
+    corra --schedule a mano
+    """
+    return [job for job in (schedule_fold(), schedule_purge(), schedule_sweep()) if job is not None]
+
+
+@job('make_derivatives')
+def make_derivatives(analysis_id):
+    """genera la version comprimida y las miniaturas de un analisis guardado"""
+    analysis = FaceAnalysis.objects.filter(pk=analysis_id).only('id', 'image').first()
+    if analysis is None or not analysis.image:
+        return
+
+    image = open_original(analysis.image.name)
+    derivatives = {
+        'display': save_variant(image, analysis.image.name, 'display', DISPLAY_MAX_SIDE, 'JPEG', quality=85),
+        'thumbnails': save_thumbnails(image, analysis.image.name),
+        # cambia en cada regeneracion; va en la url y el ETag de las miniaturas
+        'version': int(time.time()),
+    }
+    created = media_names('', derivatives)
+
+    with transaction.atomic():
+        previous = (
+            FaceAnalysis.objects.select_for_update().filter(pk=analysis_id)
+            .values_list('derivatives', flat=True).first()
+        )
+        if previous is not None:
+            # update directo: no toca el resumen diario ni reescribe la fila completa
+            FaceAnalysis.objects.filter(pk=analysis_id).update(derivatives=derivatives)
+
+    if previous is None:
+        # la fila se borro mientras se generaban
+        _delete_unused(created)
+        return
+    # solo las versiones que registro esta fila, nunca un archivo por su nombre
+    _delete_unused([name for name in media_names('', previous) if name not in created])
+
+
+@job('delete_media')
+def delete_media(analysis_ids, names):
+    """archivos y embeddings de analisis ya borrados; repetirlo no hace daño"""
+    _delete_unused(names)
+    # el analisis puede estar en el indice de varias versiones del modelo
+    for store in all_embedding_stores():
+        store.remove(analysis_ids)
+
+
+@job('backfill_embeddings')
+def backfill_embeddings(model_version):
+    """llena el indice de una version recien activada con los analisis ya guardados"""
+    from .registry import get_model_manager
+
+    total, failed = backfill(get_model_manager().predictor_for(model_version))
+    print(f"embeddings de {model_version}: {total} agregados, {failed} con error")
+
+
+@job('sweep_media')
+def sweep_media():
+    """barrido periodico de face_images/ contra la tabla (ver cleanup.py)"""
+    try:
+        result = sweep(
+            batch_size=getattr(settings, 'MEDIA_SWEEP_BATCH_SIZE', DEFAULT_SWEEP_BATCH_SIZE),
+            grace=getattr(settings, 'MEDIA_SWEEP_GRACE', DEFAULT_SWEEP_GRACE),
+        )
+        print(f"barrido de media: {result}")
+    finally:
+        schedule_sweep()
+
+
+@job('fold_daily_summaries')
+def fold_daily_summaries():
+    """pliega los deltas del resumen diario y se vuelve a encolar (DAILY_SUMMARY_FOLD_INTERVAL)"""
+    try:
+        folded = fold_daily_deltas()
+        if folded:
+            print(f"resumen diario: {folded} deltas plegados")
+    finally:
+        schedule_fold()
+
+
+@job('purge_staged_predictions')
+def purge_staged_predictions():
+    """borra los tokens de /api/predict/ vencidos y se vuelve a encolar (PREDICTION_TOKEN_PURGE_INTERVAL)"""
+    try:
+        purged = total = purge_expired()
+        while purged:
+            purged = purge_expired()
+            total += purged
+        if total:
+            print(f"tokens vencidos: {total} borrados")
+    finally:
+        schedule_purge()
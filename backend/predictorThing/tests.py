@@ -1,3 +1,1630 @@
-from django.test import TestCase
+import contextlib
+import io
+import json
+import os
+import pickle
+import shutil
+import time
+import tempfile
+import threading
+import zipfile
+from datetime import timedelta
+from importlib.util import find_spec
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+import torch
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from . import embeddings
+from . import predictor as predictor_module
+from .batching import MicroBatcher
+from .cache import PredictionCache, cached_predict
+from .images import derivative_name
+from . import metrics
+from .jobs import HANDLERS, STALE_AFTER, _claim, _run, job, run_pending
+from .cleanup import delete_analyses, sweep_files
+from .detection import crop_face, detect_and_classify
+from .executor import BoundedExecutor, ExecutorFull
+from .models import BackgroundJob, DailyAnalysisDelta, DailyAnalysisSummary, FaceAnalysis, StagedPrediction
+from .predictor import EMBEDDING_KEY, MODEL_INFO_PATH, TASKS, FaceAttributePredictor
+from .preprocessing import INPUT_SIZE, MEAN, STD, Preprocessor, load_image
+from .registry import ModelManager
+from .serving import InferencePoolClient
+from .staging import TokenExpired, claim, schedule_purge, stage
+from .stats import aggregate, fold_daily_deltas, rebuild_daily_summaries
+from .tasks import delete_media, make_derivatives, purge_staged_predictions
+from .video import FrameDeduplicator, VideoAnalyzer, iter_sequence_frames, iter_video_frames
+
+
+def _image_bytes(format, size=(640, 480)):
+    """gradiente con ruido: tiene detalle para que el resize importe, sin ser ruido puro"""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:size[1], 0:size[0]]
+    pixels = np.stack([x / size[0] * 255, y / size[1] * 255, (x + y) / sum(size) * 255], axis=-1)
+    pixels = (pixels + rng.normal(0, 8, pixels.shape)).clip(0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format, quality=95)
+    return buffer.getvalue()
+
+
+class PreprocessingParityTests(SimpleTestCase):
+    """el preprocesado nuevo contra el Compose de torchvision que reemplazo"""
+
+    def setUp(self):
+        from torchvision import transforms
+
+        self.compose = transforms.Compose([
+            transforms.Resize(INPUT_SIZE),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=MEAN, std=STD),
+        ])
+        self.preprocessor = Preprocessor()
+
+    def _diff(self, data):
+        old = self.compose(Image.open(io.BytesIO(data)).convert('RGB'))
+        new = self.preprocessor(Image.open(io.BytesIO(data)))
+        self.assertEqual(tuple(old.shape), tuple(new.shape))
+        return (old - new).abs()
+
+    def test_png_matches_compose(self):
+        diff = self._diff(_image_bytes('PNG'))
+        self.assertLess(diff.max().item(), 1e-3)
+
+    def test_jpeg_draft_stays_close_to_compose(self):
+        # el draft decodifica a 1/2 por DCT: difiere unos cuantos niveles de gris como mucho
+        diff = self._diff(_image_bytes('JPEG'))
+        self.assertLess(diff.mean().item(), 0.03)
+        self.assertLess(diff.max().item(), 0.25)
+
+
+class LoadImageTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'face.jpg')
+        with open(self.path, 'wb') as f:
+            f.write(_image_bytes('JPEG', size=(1600, 1200)))
+
+    def test_any_source_becomes_rgb_uint8_of_input_size(self):
+        rgba = io.BytesIO()
+        Image.new('RGBA', (300, 200), (10, 20, 30, 128)).save(rgba, 'PNG')
+        sources = {
+            'path': self.path,
+            'bytes': _image_bytes('JPEG'),
+            'png_rgba': rgba.getvalue(),
+            'pil_gray': Image.new('L', (100, 400), 90),
+            'already_sized': Image.new('RGB', INPUT_SIZE),
+        }
+        for name, source in sources.items():
+            with self.subTest(source=name):
+                image = load_image(source)
+                pixels = np.asarray(image)
+                self.assertEqual(image.mode, 'RGB')
+                self.assertEqual(pixels.shape, (INPUT_SIZE[1], INPUT_SIZE[0], 3))
+                self.assertEqual(pixels.dtype, np.uint8)
+
+    def test_preprocessor_buffer_matches_load_image(self):
+        pixels = torch.from_numpy(np.asarray(load_image(self.path), dtype=np.float32)).permute(2, 0, 1)
+        expected = (pixels / 255 - torch.tensor(MEAN).view(3, 1, 1)) / torch.tensor(STD).view(3, 1, 1)
+
+        preprocessor = Preprocessor()
+        batch = preprocessor.preprocess_batch([self.path, self.path])
+
+        self.assertEqual(tuple(batch.shape), (2, 3, INPUT_SIZE[1], INPUT_SIZE[0]))
+        self.assertEqual(batch.dtype, torch.float32)
+        self.assertLess((batch[0] - expected).abs().max().item(), 1e-5)
+        self.assertTrue(torch.equal(batch[0], batch[1]))
+        # el tensor suelto (memoria propia) es el mismo que la fila del buffer
+        self.assertTrue(torch.equal(preprocessor(self.path), batch[0]))
+
+
+@override_settings(PREDICTION_CACHE_ENABLED=True, PREDICTION_CACHE_BACKEND=None)
+class CachedPredictTests(SimpleTestCase):
+
+    def setUp(self):
+        self.predictor = mock.Mock(model_version='test')
+        patcher = mock.patch('predictorThing.cache.get_predictor', return_value=self.predictor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('predictorThing.cache.prediction_cache', PredictionCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_predicts_on_reduced_image(self):
+        seen = []
+
+        def predict(image):
+            seen.append(image.size)
+            return {'value': 1}
+
+        data = _image_bytes('JPEG', size=(2000, 1500))
+        image = Image.open(io.BytesIO(data))
+        self.assertEqual(cached_predict(image, predict), {'value': 1})
+        self.assertEqual(seen, [INPUT_SIZE])
+        # el draft se aplico antes de decodificar: el original nunca se cargo a 2000x1500
+        self.assertLess(image.size[0], 2000)
+
+    def test_same_upload_hits_cache(self):
+        predict = mock.Mock(return_value={'value': 1})
+        data = _image_bytes('JPEG')
+        cached_predict(Image.open(io.BytesIO(data)), predict)
+        cached_predict(Image.open(io.BytesIO(data)), predict)
+        self.assertEqual(predict.call_count, 1)
+
+    def test_result_is_keyed_by_the_version_that_produced_it(self):
+        data = _image_bytes('JPEG')
+        # el global ya es 'new' pero el batcher todavia corrio la version vieja
+        self.predictor.model_version = 'new'
+        stale = mock.Mock(return_value={'value': 'old result', 'model_version': 'old'})
+        cached_predict(Image.open(io.BytesIO(data)), stale)
+
+        fresh = mock.Mock(return_value={'value': 'new result', 'model_version': 'new'})
+        self.assertEqual(cached_predict(Image.open(io.BytesIO(data)), fresh)['value'], 'new result')
+        self.assertEqual(cached_predict(Image.open(io.BytesIO(data)), fresh)['value'], 'new result')
+        self.assertEqual(fresh.call_count, 1)
+
+
+# nombres que daba LabelEncoder.inverse_transform con label_encoders.pkl, por indice
+OLD_LABELS = {
+    'sex': ['Female', 'Male'],
+    'eyes': ['Black', 'Blue', 'Brown', 'Gray', 'Green', 'Hazel', 'Maroon'],
+    'race': ['Amer Indian', 'Asian', 'Bi-Racial', 'Black', 'Hispanic', 'White'],
+    'hair': ['Bald', 'Black', 'Blonde or Strawberry', 'Brown', 'Gray or Partially Gray',
+             'Red or Auburn', 'Salt and Pepper', 'White'],
+}
+
+
+class PostprocessTests(SimpleTestCase):
+    """la decodificacion vectorizada contra la del predictor original (argmax + inverse_transform)"""
+
+    def setUp(self):
+        # solo las tablas de model_info.json, sin checkpoint
+        self.predictor = FaceAttributePredictor.__new__(FaceAttributePredictor)
+        self.predictor.model_info_path = MODEL_INFO_PATH
+        self.predictor.model_version = 'test'
+        self.predictor._load_labels()
+
+    def _logits(self, winners):
+        """logits fijos [N, clases] donde la clase winners[i] gana en la fila i"""
+        outputs = {}
+        for task in TASKS:
+            size = len(OLD_LABELS[task])
+            logits = torch.linspace(-1.0, 1.0, size).repeat(len(winners), 1)
+            for row, winner in enumerate(winners):
+                logits[row, winner % size] = 3.0 + row
+            outputs[task] = logits
+        return outputs
+
+    def test_label_table_keeps_old_order(self):
+        self.assertEqual(self.predictor.class_names, OLD_LABELS)
+
+    @skipUnless(find_spec('sklearn'), 'scikit-learn no esta instalado')
+    def test_old_encoders_have_same_classes(self):
+        with open(MODEL_INFO_PATH.parent / 'label_encoders.pkl', 'rb') as f:
+            encoders = pickle.load(f)
+        self.assertEqual({task: list(encoders[task].classes_) for task in TASKS}, OLD_LABELS)
+
+    def test_matches_per_image_decoding(self):
+        winners = [0, 1, 5]
+        outputs = self._logits(winners)
+
+        results = self.predictor._postprocess(outputs)
+
+        self.assertEqual(len(results), len(winners))
+        for row, result in enumerate(results):
+            self.assertEqual(result['model_version'], 'test')
+            self.assertNotIn(EMBEDDING_KEY, result)
+            for task in TASKS:
+                # el calculo del predictor original, imagen por imagen
+                probs = torch.softmax(outputs[task][row:row + 1], dim=1)
+                index = torch.argmax(probs, dim=1).item()
+                with self.subTest(row=row, task=task):
+                    self.assertEqual(result[task]['prediction'], OLD_LABELS[task][index])
+                    self.assertEqual(index, winners[row] % len(OLD_LABELS[task]))
+                    self.assertAlmostEqual(result[task]['confidence'], round(probs[0][index].item() * 100, 2), delta=0.01)
+                    self.assertEqual(len(result[task]['probabilities']), len(OLD_LABELS[task]))
+                    self.assertAlmostEqual(sum(result[task]['probabilities']), 100, delta=0.05)
+                    self.assertEqual(max(result[task]['probabilities']), result[task]['confidence'])
+
+    def test_embedding_is_unit_float16(self):
+        outputs = self._logits([0, 1])
+        outputs[EMBEDDING_KEY] = torch.arange(2 * 4, dtype=torch.float32).reshape(2, 4) + 1
+
+        results = self.predictor._postprocess(outputs)
+
+        for result in results:
+            self.assertEqual(result[EMBEDDING_KEY].dtype, np.float16)
+            self.assertAlmostEqual(float(np.linalg.norm(result[EMBEDDING_KEY].astype(np.float32))), 1.0, places=2)
+
+
+class PredictorPickleTests(SimpleTestCase):
+
+    def test_round_trip_rebuilds_preprocessor_and_predicts_the_same(self):
+        from .benchmarks import random_predictor
+
+        predictor = random_predictor(max_batch_size=2)
+        tensors = [torch.randn(3, *INPUT_SIZE) for _ in range(2)]
+        expected = predictor.predict_tensors(tensors)
+
+        # lo que hace el pool al mandarlo a un worker (spawn)
+        copy = pickle.loads(pickle.dumps(predictor))
+
+        self.assertIsNot(copy.preprocessor, predictor.preprocessor)
+        self.assertEqual(copy.model_version, predictor.model_version)
+        self.assertEqual(copy.class_names, predictor.class_names)
+        for got, want in zip(copy.predict_tensors(tensors), expected):
+            for task in TASKS:
+                self.assertEqual(got[task]['prediction'], want[task]['prediction'])
+                self.assertAlmostEqual(got[task]['confidence'], want[task]['confidence'], delta=0.01)
+
+
+class QuantizationReportTests(SimpleTestCase):
+    """quantization_report con un predictor falso: solo importa que imagenes calibran y cuales se evaluan"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        for i in range(20):
+            with open(os.path.join(self.root, f'{i:02d}.png'), 'wb') as f:
+                f.write(b'')
+        self.evaluated = []
+        self.calibration = []
+        test = self
+
+        class FakePredictor:
+            model = torch.nn.Identity()
+
+            def __init__(self, calibration_dir=None, **kwargs):
+                if calibration_dir:
+                    test.calibration.extend(str(p) for p in calibration_dir)
+
+            def preprocess(self, path):
+                test.evaluated.append(path)
+                return path
+
+            def predict_tensors(self, tensors):
+                return [fake_results() for _ in tensors]
+
+        patcher = mock.patch(
+            'predictorThing.management.commands.quantization_report.FaceAttributePredictor', FakePredictor
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_report(self, *args):
+        out = io.StringIO()
+        call_command('quantization_report', self.root, '--quantization', 'static', '--json', *args, stdout=out)
+        return json.loads(out.getvalue())
+
+    def test_default_holds_out_calibration_images(self):
+        report = self.run_report()
+
+        self.assertEqual(report['calibration']['source'], 'holdout')
+        self.assertEqual(len(self.calibration), 4)
+        self.assertFalse(set(self.calibration) & set(self.evaluated))
+        self.assertEqual(report['images'], 16)
+        self.assertEqual(len(self.evaluated), 16)
+
+    def test_calibration_dir_images_are_not_evaluated(self):
+        calibration_dir = os.path.join(self.root, 'calib')
+        os.makedirs(calibration_dir)
+        for i in range(3):
+            with open(os.path.join(calibration_dir, f'c{i}.png'), 'wb') as f:
+                f.write(b'')
+
+        report = self.run_report('--calibration-dir', calibration_dir)
+
+        self.assertEqual(report['calibration']['images'], 3)
+        self.assertEqual(report['calibration']['excluded_from_evaluation'], 3)
+        self.assertEqual(report['images'], 20)
+        self.assertFalse(set(self.calibration) & set(self.evaluated))
+
+
+class GetPredictorTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(predictor_module, 'predictor', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_concurrent_first_calls_load_once(self):
+        created = []
+
+        def slow_create():
+            time.sleep(0.05)
+            created.append(object())
+            return created[-1]
+
+        got = []
+        with mock.patch.object(predictor_module, '_create_global_predictor', side_effect=slow_create):
+            threads = [threading.Thread(target=lambda: got.append(predictor_module.get_predictor())) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(created), 1)
+        self.assertEqual(got, created * 8)
+
+    def test_requests_do_not_check_the_registry(self):
+        predictor_module.predictor = mock.Mock(spec=FaceAttributePredictor)
+        with mock.patch('predictorThing.registry.get_model_manager') as get_manager:
+            for _ in range(3):
+                predictor_module.get_predictor()
+
+        manager = get_manager.return_value
+        manager.maybe_reload.assert_not_called()
+        self.assertEqual(manager.ensure_watching.call_count, 3)
+
+
+class ModelWatcherTests(SimpleTestCase):
+
+    def test_watcher_thread_reloads_on_registry_change(self):
+        registry = mock.Mock()
+        registry.stamp.return_value = 1
+        registry.state.return_value = {'active': 'v1', 'shadow': None, 'shadow_rate': 0}
+        manager = ModelManager(registry, reload_interval=0.02)
+        manager.initial_options()
+        # que el hilo que queda vivo al terminar no vuelva a revisar
+        self.addCleanup(setattr, manager, 'reload_interval', 3600)
+
+        started = threading.Event()
+        with mock.patch.object(manager, '_start', side_effect=lambda version, install: started.set()) as start:
+            before = threading.active_count()
+            manager.ensure_watching()
+            manager.ensure_watching()
+            self.assertEqual(threading.active_count(), before + 1)
+
+            registry.stamp.return_value = 2
+            registry.state.return_value = {'active': 'v2', 'shadow': None, 'shadow_rate': 0}
+            self.assertTrue(started.wait(2))
+
+        self.assertEqual(start.call_args.args[0], 'v2')
+
+        # tras un fork el pid cambia y el hilo se vuelve a arrancar
+        with mock.patch('predictorThing.registry.threading.Thread') as thread, \
+                mock.patch('predictorThing.registry.os.getpid', return_value=-1):
+            manager.ensure_watching()
+        thread.return_value.start.assert_called_once()
+
+
+class InferencePoolClientTests(SimpleTestCase):
+    """el pool de conexiones del cliente, sin workers: _open regresa slots falsos"""
+
+    def setUp(self):
+        self.opened = []
+
+        def fake_open(client, index):
+            slot = mock.Mock(index=index, broken=False, pid=os.getpid())
+            self.opened.append(slot)
+            return slot
+
+        patcher = mock.patch.object(InferencePoolClient, '_open', autospec=True, side_effect=fake_open)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _client(self, num_workers, max_connections):
+        client = InferencePoolClient('/tmp/unused', num_workers, max_batch_size=1,
+                                     timeout=0.1, max_connections=max_connections)
+        self.addCleanup(client.close)
+        return client
+
+    def test_checkout_goes_to_least_busy_worker(self):
+        client = self._client(num_workers=3, max_connections=6)
+
+        first = [client._checkout() for _ in range(3)]
+        self.assertEqual(sorted(slot.index for slot in first), [0, 1, 2])
+
+        busy = next(slot for slot in first if slot.index == 1)
+        client._release(busy)
+        self.assertEqual(client._in_flight, [1, 0, 1])
+
+        again = client._checkout()
+        # el worker libre, y reusando su conexion en vez de abrir otra
+        self.assertIs(again, busy)
+        self.assertEqual(len(self.opened), 3)
+
+    def test_avoid_skips_the_worker_that_just_failed(self):
+        client = self._client(num_workers=2, max_connections=4)
+        for _ in range(10):
+            slot = client._checkout(avoid=0)
+            self.assertEqual(slot.index, 1)
+            client._release(slot)
+
+    def test_full_pool_evicts_idle_connection_of_other_worker(self):
+        client = self._client(num_workers=2, max_connections=1)
+        slot = client._checkout()
+        client._release(slot)
+
+        other = client._checkout(avoid=slot.index)
+
+        self.assertNotEqual(other.index, slot.index)
+        slot.close.assert_called_once()
+        self.assertEqual(client._opened, 1)
+        with self.assertRaises(TimeoutError):
+            client._checkout()
+
+    def test_fork_forgets_parent_connections(self):
+        client = self._client(num_workers=2, max_connections=2)
+        parent_slots = [client._checkout() for _ in range(2)]
+
+        # como si este proceso fuera el hijo de un fork
+        client._pid = os.getpid() + 1
+        for slot in parent_slots:
+            slot.pid = client._pid
+        slot = client._checkout()
+
+        self.assertNotIn(slot, parent_slots)
+        self.assertEqual(client._opened, 1)
+        self.assertEqual(sum(client._in_flight), 1)
+        # los del padre no se cierran (el segmento es del padre) ni cuentan al regresarlos
+        for parent_slot in parent_slots:
+            client._release(parent_slot)
+            parent_slot.close.assert_not_called()
+        self.assertEqual(sum(client._in_flight), 1)
+
+
+class MetricsMiddlewareTests(SimpleTestCase):
+
+    def _count(self, **labels):
+        return metrics.REQUESTS_TOTAL.snapshot().get(metrics.REQUESTS_TOTAL._key(labels), 0)
+
+    def test_counts_request_by_endpoint_method_and_outcome(self):
+        before = self._count(endpoint='health_check', method='GET', outcome='ok')
+        latency = metrics.REQUEST_SECONDS.snapshot().get(('health_check',), [None, 0, 0])[2]
+
+        self.client.get('/api/health/')
+
+        self.assertEqual(self._count(endpoint='health_check', method='GET', outcome='ok'), before + 1)
+        self.assertEqual(metrics.REQUEST_SECONDS.snapshot()[('health_check',)][2], latency + 1)
+
+    def test_unknown_method_and_url_do_not_create_new_series(self):
+        before = self._count(endpoint='unmatched', method='other', outcome='client_error')
+
+        for method in ('FOO', 'BAR'):
+            self.client.generic(method, '/no-such-page/')
+
+        self.assertEqual(self._count(endpoint='unmatched', method='other', outcome='client_error'), before + 2)
+        methods = {key[1] for key in metrics.REQUESTS_TOTAL.snapshot()}
+        self.assertNotIn('FOO', methods)
+
+    def test_timing_header_only_when_requested(self):
+        self.assertNotIn('X-Timing', self.client.get('/api/health/'))
+        response = self.client.get('/api/health/', headers={'X-Timing': '1'})
+        self.assertRegex(response['X-Timing'], r'total;dur=\d+\.\d{2}$')
+
+
+class MultiprocessMetricsTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        settings = override_settings(METRICS_MULTIPROC_DIR=self.directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # sin el hilo de flush: seguiria escribiendo al directorio ya borrado
+        patcher = mock.patch.object(metrics, 'flusher')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _other_worker(self, pid, **data):
+        with open(os.path.join(self.directory, f'metrics_{pid}.json'), 'w') as f:
+            json.dump(data, f)
+
+    def test_scrape_sums_every_worker(self):
+        metrics.REQUESTS_TOTAL.inc(endpoint='mp_test', method='GET', outcome='ok')
+        mine = metrics.REQUESTS_TOTAL.snapshot()[('mp_test', 'GET', 'ok')]
+        mine_batches = metrics.BATCH_SIZE.snapshot().get((), [[0] * 9, 0.0, 0])
+        self._other_worker(
+            999999,
+            reciface_requests_total=[[['mp_test', 'GET', 'ok'], 5], [['mp_only_there', 'POST', 'ok'], 2]],
+            reciface_batch_size=[[[], [[0, 0, 0, 3, 0, 0, 0, 0, 0], 24.0, 3]]],
+            reciface_model_load_seconds=[[['torch'], 1e9]],
+        )
+
+        text = self.client.get('/metrics').content.decode()
+
+        self.assertIn(f'reciface_requests_total{{endpoint="mp_test",method="GET",outcome="ok"}} {mine + 5}', text)
+        self.assertIn('reciface_requests_total{endpoint="mp_only_there",method="POST",outcome="ok"} 2', text)
+        self.assertIn(f'reciface_batch_size_count {mine_batches[2] + 3}', text)
+        self.assertIn('reciface_model_load_seconds{backend="torch"} 1000000000.0', text)
+        # el proceso que contesta tambien dejo su archivo
+        self.assertTrue(os.path.exists(os.path.join(self.directory, f'metrics_{os.getpid()}.json')))
+
+    def test_unreadable_snapshot_is_skipped(self):
+        with open(os.path.join(self.directory, 'metrics_1.json'), 'w') as f:
+            f.write('{"reciface_requests_total": [[')
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+class StubPredictor:
+    """preprocess deja pasar la imagen; predict_tensors anota cada forward"""
+
+    def __init__(self, name='stub', error=None):
+        self.name = name
+        self.error = error
+        self.calls = []
+
+    def preprocess(self, image):
+        return image
+
+    def predict_tensors(self, tensors, max_batch_size=None):
+        self.calls.append(list(tensors))
+        if self.error is not None:
+            raise self.error
+        return [{'value': tensor, 'model': self.name} for tensor in tensors]
+
+
+class MicroBatcherTests(SimpleTestCase):
+
+    def _batcher(self, predictor, **options):
+        batcher = MicroBatcher(predictor, **options)
+        self.addCleanup(batcher.close)
+        return batcher
+
+    def test_requests_inside_window_share_one_forward(self):
+        predictor = StubPredictor()
+        batcher = self._batcher(predictor, max_batch_size=8, window_ms=200)
+
+        futures = [batcher.submit(n) for n in range(3)]
+
+        self.assertEqual([future.result(timeout=5)['value'] for future in futures], [0, 1, 2])
+        self.assertEqual(predictor.calls, [[0, 1, 2]])
+        self.assertEqual(batcher.stats()['batch_sizes'], {3: 1})
+
+    def test_batches_are_capped_at_max_batch_size(self):
+        predictor = StubPredictor()
+        batcher = self._batcher(predictor, max_batch_size=2, window_ms=200)
+
+        futures = [batcher.submit(n) for n in range(5)]
+
+        self.assertEqual([future.result(timeout=5)['value'] for future in futures], list(range(5)))
+        self.assertEqual(predictor.calls, [[0, 1], [2, 3], [4]])
+
+    def test_items_are_grouped_by_the_predictor_that_preprocessed_them(self):
+        old, new = StubPredictor('old'), StubPredictor('new')
+        batcher = self._batcher(old, window_ms=200)
+
+        first = batcher.submit('a')
+        # cambio de version a media ventana: el encolado sigue con el predictor viejo
+        batcher.predictor = new
+        second = batcher.submit('b')
+
+        self.assertEqual(first.result(timeout=5), {'value': 'a', 'model': 'old'})
+        self.assertEqual(second.result(timeout=5), {'value': 'b', 'model': 'new'})
+        self.assertEqual((old.calls, new.calls), ([['a']], [['b']]))
+        self.assertEqual(batcher.stats()['batches'], 1)
+
+    def test_forward_error_reaches_every_future_of_its_group(self):
+        broken, healthy = StubPredictor(error=RuntimeError('boom')), StubPredictor()
+        batcher = self._batcher(broken, window_ms=200)
+
+        failing = [batcher.submit(n) for n in range(2)]
+        batcher.predictor = healthy
+        ok = batcher.submit(2)
+
+        for future in failing:
+            with self.assertRaisesRegex(RuntimeError, 'boom'):
+                future.result(timeout=5)
+        self.assertEqual(ok.result(timeout=5)['value'], 2)
+        self.assertEqual(batcher.stats()['errors'], 1)
+
+    def test_close_serves_queued_items_then_stops(self):
+        predictor = StubPredictor()
+        batcher = MicroBatcher(predictor, window_ms=200)
+
+        futures = [batcher.submit(n) for n in range(2)]
+        batcher.close()
+
+        self.assertFalse(batcher._thread.is_alive())
+        self.assertEqual([future.result(timeout=0)['value'] for future in futures], [0, 1])
+
+
+def make_analysis(image='face_images/test.jpg', confidence=90.0, **fields):
+    values = {
+        'image': image,
+        'sex': 'Male', 'eyes': 'Brown', 'race': 'White', 'hair': 'Black',
+        'sex_confidence': confidence, 'eyes_confidence': confidence,
+        'race_confidence': confidence, 'hair_confidence': confidence,
+    }
+    values.update(fields)
+    return FaceAnalysis.objects.create(**values)
+
+
+class TempMediaMixin:
+    """MEDIA_ROOT en un directorio temporal que se borra al terminar"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def save_image(self, name, size=(64, 48)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (200, 100, 50)).save(buffer, 'JPEG')
+        return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+class DailySummaryTests(TestCase):
+
+    def test_record_appends_deltas_without_touching_summary(self):
+        make_analysis()
+        make_analysis(confidence=50.0)
+        self.assertFalse(DailyAnalysisSummary.objects.exists())
+        self.assertEqual(DailyAnalysisDelta.objects.count(), 2)
+
+        stats = aggregate()
+        self.assertEqual(stats['total'], 2)
+        self.assertEqual(stats['low_confidence'], 1)
+        self.assertEqual(stats['class_counts']['sex'], {'Male': 2})
+
+    def test_fold_matches_rebuild(self):
+        make_analysis()
+        second = make_analysis(sex='Female', confidence=60.0)
+        make_analysis(confidence=40.0)
+        second.delete()
+
+        self.assertEqual(fold_daily_deltas(batch_size=2), 4)
+        self.assertFalse(DailyAnalysisDelta.objects.exists())
+        folded = DailyAnalysisSummary.objects.get(date=timezone.localdate())
+        self.assertEqual(aggregate()['class_counts']['sex'], {'Male': 2})
+
+        rebuild_daily_summaries()
+        rebuilt = DailyAnalysisSummary.objects.get(date=timezone.localdate())
+        self.assertEqual(
+            (folded.total, folded.low_confidence, folded.class_counts, folded.confidence_histograms),
+            (rebuilt.total, rebuilt.low_confidence, rebuilt.class_counts, rebuilt.confidence_histograms),
+        )
+
+
+    def test_rebuild_keeps_deltas_written_during_scan(self):
+        make_analysis()
+        add = DailyAnalysisSummary._add
+        arrived = []
+
+        def add_and_save_another(summary, analysis, sign):
+            # un request guarda otro analisis mientras el rebuild recorre la tabla
+            if not arrived:
+                arrived.append(make_analysis(sex='Female'))
+            return add(summary, analysis, sign)
+
+        with mock.patch.object(DailyAnalysisSummary, '_add', add_and_save_another):
+            rebuild_daily_summaries()
+
+        self.assertEqual(DailyAnalysisDelta.objects.count(), 1)
+        stats = aggregate()
+        self.assertEqual(stats['total'], 2)
+        self.assertEqual(stats['class_counts']['sex'], {'Male': 1, 'Female': 1})
+
+    def test_worker_start_schedules_fold_once(self):
+        for _ in range(2):
+            call_command('run_jobs', '--once', stdout=io.StringIO())
+        self.assertEqual(
+            BackgroundJob.objects.filter(kind='fold_daily_summaries', status=BackgroundJob.PENDING).count(), 1
+        )
+
+class DerivativeTests(TempMediaMixin, TestCase):
+
+    def test_does_not_overwrite_upload_with_derivative_name(self):
+        original = self.save_image('face_images/foo.jpg')
+        # un upload del usuario que casualmente se llama como la version display
+        upload = self.save_image(derivative_name(original, 'display', 'JPEG'))
+        with default_storage.open(upload, 'rb') as f:
+            upload_bytes = f.read()
+        analysis = make_analysis(image=original)
+
+        make_derivatives(analysis_id=analysis.pk)
+
+        analysis.refresh_from_db()
+        self.assertNotEqual(analysis.derivatives['display'], upload)
+        with default_storage.open(upload, 'rb') as f:
+            self.assertEqual(f.read(), upload_bytes)
+
+    def test_regeneration_deletes_only_previous_versions(self):
+        analysis = make_analysis(image=self.save_image('face_images/bar.jpg'))
+        make_derivatives(analysis_id=analysis.pk)
+        analysis.refresh_from_db()
+        first = analysis.derivatives
+
+        make_derivatives(analysis_id=analysis.pk)
+        analysis.refresh_from_db()
+
+        self.assertFalse(default_storage.exists(first['display']))
+        self.assertTrue(default_storage.exists(analysis.derivatives['display']))
+        self.assertTrue(default_storage.exists(analysis.image.name))
+
+
+class ThumbnailTests(TempMediaMixin, TestCase):
+
+    def _get(self, url, **headers):
+        response = self.client.get(url, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, body
+
+    def test_listing_url_serves_thumbnail_then_304(self):
+        analysis = make_analysis(image=self.save_image('face_images/thumb.jpg', size=(800, 600)))
+        make_derivatives(analysis_id=analysis.pk)
+
+        row = self.client.get('/api/analyses/').json()['data'][0]
+        self.assertIn(f'/api/thumbnails/{analysis.pk}/256.webp?v=', row['thumbnail_url'])
+
+        response, body = self._get(f'/api/thumbnails/{analysis.pk}/256.webp')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(Image.open(io.BytesIO(body)).size, (256, 192))
+        etag = response['ETag']
+
+        cached, body = self._get(f'/api/thumbnails/{analysis.pk}/256.webp', if_none_match=etag)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual((cached['ETag'], body), (etag, b''))
+
+        # otra version (o de otro formato) no cuenta como la misma
+        stale, _ = self._get(f'/api/thumbnails/{analysis.pk}/256.jpg', if_none_match=etag)
+        self.assertEqual(stale.status_code, 200)
+        self.assertNotEqual(stale['ETag'], etag)
+
+    def test_missing_derivatives_fall_back_to_original(self):
+        analysis = make_analysis(image=self.save_image('face_images/plain.jpg'))
+
+        row = self.client.get('/api/analyses/').json()['data'][0]
+        self.assertIsNone(row['thumbnail_url'])
+        self.assertTrue(row['image_url'].endswith('/face_images/plain.jpg'))
+
+        for url in (f'/api/thumbnails/{analysis.pk}/256.webp', f'/api/thumbnails/{analysis.pk + 1}/256.webp'):
+            with self.subTest(url=url):
+                self.assertEqual(self._get(url)[0].status_code, 404)
+
+        make_derivatives(analysis_id=analysis.pk)
+        # un tamaño que no se genera sigue siendo 404
+        self.assertEqual(self._get(f'/api/thumbnails/{analysis.pk}/64.webp')[0].status_code, 404)
+
+    def test_backfill_inline_generates_missing_only(self):
+        pending = [make_analysis(image=self.save_image(f'face_images/old_{n}.jpg')) for n in range(2)]
+        done = make_analysis(image=self.save_image('face_images/done.jpg'))
+        make_derivatives(analysis_id=done.pk)
+        done.refresh_from_db()
+        missing = make_analysis(image='face_images/missing.jpg')
+
+        out, err = io.StringIO(), io.StringIO()
+        call_command('backfill_thumbnails', '--inline', stdout=out, stderr=err)
+
+        self.assertIn('2 analisis generados, 1 con error', out.getvalue())
+        self.assertIn(f'error en analisis {missing.pk}', err.getvalue())
+        self.assertFalse(BackgroundJob.objects.exists())
+        for analysis in pending:
+            analysis.refresh_from_db()
+            self.assertTrue(default_storage.exists(analysis.derivatives['thumbnails']['256']['webp']))
+        # los que ya tenian miniaturas no se regeneran
+        self.assertEqual(FaceAnalysis.objects.get(pk=done.pk).derivatives, done.derivatives)
+
+    def test_backfill_without_inline_enqueues_jobs(self):
+        analyses = [make_analysis(image=self.save_image(f'face_images/q_{n}.jpg')) for n in range(3)]
+
+        call_command('backfill_thumbnails', '--batch', '2', stdout=io.StringIO())
+
+        self.assertEqual(
+            sorted(job.payload['analysis_id'] for job in BackgroundJob.objects.filter(kind='make_derivatives')),
+            [analysis.pk for analysis in analyses],
+        )
+
+
+@override_settings(ASYNC_RETRY_AFTER=7)
+class SaturatedExecutorTests(TestCase):
+
+    def setUp(self):
+        # un hilo y sin cola, ocupado hasta el final del test
+        self.executor = BoundedExecutor(max_workers=1, max_queue=0)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        self.executor.submit(release.wait)
+        patcher = mock.patch('predictorThing.views.get_executor', return_value=self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _upload(self):
+        upload = io.BytesIO(_image_bytes('JPEG', size=(64, 64)))
+        upload.name = 'face.jpg'
+        return upload
+
+    def test_full_executor_rejects_without_queueing(self):
+        with self.assertRaises(ExecutorFull):
+            self.executor.submit(time.sleep, 0)
+        self.assertEqual(self.executor.stats(), {'max_workers': 1, 'capacity': 1, 'in_flight': 1, 'rejected': 1})
+
+    def test_async_endpoints_answer_503_with_retry_after(self):
+        for url in ('/api/predict/async/', '/api/save/async/'):
+            with self.subTest(url=url):
+                response = self.client.post(url, {'image': self._upload()})
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response['Retry-After'], '7')
+                self.assertFalse(response.json()['success'])
+        self.assertFalse(FaceAnalysis.objects.exists())
+        self.assertEqual(self.executor.stats()['rejected'], 2)
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        self.calls = []
+        job('test_ok')(lambda **payload: self.calls.append(payload))
+
+        def fail(**payload):
+            raise RuntimeError('falla')
+        job('test_fail')(fail)
+        self.addCleanup(HANDLERS.pop, 'test_ok', None)
+        self.addCleanup(HANDLERS.pop, 'test_fail', None)
+
+    def test_claim_marks_running_in_order_and_respects_limit(self):
+        jobs = [BackgroundJob.objects.create(kind='test_ok', payload={'n': n}) for n in range(3)]
+
+        claimed = _claim(2)
+
+        self.assertEqual([j.pk for j in claimed], [jobs[0].pk, jobs[1].pk])
+        self.assertEqual(
+            list(BackgroundJob.objects.order_by('id').values_list('status', flat=True)),
+            [BackgroundJob.RUNNING, BackgroundJob.RUNNING, BackgroundJob.PENDING],
+        )
+        # ya tomados: otra llamada solo ve el que queda
+        self.assertEqual([j.pk for j in _claim(10)], [jobs[2].pk])
+
+    def test_claim_skips_delayed_jobs(self):
+        BackgroundJob.objects.create(kind='test_ok', run_after=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(_claim(10), [])
+
+    def test_claim_recovers_stale_running_jobs(self):
+        stale = BackgroundJob.objects.create(kind='test_ok', status=BackgroundJob.RUNNING)
+        fresh = BackgroundJob.objects.create(kind='test_ok', status=BackgroundJob.RUNNING)
+        # updated_at es auto_now: se mueve con update
+        BackgroundJob.objects.filter(pk=stale.pk).update(
+            updated_at=timezone.now() - STALE_AFTER - timedelta(minutes=1)
+        )
+
+        self.assertEqual([j.pk for j in _claim(10)], [stale.pk])
+        fresh.refresh_from_db()
+        self.assertEqual(fresh.status, BackgroundJob.RUNNING)
+
+    def test_run_pending_runs_handler(self):
+        created = BackgroundJob.objects.create(kind='test_ok', payload={'value': 1})
+        self.assertEqual(run_pending(), 1)
+        created.refresh_from_db()
+        self.assertEqual(created.status, BackgroundJob.DONE)
+        self.assertEqual(self.calls, [{'value': 1}])
+
+    def test_failure_retries_with_backoff_then_fails(self):
+        created = BackgroundJob.objects.create(kind='test_fail', max_attempts=2)
+        # el worker imprime el traceback de cada falla
+        self.enterContext(contextlib.redirect_stdout(io.StringIO()))
+
+        run_pending()
+        created.refresh_from_db()
+        self.assertEqual((created.status, created.attempts), (BackgroundJob.PENDING, 1))
+        self.assertGreater(created.run_after, timezone.now())
+        self.assertIn('falla', created.last_error)
+
+        BackgroundJob.objects.filter(pk=created.pk).update(run_after=timezone.now())
+        run_pending()
+        created.refresh_from_db()
+        self.assertEqual((created.status, created.attempts), (BackgroundJob.FAILED, 2))
+
+
+@override_settings(JOBS_HEARTBEAT_INTERVAL=0.05)
+class JobHeartbeatTests(TransactionTestCase):
+    """el heartbeat escribe desde otro hilo: necesita ver la fila ya commiteada"""
+
+    def setUp(self):
+        self.outcome = {}
+
+        def long_running(**payload):
+            job_id = payload['job_id']
+            # como si el manejador llevara mas de STALE_AFTER corriendo
+            BackgroundJob.objects.filter(pk=job_id).update(
+                updated_at=timezone.now() - STALE_AFTER - timedelta(minutes=1)
+            )
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                updated_at = BackgroundJob.objects.values_list('updated_at', flat=True).get(pk=job_id)
+                if updated_at > timezone.now() - STALE_AFTER:
+                    break
+                time.sleep(0.02)
+            # otro worker buscando trabajo mientras este sigue corriendo
+            self.outcome['reclaimed'] = [j.pk for j in _claim(10)]
+            self.outcome['status'] = BackgroundJob.objects.values_list('status', flat=True).get(pk=job_id)
+
+        job('test_long')(long_running)
+        self.addCleanup(HANDLERS.pop, 'test_long', None)
+
+    def test_long_running_job_is_not_reclaimed(self):
+        created = BackgroundJob.objects.create(kind='test_long')
+        created.payload = {'job_id': created.pk}
+        created.save()
+
+        claimed = _claim(1)
+        self.assertEqual([j.pk for j in claimed], [created.pk])
+        self.assertTrue(_run(claimed[0]))
+
+        self.assertEqual(self.outcome, {'reclaimed': [], 'status': BackgroundJob.RUNNING})
+        created.refresh_from_db()
+        self.assertEqual((created.status, created.attempts), (BackgroundJob.DONE, 1))
+
+
+class EmbeddingStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.store = embeddings.EmbeddingStore(directory, dim=8)
+
+    def _vectors(self, count, seed=0):
+        vectors = np.random.default_rng(seed).normal(size=(count, 8))
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def test_add_writes_float16_rows(self):
+        vectors = self._vectors(3)
+        self.store.add([10, 11, 12], vectors)
+        self.store.add([13], vectors[:1])
+
+        self.assertEqual(len(self.store), 4)
+        self.assertEqual(self.store.vectors_path.stat().st_size, 4 * 8 * 2)
+        self.assertEqual(self.store.ids_path.stat().st_size, 4 * 8)
+        np.testing.assert_allclose(self.store.vector(11), vectors[1], atol=1e-3)
+        self.assertIsNone(self.store.vector(99))
+        with self.assertRaises(ValueError):
+            self.store.add([1, 2], vectors[:1])
+
+    def test_search_orders_by_similarity_across_chunks(self):
+        query = np.eye(8)[0]
+        # el analisis n esta a n * 0.2 rad de query; se agregan desordenados
+        ids = [5, 2, 7, 1, 4, 6, 3]
+        angles = np.array(ids) * 0.2
+        vectors = np.zeros((len(ids), 8))
+        vectors[:, 0], vectors[:, 1] = np.cos(angles), np.sin(angles)
+        self.store.add(ids, vectors)
+
+        with mock.patch.object(embeddings, 'SEARCH_CHUNK_ROWS', 3):
+            found = self.store.search(query, k=4)
+
+        self.assertEqual([pk for pk, _ in found], [1, 2, 3, 4])
+        for pk, score in found:
+            self.assertAlmostEqual(score, np.cos(pk * 0.2), places=2)
+
+    def test_tombstoned_and_excluded_rows_are_skipped(self):
+        vectors = self._vectors(4)
+        self.store.add([1, 2, 3, 4], vectors)
+
+        self.assertEqual(self.store.remove([1, 3]), 2)
+        self.assertEqual(self.store.stored_ids(), {2, 4})
+        self.assertEqual(len(self.store), 4)
+
+        found = [pk for pk, _ in self.store.search(vectors[0], k=10)]
+        self.assertEqual(sorted(found), [2, 4])
+        self.assertEqual([pk for pk, _ in self.store.search(vectors[1], k=10, exclude=[2])], [4])
+
+    def test_torn_write_is_truncated_on_next_add(self):
+        vectors = self._vectors(2)
+        self.store.add([1], vectors[:1])
+        # un proceso murio despues de escribir medio vector y antes del id
+        with open(self.store.vectors_path, 'ab') as f:
+            f.write(b'\x00' * 5)
+        self.assertEqual(len(self.store), 1)
+
+        self.store.add([2], vectors[1:])
+        self.assertEqual(len(self.store), 2)
+        np.testing.assert_allclose(self.store.vector(2), vectors[1], atol=1e-3)
+
+
+class EmbeddingStoreVersionTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings = override_settings(EMBEDDINGS_DIR=directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        patcher = mock.patch.object(embeddings, 'stores', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _vector(self, seed):
+        vector = np.random.default_rng(seed).normal(size=embeddings.EMBEDDING_DIM)
+        return vector / np.linalg.norm(vector)
+
+    def test_each_version_has_its_own_index(self):
+        first = embeddings.get_embedding_store('v1')
+        second = embeddings.get_embedding_store('v2')
+        self.assertNotEqual(first.directory, second.directory)
+
+        first.add([1], [self._vector(0)])
+        self.assertEqual([pk for pk, _ in first.search(self._vector(0), k=1)], [1])
+        self.assertEqual(second.search(self._vector(0), k=1), [])
+
+    def test_delete_media_removes_from_every_version(self):
+        embeddings.get_embedding_store('v1').add([1, 2], [self._vector(0), self._vector(1)])
+        embeddings.get_embedding_store('v2').add([1], [self._vector(2)])
+
+        with mock.patch('predictorThing.tasks._delete_unused'):
+            delete_media(analysis_ids=[1], names=[])
+
+        self.assertEqual(embeddings.get_embedding_store('v1').stored_ids(), {2})
+        self.assertEqual(embeddings.get_embedding_store('v2').stored_ids(), set())
+
+
+class EmbeddingBackfillTests(TempMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings = override_settings(EMBEDDINGS_DIR=directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        patcher = mock.patch.object(embeddings, 'stores', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # preprocesa de verdad (una imagen que no decodifica falla igual que en el modelo)
+        preprocessor = Preprocessor()
+
+        def predict_batch(images):
+            batch = preprocessor.preprocess_batch(images)
+            return [{embeddings.EMBEDDING_KEY: np.ones(embeddings.EMBEDDING_DIM, dtype=np.float16)}] * len(batch)
+
+        self.predictor = mock.Mock(
+            model_version='v1', max_batch_size=4, preprocessor=preprocessor, predict_batch=predict_batch
+        )
+
+    def test_corrupt_image_is_skipped_not_fatal(self):
+        good = [make_analysis(image=self.save_image(f'face_images/ok_{i}.jpg')) for i in range(3)]
+        data = _image_bytes('JPEG')
+        broken = make_analysis(image=default_storage.save('face_images/broken.jpg', ContentFile(data[:len(data) // 2])))
+        missing = make_analysis(image='face_images/missing.jpg')
+
+        total, failed = embeddings.backfill(self.predictor)
+
+        self.assertEqual((total, failed), (3, 2))
+        store = embeddings.get_embedding_store('v1')
+        self.assertEqual(store.stored_ids(), {row.pk for row in good})
+        self.assertNotIn(broken.pk, store.stored_ids())
+        self.assertNotIn(missing.pk, store.stored_ids())
+
+
+class BulkDeleteTests(TempMediaMixin, TestCase):
+
+    def _delete(self, body):
+        return self.client.post('/api/analyses/delete/', json.dumps(body), content_type='application/json')
+
+    def test_bulk_delete_decrements_daily_summary(self):
+        kept = make_analysis(sex='Female')
+        doomed = [make_analysis(), make_analysis(confidence=40.0)]
+        fold_daily_deltas()
+        self.assertEqual(aggregate()['total'], 3)
+
+        response = self._delete({'ids': [row.pk for row in doomed]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['deleted'], 2)
+        stats = aggregate()
+        self.assertEqual((stats['total'], stats['low_confidence']), (1, 0))
+        self.assertEqual(stats['class_counts']['sex'], {'Female': 1})
+        self.assertEqual(list(FaceAnalysis.objects.values_list('pk', flat=True)), [kept.pk])
+        # los archivos se borran despues, en un trabajo encolado en la misma transaccion
+        self.assertTrue(BackgroundJob.objects.filter(kind='delete_media').exists())
+
+    def test_rejects_empty_or_unknown_filters(self):
+        make_analysis()
+        for body in (
+            {},
+            {'filter': {}},
+            {'filter': {'sex': ''}},
+            {'filter': {'nope': 'x'}},
+            {'filter': {'low_confidence': 'maybe'}},
+            {'ids': 'all'},
+        ):
+            with self.subTest(body=body):
+                self.assertEqual(self._delete(body).status_code, 400)
+        self.assertEqual(FaceAnalysis.objects.count(), 1)
+
+    def test_filter_deletes_only_matching_rows(self):
+        make_analysis(sex='Female')
+        make_analysis()
+        response = self._delete({'filter': {'sex': 'Female'}})
+        self.assertEqual(response.json()['deleted'], 1)
+        self.assertEqual(list(FaceAnalysis.objects.values_list('sex', flat=True)), ['Male'])
+
+
+class MediaCleanupTests(TempMediaMixin, TestCase):
+
+    def _age(self, name, seconds):
+        path = default_storage.path(name)
+        old = time.time() - seconds
+        os.utime(path, (old, old))
+
+    def _stage(self, name):
+        return StagedPrediction.objects.create(
+            token=name.replace('/', '-'), results={}, image=name,
+            expires_at=timezone.now() + timedelta(minutes=5),
+        )
+
+    def test_delete_media_keeps_files_still_referenced(self):
+        shared = self.save_image('face_images/2025/01/01/shared.jpg')
+        staged = self.save_image('face_images/2025/01/01/staged.jpg')
+        alone = self.save_image('face_images/2025/01/01/alone.jpg')
+        first = make_analysis(image=shared)
+        make_analysis(image=shared)
+        self._stage(staged)
+
+        delete_analyses(FaceAnalysis.objects.filter(pk=first.pk))
+        delete_media(analysis_ids=[first.pk], names=[shared, staged, alone])
+
+        self.assertTrue(default_storage.exists(shared))
+        self.assertTrue(default_storage.exists(staged))
+        self.assertFalse(default_storage.exists(alone))
+
+    def test_sweep_files_respects_references_and_grace(self):
+        referenced = self.save_image('face_images/2025/01/01/row.jpg')
+        staged = self.save_image('face_images/2025/01/01/staged.jpg')
+        orphan = self.save_image('face_images/2025/01/01/orphan.jpg')
+        recent = self.save_image('face_images/2025/01/01/recent.jpg')
+        make_analysis(image=referenced)
+        self._stage(staged)
+        for name in (referenced, staged, orphan):
+            self._age(name, 7200)
+
+        self.assertEqual(sweep_files(grace=3600), 1)
+
+        self.assertFalse(default_storage.exists(orphan))
+        for name in (referenced, staged, recent):
+            self.assertTrue(default_storage.exists(name), name)
+
+    def test_sweep_files_dry_run_deletes_nothing(self):
+        orphan = self.save_image('face_images/2025/01/01/orphan.jpg')
+        self._age(orphan, 7200)
+        self.assertEqual(sweep_files(grace=3600, dry_run=True), 1)
+        self.assertTrue(default_storage.exists(orphan))
+
+
+CLASS_NAMES = {
+    'sex': ['Female', 'Male'], 'eyes': ['Blue', 'Brown'],
+    'race': ['Asian', 'White'], 'hair': ['Black', 'Blond'],
+}
+
+
+def fake_results():
+    """salida del predictor como la da predict(), sin embedding"""
+    results = {
+        task: {'prediction': names[1], 'confidence': 80.0, 'probabilities': [0.2, 0.8]}
+        for task, names in CLASS_NAMES.items()
+    }
+    results['model_version'] = 'test'
+    return results
+
+
+class StagedPredictionTests(TempMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        predictor = mock.Mock(class_names=CLASS_NAMES, model_version='test')
+        patcher = mock.patch('predictorThing.views.get_predictor', return_value=predictor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _upload(self, name='face.jpg'):
+        buffer = io.BytesIO()
+        Image.new('RGB', (32, 32)).save(buffer, 'JPEG')
+        buffer.name = name
+        buffer.seek(0)
+        return buffer
+
+    def _save(self, token, **data):
+        return self.client.post('/api/save/', {'prediction_token': token, **data})
+
+    def test_token_saves_once_then_410(self):
+        token = stage(fake_results(), self._upload())
+
+        first = self._save(token)
+        self.assertEqual(first.status_code, 200)
+        analysis = FaceAnalysis.objects.get(pk=first.json()['analysis_id'])
+        self.assertEqual((analysis.sex, analysis.model_version), ('Male', 'test'))
+        # la imagen del token pasa al analisis sin copiarse
+        self.assertTrue(default_storage.exists(analysis.image.name))
+        self.assertFalse(StagedPrediction.objects.filter(token=token).exists())
+
+        second = self._save(token)
+        self.assertEqual(second.status_code, 410)
+        self.assertTrue(second.json()['token_expired'])
+        self.assertEqual(FaceAnalysis.objects.count(), 1)
+
+    def test_expired_or_unknown_token_is_410(self):
+        token = stage(fake_results())
+        StagedPrediction.objects.filter(token=token).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        for value in (token, 'does-not-exist'):
+            with self.subTest(token=value):
+                response = self._save(value, image=self._upload())
+                self.assertEqual(response.status_code, 410)
+        self.assertFalse(FaceAnalysis.objects.exists())
+
+    def test_manual_values_apply_to_staged_result(self):
+        token = stage(fake_results())
+        response = self._save(token, image=self._upload(), manual_values=json.dumps({'hair': 'Red'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['hair'], 'Red')
+
+    def test_claim_is_single_use(self):
+        token = stage(fake_results())
+        claim(token)
+        with self.assertRaises(TokenExpired):
+            claim(token)
+
+    def _predict(self, query=''):
+        with mock.patch('predictorThing.views.cached_predict', return_value=fake_results()), \
+                mock.patch('predictorThing.views.get_model_manager'):
+            return self.client.post(f'/api/predict/{query}', {'image': self._upload()})
+
+    def test_predict_stages_only_when_asked(self):
+        body = self._predict().json()
+        self.assertTrue(body['success'])
+        self.assertNotIn('prediction_token', body)
+        self.assertFalse(StagedPrediction.objects.exists())
+
+        body = self._predict('?stage=1&stage_image=1').json()
+        self.assertTrue(body['image_staged'])
+        staged = StagedPrediction.objects.get(token=body['prediction_token'])
+        self.assertTrue(default_storage.exists(staged.image.name))
+
+    def test_purge_runs_in_the_job_queue(self):
+        expired = stage(fake_results(), self._upload())
+        image = StagedPrediction.objects.get(token=expired).image.name
+        StagedPrediction.objects.filter(token=expired).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        # stage ya no limpia en el request
+        live = stage(fake_results())
+        self.assertTrue(StagedPrediction.objects.filter(token=expired).exists())
+
+        purge_staged_predictions()
+
+        self.assertEqual(list(StagedPrediction.objects.values_list('token', flat=True)), [live])
+        self.assertFalse(default_storage.exists(image))
+        # se vuelve a encolar, una sola vez
+        self.assertIsNone(schedule_purge())
+        pending = BackgroundJob.objects.filter(kind='purge_staged_predictions', status=BackgroundJob.PENDING)
+        self.assertEqual(pending.count(), 1)
+
+
+class BatchStreamingTests(SimpleTestCase):
+    """/api/predict/batch/ con un predictor falso de lotes de 2"""
+
+    def setUp(self):
+        self.chunks = []
+        predictor = mock.Mock(class_names=CLASS_NAMES, max_batch_size=2)
+        predictor.preprocess.side_effect = lambda image: image.convert('RGB').size
+        predictor.predict_tensors.side_effect = lambda tensors: (
+            self.chunks.append(len(tensors)) or [fake_results() for _ in tensors]
+        )
+        patcher = mock.patch('predictorThing.views.get_predictor', return_value=predictor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _upload(self, name, data=None):
+        upload = io.BytesIO(data if data is not None else _image_bytes('PNG', (16, 16)))
+        upload.name = name
+        return upload
+
+    def _lines(self, response):
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        body = b''.join(response.streaming_content).decode()
+        # una linea por objeto JSON, cada una terminada en \n
+        self.assertTrue(body.endswith('\n'))
+        return [json.loads(line) for line in body[:-1].split('\n')]
+
+    def test_one_line_per_image_then_done(self):
+        files = [self._upload('a.png'), self._upload('b.png'), self._upload('bad.png', b'not an image'),
+                 self._upload('c.png')]
+        response = self.client.post('/api/predict/batch/', {'images': files})
+
+        lines = self._lines(response)
+        self.assertEqual(lines[-1], {'done': True, 'count': 4, 'errors': 1})
+        by_index = {line['index']: line for line in lines[:-1]}
+        self.assertEqual(sorted(by_index), [0, 1, 2, 3])
+        self.assertFalse(by_index[2]['success'])
+        self.assertEqual(by_index[3]['name'], 'c.png')
+        self.assertEqual(by_index[3]['data']['sex'], 'Male')
+        # el error sale en cuanto se lee; las buenas en lotes de max_batch_size
+        self.assertEqual([line['index'] for line in lines[:-1]], [0, 1, 2, 3])
+        self.assertEqual(self.chunks, [2, 1])
+
+    def test_options_send_classes_once_first(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('x/one.png', _image_bytes('PNG', (16, 16)))
+            zf.writestr('notes.txt', 'ignorado')
+        archive.seek(0)
+        archive.name = 'faces.zip'
+
+        response = self.client.post('/api/predict/batch/?top_k=1', {'archive': archive})
+
+        lines = self._lines(response)
+        self.assertEqual(lines[0], {'classes': CLASS_NAMES})
+        self.assertEqual([line.get('name') for line in lines[1:-1]], ['x/one.png'])
+        self.assertEqual(lines[1]['top_k']['sex'], [[1], [0.8]])
+        self.assertEqual(lines[-1]['count'], 1)
+
+    @override_settings(PREDICTOR_BATCH_MAX_FILES=1)
+    def test_limit_and_bad_zip_are_reported_inline(self):
+        lines = self._lines(self.client.post(
+            '/api/predict/batch/', {'images': [self._upload('a.png'), self._upload('b.png')]}
+        ))
+        # el aviso del tope sale antes que el lote pendiente
+        self.assertEqual(lines[0], {'success': False, 'error': 'Máximo 1 imágenes por batch'})
+        self.assertEqual((lines[1]['index'], lines[1]['success']), (0, True))
+        self.assertEqual(lines[-1], {'done': True, 'count': 1, 'errors': 0})
+
+        lines = self._lines(self.client.post('/api/predict/batch/', {'archive': self._upload('x.zip', b'nope')}))
+        self.assertEqual(lines, [
+            {'success': False, 'error': 'El archivo zip no es valido'},
+            {'done': True, 'count': 0, 'errors': 1},
+        ])
+
+
+class FaceDetectionTests(SimpleTestCase):
+
+    def _predictor(self):
+        predictor = mock.Mock()
+        predictor.predict.return_value = {'whole': True}
+        predictor.predict_batch.side_effect = lambda crops: [{'crop': i, 'size': c.size} for i, c in enumerate(crops)]
+        return predictor
+
+    def test_no_faces_classifies_the_whole_image(self):
+        detector = mock.Mock()
+        detector.detect.return_value = []
+        predictor = self._predictor()
+
+        results, faces = detect_and_classify(Image.new('L', (64, 48)), predictor, detector=detector)
+
+        self.assertEqual((results, faces), ({'whole': True}, []))
+        self.assertEqual(detector.detect.call_args.args[0].mode, 'RGB')
+        predictor.predict_batch.assert_not_called()
+
+    def test_faces_go_in_one_batch_largest_first(self):
+        detector = mock.Mock()
+        detector.detect.return_value = [
+            {'box': [10, 10, 80, 80], 'score': None, 'landmarks': None},
+            {'box': [120, 20, 40, 40], 'score': None, 'landmarks': None},
+            {'box': [200, 20, 30, 30], 'score': None, 'landmarks': None},
+        ]
+        predictor = self._predictor()
+
+        results, faces = detect_and_classify(Image.new('RGB', (256, 128)), predictor, detector=detector, max_faces=2)
+
+        predictor.predict_batch.assert_called_once()
+        self.assertEqual(len(faces), 2)
+        self.assertEqual(results, faces[0]['results'])
+        self.assertEqual([face['results']['size'] for face in faces], [INPUT_SIZE, INPUT_SIZE])
+
+    def test_landmarks_level_the_eyes(self):
+        image = Image.new('RGB', (400, 400), 'white')
+        pixels = np.asarray(image).copy()
+        # ojos a 45 grados: derecho de la persona en (150, 150), izquierdo en (250, 250)
+        pixels[145:156, 145:156] = (255, 0, 0)
+        pixels[245:256, 245:256] = (0, 0, 255)
+        face = {'box': [130, 130, 140, 140], 'landmarks': [[150, 150], [250, 250], [0, 0], [0, 0], [0, 0]]}
+
+        crop = np.asarray(crop_face(Image.fromarray(pixels), face))
+
+        self.assertEqual(crop.shape, (*INPUT_SIZE, 3))
+        red = np.argwhere((crop[..., 0] > 200) & (crop[..., 2] < 80)).mean(axis=0)
+        blue = np.argwhere((crop[..., 2] > 200) & (crop[..., 0] < 80)).mean(axis=0)
+        self.assertAlmostEqual(red[0], blue[0], delta=2)
+        self.assertLess(red[1], blue[1])
+
+    @skipUnless(find_spec('cv2'), 'opencv no esta instalado')
+    @override_settings(FACE_DETECTOR_MODEL=None, FACE_DETECTION_MIN_SIZE=32)
+    def test_without_yunet_uses_haar_in_original_coordinates(self):
+        from . import detection
+
+        with mock.patch.object(detection, 'detector', None):
+            detector = detection.get_face_detector()
+        self.assertIsNone(detector._yunet)
+        self.assertIsNotNone(detector._haar)
+
+        # sin caras: el cascade real no encuentra nada en una imagen lisa
+        self.assertEqual(detector.detect(Image.new('RGB', (200, 200), 'gray')), [])
+
+        # 2560 de ancho se detecta a la mitad: las cajas regresan al doble; las chicas se descartan
+        rects = np.array([[10, 10, 20, 20], [100, 50, 60, 40], [300, 100, 10, 10]])
+        with mock.patch.object(detector, '_haar') as haar:
+            haar.detectMultiScale.return_value = rects
+            faces = detector.detect(Image.new('RGB', (2560, 1280)))
+
+        self.assertEqual(haar.detectMultiScale.call_args.args[0].shape, (640, 1280))
+        self.assertEqual(haar.detectMultiScale.call_args.kwargs['minSize'], (16, 16))
+        self.assertEqual(faces, [
+            {'box': [200, 100, 120, 80], 'score': None, 'landmarks': None},
+            {'box': [20, 20, 40, 40], 'score': None, 'landmarks': None},
+        ])
+
+
+def _gray(level, size=(64, 48)):
+    return Image.new('RGB', size, (level, level, level))
+
+
+class VideoTests(SimpleTestCase):
+
+    def _result(self, sex):
+        """resultado de una cara con la distribucion de sex dada; el resto fijo"""
+        result = fake_results()
+        result['sex'] = {
+            'prediction': CLASS_NAMES['sex'][int(np.argmax(sex))],
+            'confidence': max(sex) * 100,
+            'probabilities': list(sex),
+        }
+        return result
+
+    @skipUnless(find_spec('cv2'), 'opencv no esta instalado')
+    def test_video_frames_are_sampled_at_the_requested_fps(self):
+        import cv2
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'clip.avi')
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10.0, (64, 48))
+        for i in range(20):
+            writer.write(np.full((48, 64, 3), i * 10, dtype=np.uint8))
+        writer.release()
+
+        frames = list(iter_video_frames(path, sample_fps=2.0))
+
+        self.assertEqual([index for index, _, _ in frames], [0, 5, 10, 15])
+        self.assertEqual([seconds for _, seconds, _ in frames], [0.0, 0.5, 1.0, 1.5])
+        for index, _, image in frames:
+            self.assertAlmostEqual(np.asarray(image).mean(), index * 10, delta=3)
+
+    def test_sequence_sampling_skips_without_opening(self):
+        opened = []
+
+        def opener(i):
+            def open_frame():
+                opened.append(i)
+                buffer = io.BytesIO()
+                _gray(i).save(buffer, 'PNG')
+                buffer.seek(0)
+                return buffer
+            return open_frame
+
+        frames = list(iter_sequence_frames([(f'{i}.png', opener(i)) for i in range(12)], fps=10, sample_fps=4))
+
+        self.assertEqual([index for index, _, _ in frames], [0, 3, 6, 9])
+        self.assertEqual(opened, [0, 3, 6, 9])
+        self.assertEqual(frames[1][2].mode, 'RGB')
+
+    def test_dedup_compares_against_last_classified_frame(self):
+        dedup = FrameDeduplicator(threshold=0.02)
+        # 3 niveles = 0.012 < 0.02; 6 niveles contra el ultimo clasificado = 0.024
+        self.assertEqual(
+            [dedup.is_duplicate(_gray(level)) for level in (100, 101, 103, 106, 108, 140)],
+            [False, True, True, False, True, False],
+        )
+
+        predictor = mock.Mock(class_names=CLASS_NAMES, max_batch_size=8)
+        predictor.predict_batch.side_effect = lambda crops: [fake_results() for _ in crops]
+        analyzer = VideoAnalyzer(predictor, diff_threshold=0.02)
+        events = list(analyzer.process((i, i / 2, _gray(level)) for i, level in enumerate((50, 51, 90, 91))))
+
+        self.assertEqual([event['frame'] for event in events], [0, 2])
+        summary = analyzer.summary()
+        self.assertEqual(
+            (summary['frames_sampled'], summary['frames_duplicated'], summary['frames_classified']), (4, 2, 2)
+        )
+        self.assertEqual([(track['track'], track['frames']) for track in summary['tracks']], [(0, 2)])
+
+    def test_tracks_follow_faces_and_vote_softly(self):
+        # cara A roja a la izquierda (se mueve 2 px por frame), cara B azul a la derecha
+        def frame(shift):
+            pixels = np.zeros((80, 200, 3), dtype=np.uint8)
+            pixels[:, :75, 0] = 255
+            pixels[:, 85:, 2] = 255
+            pixels[0, 0, 1] = shift  # que ningun frame sea igual
+            return Image.fromarray(pixels)
+
+        def box_a(shift):
+            return {'box': [10 + shift, 10, 40, 40], 'score': None, 'landmarks': None}
+
+        box_b = {'box': [100, 10, 40, 40], 'score': None, 'landmarks': None}
+        detector = mock.Mock()
+        # en el segundo frame el detector las regresa en otro orden
+        detector.detect.side_effect = [[box_a(0), dict(box_b)], [dict(box_b), box_a(2)], [box_a(4), dict(box_b)]]
+
+        sex_a = iter([[0.6, 0.4], [0.6, 0.4], [0.1, 0.9]])
+
+        def predict_batch(crops):
+            results = []
+            for crop in crops:
+                red, _, blue = np.asarray(crop, dtype=np.float64).mean(axis=(0, 1))
+                results.append(self._result(next(sex_a) if red > blue else [0.1, 0.9]))
+            return results
+
+        predictor = mock.Mock(class_names=CLASS_NAMES, max_batch_size=2)
+        predictor.predict_batch.side_effect = predict_batch
+        analyzer = VideoAnalyzer(predictor, diff_threshold=0.0, detect_faces=True, detector=detector)
+
+        events = list(analyzer.process((i, i * 0.5, frame(i * 2)) for i in range(3)))
+
+        self.assertEqual([[face['track'] for face in event['faces']] for event in events], [[0, 1], [1, 0], [0, 1]])
+        self.assertEqual(events[1]['faces'][1]['data']['sex'], 'Female')
+
+        tracks = analyzer.summary()['tracks']
+        self.assertEqual([track['frames'] for track in tracks], [3, 3])
+        self.assertEqual(tracks[0]['last_box'], [14, 10, 40, 40])
+        # A: dos votos Female con poca certeza y uno Male con mucha, el promedio gana
+        self.assertEqual(tracks[0]['attributes']['sex'], {
+            'prediction': 'Male', 'confidence': 0.57, 'votes': {'Female': 2, 'Male': 1},
+        })
+        self.assertEqual(tracks[1]['attributes']['sex']['votes'], {'Male': 3})
+
+
+class AnalysesPaginationTests(TestCase):
+
+    def setUp(self):
+        now = timezone.now()
+        self.ids = []
+        for index in range(7):
+            analysis = make_analysis(sex='Female' if index % 2 else 'Male')
+            # tres filas comparten created_at: el desempate es por id
+            created_at = now - timedelta(minutes=index // 3)
+            FaceAnalysis.objects.filter(pk=analysis.pk).update(created_at=created_at)
+            self.ids.append(analysis.pk)
+
+    def _pages(self, **params):
+        pages = []
+        cursor = None
+        while True:
+            query = dict(params, **({'cursor': cursor} if cursor else {}))
+            body = self.client.get('/api/analyses/', query).json()
+            self.assertTrue(body['success'])
+            pages.append([row['id'] for row in body['data']])
+            cursor = body['next_cursor']
+            if cursor is None:
+                return pages
+
+    def test_pages_cover_every_row_once_in_order(self):
+        # limit=2 corta en medio de las filas con el mismo created_at
+        pages = self._pages(limit=2)
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+
+        expected = list(
+            FaceAnalysis.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual([pk for page in pages for pk in page], expected)
+
+    def test_exact_multiple_has_no_empty_last_page(self):
+        self.assertEqual([len(page) for page in self._pages(limit=7)], [7])
+
+    def test_cursor_keeps_filters(self):
+        pages = self._pages(limit=2, sex='Female')
+        ids = [pk for page in pages for pk in page]
+        self.assertEqual(sorted(ids), sorted(self.ids[1::2]))
+
+    def test_new_rows_do_not_shift_later_pages(self):
+        body = self.client.get('/api/analyses/', {'limit': 3}).json()
+        make_analysis()
+
+        rest = self.client.get('/api/analyses/', {'limit': 10, 'cursor': body['next_cursor']}).json()
+        seen = [row['id'] for row in body['data'] + rest['data']]
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(sorted(seen), sorted(self.ids))
+
+    def test_invalid_cursor_is_400(self):
+        response = self.client.get('/api/analyses/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['success'])
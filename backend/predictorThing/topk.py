@@ -0,0 +1,53 @@
+# predictorThing/topk.py
+from .predictor import TASKS
+
+# cuantas clases por cabeza se guardan en FaceAnalysis.top_k
+DEFAULT_STORED_TOP_K = 3
+
+
+def parse_options(params):
+    """
+    (k, full) de los parametros del request: top_k=<n> pide las n clases mas
+    probables por cabeza y probabilities=1 la distribucion completa
+    """
+    try:
+        k = max(0, int(params.get('top_k') or 0))
+    except ValueError:
+        k = 0
+    full = params.get('probabilities', '').lower() in ('1', 'true', 'yes')
+    return k, full
+
+
+def top_indices(probabilities, k):
+    """indices de las k clases mas probables, de mayor a menor"""
+    order = sorted(range(len(probabilities)), key=probabilities.__getitem__, reverse=True)
+    return order[:k]
+
+
+def encode(result, k=0, full=False):
+    """
+    campos extra de la respuesta en forma compacta: top_k es {cabeza: [[indices], [probs]]}
+    y probabilities {cabeza: [probs]}; los indices son posiciones en class_names
+    """
+    extras = {}
+    if k:
+        top = {}
+        for task in TASKS:
+            probabilities = result[task]['probabilities']
+            indices = top_indices(probabilities, k)
+            top[task] = [indices, [probabilities[i] for i in indices]]
+        extras['top_k'] = top
+    if full:
+        extras['probabilities'] = {task: result[task]['probabilities'] for task in TASKS}
+    return extras
+
+
+def stored_top_k(result, class_names, k=DEFAULT_STORED_TOP_K):
+    """top-k con nombres (no indices) para guardar en la BD: {cabeza: [[nombre, prob], ...]}"""
+    stored = {}
+    for task in TASKS:
+        probabilities = result[task]['probabilities']
+        stored[task] = [
+            [class_names[task][i], probabilities[i]] for i in top_indices(probabilities, k)
+        ]
+    return stored
@@ -8,8 +8,23 @@ urlpatterns = [
     path('', views.predict_face_view, name='home'),
     path('predict/', views.predict_face_view, name='predict'),
     path('api/predict/', views.api_predict, name='api_predict'),
+    path('api/predict/batch/', views.api_predict_batch, name='api_predict_batch'),
+    path('api/predict/video/', views.api_predict_video, name='api_predict_video'),
+    path('api/predict/stats/', views.batcher_stats, name='batcher_stats'),
+    path('api/predict/cache/', views.cache_stats, name='cache_stats'),
+    path('api/models/', views.model_status, name='model_status'),
+    path('api/predict/async/', views.api_predict_async, name='api_predict_async'),
+    
+    path('api/health/', views.health_check, name='health_check'),
+    path('metrics', views.metrics, name='metrics'),
     
     path('api/save/', views.save_analysis, name='save_analysis'),
+    path('api/save/async/', views.save_analysis_async, name='save_analysis_async'),
     path('api/analyses/', views.get_all_analyses, name='get_all_analyses'),
+    path('api/analyses/stats/', views.analyses_stats, name='analyses_stats'),
+    path('api/analyses/delete/', views.bulk_delete_analyses, name='bulk_delete_analyses'),
+    path('api/analyses/similar/', views.find_similar, name='find_similar'),
+    path('api/analyses/<int:analysis_id>/similar/', views.similar_analyses, name='similar_analyses'),
     path('api/analyses/<int:analysis_id>/delete/', views.delete_analysis, name='delete_analysis'),
+    path('api/thumbnails/<int:analysis_id>/<int:size>.<str:ext>', views.thumbnail, name='thumbnail'),
 ]
\ No newline at end of file
@@ -0,0 +1,278 @@
+# predictorThing/video.py
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+from .detection import DEFAULT_MAX_FACES, crop_face, get_face_detector
+from .metrics import timed
+from .predictor import TASKS
+from .preprocessing import load_image
+
+DEFAULT_SAMPLE_FPS = 2.0
+
+# diferencia media (0-1) de la firma 32x32 en gris debajo de la cual un frame se descarta
+DEFAULT_DIFF_THRESHOLD = 0.02
+SIGNATURE_SIZE = (32, 32)
+
+# IoU minimo para que una cara siga en el mismo track, y cuantos frames muestreados puede faltar
+TRACK_IOU_THRESHOLD = 0.3
+TRACK_MAX_GAP = 5
+
+
+def iter_video_frames(path, sample_fps=DEFAULT_SAMPLE_FPS):
+    """
+    decodifica un video frame por frame (nunca en memoria completo) y regresa
+    (indice, segundo, imagen PIL) solo de los frames muestreados a sample_fps
+    """
+    try:
+        import cv2
+    except ImportError:
+        raise ImportError("el analisis de video necesita opencv (pip install opencv-python-headless)")
+
+    capture = cv2.VideoCapture(str(path))
+    if not capture.isOpened():
+        raise ValueError('No se pudo abrir el video')
+
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    step = 1.0 / sample_fps if sample_fps and sample_fps > 0 else 0.0
+    next_time = 0.0
+    index = 0
+    try:
+        while True:
+            # grab avanza sin convertir el frame; solo los muestreados pasan por retrieve
+            if not capture.grab():
+                break
+            seconds = index / fps
+            if seconds + 1e-6 >= next_time:
+                with timed('decode'):
+                    ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                next_time = seconds + step
+                yield index, seconds, Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            index += 1
+    finally:
+        capture.release()
+
+
+def iter_sequence_frames(openers, fps=None, sample_fps=DEFAULT_SAMPLE_FPS):
+    """
+    igual que iter_video_frames para una secuencia de imagenes [(nombre, abridor)];
+    sin fps se toma cada imagen como un frame muestreado
+    """
+    step = 1.0 / sample_fps if fps and sample_fps and sample_fps > 0 else 0.0
+    next_time = 0.0
+    for index, (name, opener) in enumerate(openers):
+        seconds = index / fps if fps else float(index)
+        if step and seconds + 1e-6 < next_time:
+            continue
+        next_time = seconds + step
+        with opener() as f, timed('decode'):
+            image = Image.open(f)
+            image.load()
+        yield index, seconds, image.convert('RGB') if image.mode != 'RGB' else image
+
+
+class FrameDeduplicator:
+    """descarta frames casi iguales al ultimo que se clasifico (diferencia media en gris 32x32)"""
+
+    def __init__(self, threshold=DEFAULT_DIFF_THRESHOLD):
+        self.threshold = threshold
+        self._last = None
+
+    def is_duplicate(self, image):
+        signature = np.asarray(
+            image.convert('L').resize(SIGNATURE_SIZE, Image.BILINEAR, reducing_gap=2.0), dtype=np.int16
+        )
+        if self._last is not None and np.abs(signature - self._last).mean() / 255.0 < self.threshold:
+            return True
+        self._last = signature
+        return False
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _flat(result):
+    """mismo formato plano que la API de imagenes"""
+    data = {}
+    for task in TASKS:
+        data[task] = result[task]['prediction']
+        data[f'{task}_confidence'] = result[task]['confidence']
+    return data
+
+
+class _Track:
+    """votos acumulados de una persona a lo largo del clip; su tamaño no depende de cuantos frames hay"""
+
+    def __init__(self, track_id, index, seconds, box):
+        self.id = track_id
+        self.box = box
+        self.first_frame = self.last_frame = index
+        self.first_time = self.last_time = seconds
+        self.missed = 0
+        self.count = 0
+        self.probability_sums = {}
+        self.votes = {task: {} for task in TASKS}
+
+    def add(self, result):
+        self.count += 1
+        for task in TASKS:
+            probabilities = np.asarray(result[task]['probabilities'], dtype=np.float64)
+            if task in self.probability_sums:
+                self.probability_sums[task] += probabilities
+            else:
+                self.probability_sums[task] = probabilities
+            label = result[task]['prediction']
+            self.votes[task][label] = self.votes[task].get(label, 0) + 1
+
+    def summary(self, class_names):
+        attributes = {}
+        for task in TASKS:
+            if task not in self.probability_sums:
+                continue
+            # voto suave: promedio de las distribuciones de todos los frames
+            mean = self.probability_sums[task] / self.count
+            best = int(mean.argmax())
+            attributes[task] = {
+                'prediction': class_names[task][best],
+                'confidence': round(float(mean[best]), 2),
+                'votes': dict(sorted(self.votes[task].items(), key=lambda item: -item[1])),
+            }
+        return {
+            'track': self.id,
+            'frames': self.count,
+            'first_frame': self.first_frame,
+            'last_frame': self.last_frame,
+            'start': round(self.first_time, 3),
+            'end': round(self.last_time, 3),
+            'last_box': self.box,
+            'attributes': attributes,
+        }
+
+
+class VideoAnalyzer:
+    """
+    muestreo -> dedup -> (deteccion + tracking por IoU) -> batches al predictor ->
+    votos por track. solo guarda un batch de recortes y los acumulados por track,
+    asi que la memoria no crece con la duracion del clip
+    """
+
+    def __init__(self, predictor, diff_threshold=DEFAULT_DIFF_THRESHOLD, detect_faces=False,
+                 detector=None, max_frames=None, run=None):
+        self.predictor = predictor
+        # run(fn, *args) ejecuta la deteccion y los forwards; la vista los manda al pool
+        # acotado de inferencia para que no corran en el hilo del request
+        self.run = run or (lambda fn, *args: fn(*args))
+        self.dedup = FrameDeduplicator(diff_threshold)
+        self.detector = (detector or get_face_detector()) if detect_faces else None
+        self.max_frames = max_frames
+        self.max_faces = getattr(settings, 'FACE_DETECTION_MAX_FACES', DEFAULT_MAX_FACES)
+        self.class_names = predictor.class_names
+
+        self.tracks = []
+        self._active = []
+        self._pending = []
+
+        self.frames_sampled = 0
+        self.frames_duplicated = 0
+        self.frames_classified = 0
+        self.truncated = False
+
+    def process(self, frames):
+        """
+        consume (indice, segundo, imagen) y regresa eventos por frame clasificado:
+        {'frame', 'time', 'faces': [{'track', 'box', 'data'}]}
+        """
+        for index, seconds, image in frames:
+            if self.max_frames and self.frames_sampled >= self.max_frames:
+                self.truncated = True
+                break
+            self.frames_sampled += 1
+
+            if self.dedup.is_duplicate(image):
+                self.frames_duplicated += 1
+                continue
+
+            self.frames_classified += 1
+            for track, box, crop in self._crops(index, seconds, image):
+                # en cola solo va la imagen ya reducida a la entrada del modelo, no el frame completo
+                self._pending.append((index, seconds, track, box, load_image(crop)))
+
+            if len(self._pending) >= self.predictor.max_batch_size:
+                yield from self._flush()
+
+        yield from self._flush()
+
+    def _crops(self, index, seconds, image):
+        if self.detector is None:
+            # sin detector todo el clip es un solo track con el frame completo
+            if not self.tracks:
+                self.tracks.append(_Track(0, index, seconds, None))
+            return [(self.tracks[0], None, image)]
+
+        with timed('detect'):
+            faces = self.run(self.detector.detect, image)[:self.max_faces]
+
+        matched = set()
+        crops = []
+        for face in faces:
+            track = self._match(face['box'], matched)
+            if track is None:
+                track = _Track(len(self.tracks), index, seconds, face['box'])
+                self.tracks.append(track)
+                self._active.append(track)
+            matched.add(track.id)
+            track.box = face['box']
+            track.missed = 0
+            crops.append((track, face['box'], crop_face(image, face)))
+
+        for track in self._active:
+            if track.id not in matched:
+                track.missed += 1
+        self._active = [track for track in self._active if track.missed <= TRACK_MAX_GAP]
+        return crops
+
+    def _match(self, box, matched):
+        best, best_iou = None, TRACK_IOU_THRESHOLD
+        for track in self._active:
+            if track.id in matched:
+                continue
+            overlap = iou(track.box, box)
+            if overlap >= best_iou:
+                best, best_iou = track, overlap
+        return best
+
+    def _flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        results = self.run(self.predictor.predict_batch, [crop for _, _, _, _, crop in pending])
+
+        events = {}
+        for (index, seconds, track, box, _), result in zip(pending, results):
+            track.add(result)
+            track.last_frame, track.last_time = index, seconds
+            event = events.setdefault(index, {'frame': index, 'time': round(seconds, 3), 'faces': []})
+            event['faces'].append({
+                'track': track.id,
+                'box': box,
+                'data': _flat(result),
+            })
+        yield from events.values()
+
+    def summary(self):
+        return {
+            'frames_sampled': self.frames_sampled,
+            'frames_duplicated': self.frames_duplicated,
+            'frames_classified': self.frames_classified,
+            'truncated': self.truncated,
+            'tracks': [track.summary(self.class_names) for track in self.tracks if track.count],
+        }
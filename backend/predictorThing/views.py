@@ -1,29 +1,147 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse, FileResponse, HttpResponse, HttpResponseNotModified
+from django.core.files.storage import default_storage
+from django.conf import settings
+from django.utils.dateparse import parse_date
+from asgiref.sync import sync_to_async
 from django.views.decorators.csrf import csrf_exempt
-from django.core.files.base import ContentFile
-from .predictor import get_predictor
-from .models import FaceAnalysis
+from django.db import transaction
+from .predictor import EMBEDDING_KEY, MODEL_VERSION_KEY, TASKS, get_predictor
+from .batching import get_batcher, predict_image
+from .cache import cached_predict, get_prediction_cache
+from .warmup import health
+from .jobs import enqueue
+from .executor import ExecutorFull, get_executor
+from .images import CONTENT_TYPES, DEFAULT_THUMBNAIL_SIZE, thumbnail_name
+from .stats import aggregate
+from .queries import (
+    DEFAULT_PAGE_SIZE, LIST_FIELDS, MAX_PAGE_SIZE, filter_analyses, iter_all_rows, paginate, serialize_row
+)
+from .models import DetectedFace, FaceAnalysis
+from .detection import detect_and_classify
+from .metrics import render as render_metrics, timed
+from .embeddings import DEFAULT_DUPLICATE_THRESHOLD, get_embedding_store
+from .registry import get_model_manager
+from .cleanup import delete_analyses
+from .staging import DEFAULT_TOKEN_TTL, TokenExpired, claim, stage
+from .topk import DEFAULT_STORED_TOP_K, encode as encode_top_k, parse_options, stored_top_k
+from .video import (
+    DEFAULT_DIFF_THRESHOLD, DEFAULT_SAMPLE_FPS, VideoAnalyzer, iter_sequence_frames, iter_video_frames
+)
 from PIL import Image
 import io
 import traceback
 import json
 import base64
+import zipfile
+import os
+import tempfile
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.gif', '.tif', '.tiff')
+
+# filtros de filter_analyses que acepta el borrado en bulk
+BULK_DELETE_FILTERS = TASKS + ['low_confidence', 'model_version']
+
+
+def _flatten_predictions(results):
+    """convierte la salida del predictor al formato plano de la API"""
+    data = {}
+    for task in ['sex', 'eyes', 'race', 'hair']:
+        data[task] = results[task]['prediction']
+        data[f'{task}_confidence'] = results[task]['confidence']
+    return data
+
+
+def _prediction_extras(results, options, class_names=None):
+    """
+    top_k / probabilities pedidos en el query string (?top_k=3&probabilities=1),
+    con la tabla de clases si se pasa class_names
+    """
+    k, full = options
+    if not (k or full):
+        return {}
+    extras = encode_top_k(results, k, full)
+    if class_names is not None:
+        extras['classes'] = class_names
+    return extras
+
+
+def _stage_prediction(results, image_file, params):
+    """
+    con ?stage=1 guarda el resultado bajo un token para confirmarlo en /api/save/; con
+    ?stage_image=1 tambien se queda la imagen y el save no necesita re-subirla. sin
+    stage no se escribe nada: quien solo consulta no deja filas ni archivos
+    """
+    if params.get('stage', '').lower() not in ('1', 'true', 'yes'):
+        return {}
+
+    with timed('stage'):
+        keep_image = params.get('stage_image', '').lower() in ('1', 'true', 'yes')
+        token = stage(results, image_file if keep_image else None)
+    return {
+        'prediction_token': token,
+        'token_expires_in': getattr(settings, 'PREDICTION_TOKEN_TTL', DEFAULT_TOKEN_TTL),
+        'image_staged': keep_image
+    }
+
+
+def _wants_faces(params):
+    """?faces=1 (o FACE_DETECTION_ENABLED) pasa la imagen por el detector de caras"""
+    if 'faces' in params:
+        return params['faces'].lower() in ('1', 'true', 'yes')
+    return getattr(settings, 'FACE_DETECTION_ENABLED', False)
+
+
+def _detect_faces(image):
+    """
+    clasifica cada cara por separado (un solo forward para todas); los campos de
+    siempre son los de la cara principal y 'faces' trae todas. sin cache: el
+    resultado depende de las cajas
+    """
+    results, faces = detect_and_classify(image, get_predictor())
+    return dict(results, faces=faces)
+
+
+def _face_extras(results):
+    """cajas y resultados por cara para la respuesta, si se corrio el detector"""
+    if results.get('faces') is None:
+        return {}
+    return {
+        'faces': [
+            {
+                'box': face['box'],
+                'score': face['score'],
+                'landmarks': face['landmarks'],
+                'data': _flatten_predictions(face['results'])
+            }
+            for face in results['faces']
+        ]
+    }
+
+
+def _uploaded_file(request, field='image'):
+    """archivo del request; el primer acceso a FILES parsea el multipart (etapa upload_read)"""
+    with timed('upload_read'):
+        return request.FILES.get(field)
+
 
 def predict_face_view(request):
-    if request.method == 'POST' and request.FILES.get('image'):
+    if request.method == 'POST' and _uploaded_file(request):
         try:
             # get te image form the request
             image_file = request.FILES['image']
-            image = Image.open(io.BytesIO(image_file.read()))
+            with timed('upload_read'):
+                data = image_file.read()
+            image = Image.open(io.BytesIO(data))
             
             # Hacer la predicción
             predictor = get_predictor()
-            results = predictor.predict(image)
+            results = cached_predict(image, predictor.predict)
+            get_model_manager().submit_shadow(image, results)
             
             return JsonResponse({
                 'success': True,
-                'predictions': results
+                'predictions': {task: results[task] for task in TASKS}
             })
         
         except Exception as e:
@@ -41,26 +159,26 @@ def predict_face_view(request):
 @csrf_exempt
 def api_predict(request):
     """Endpoint para predecir sin guardar"""
-    if request.method == 'POST' and request.FILES.get('image'):
+    if request.method == 'POST' and _uploaded_file(request):
         try:
             image_file = request.FILES['image']
-            image = Image.open(io.BytesIO(image_file.read()))
+            with timed('upload_read'):
+                data = image_file.read()
+            image = Image.open(io.BytesIO(data))
             
-            predictor = get_predictor()
-            results = predictor.predict(image)
+            if _wants_faces(request.GET):
+                results = _detect_faces(image)
+            else:
+                # pasa por el micro-batcher para juntarse con otros requests
+                results = cached_predict(image, predict_image)
+                get_model_manager().submit_shadow(image, results)
             
             return JsonResponse({
                 'success': True,
-                'data': {
-                    'sex': results['sex']['prediction'],
-                    'sex_confidence': results['sex']['confidence'],
-                    'eyes': results['eyes']['prediction'],
-                    'eyes_confidence': results['eyes']['confidence'],
-                    'race': results['race']['prediction'],
-                    'race_confidence': results['race']['confidence'],
-                    'hair': results['hair']['prediction'],
-                    'hair_confidence': results['hair']['confidence']
-                }
+                'data': _flatten_predictions(results),
+                **_face_extras(results),
+                **_stage_prediction(results, image_file, request.GET),
+                **_prediction_extras(results, parse_options(request.GET), get_predictor().class_names)
             })
         
         except Exception as e:
@@ -78,66 +196,454 @@ def api_predict(request):
     }, status=400)
 
 
+def _iter_uploaded_images(request):
+    """
+    regresa (nombre, abridor) por cada imagen del request, ya sea en 'images'
+    (varios archivos) o dentro de un zip en 'archive'. nada se decodifica aqui;
+    los archivos grandes ya estan en disco gracias a los upload handlers de Django
+    """
+    for image_file in request.FILES.getlist('images'):
+        yield image_file.name, image_file.open
+
+    archive = request.FILES.get('archive')
+    if archive:
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or not info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                yield info.filename, lambda info=info: zf.open(info)
+
+
+def _stream_batch_predictions(request):
+    """
+    genera lineas NDJSON conforme se termina cada chunk del batch; con top_k o
+    probabilities la primera linea trae la tabla de clases una sola vez
+    """
+    predictor = get_predictor()
+    max_files = getattr(settings, 'PREDICTOR_BATCH_MAX_FILES', 1000)
+    options = parse_options(request.GET)
+
+    count = 0
+    errors = 0
+    chunk = []
+
+    def flush(chunk):
+        results = predictor.predict_tensors([tensor for _, _, tensor in chunk])
+        for (index, name, _), result in zip(chunk, results):
+            yield json.dumps({
+                'index': index,
+                'name': name,
+                'success': True,
+                'data': _flatten_predictions(result),
+                **_prediction_extras(result, options)
+            }) + '\n'
+
+    if any(options):
+        yield json.dumps({'classes': predictor.class_names}) + '\n'
+
+    try:
+        for name, opener in _iter_uploaded_images(request):
+            if count >= max_files:
+                yield json.dumps({
+                    'success': False,
+                    'error': f'Máximo {max_files} imágenes por batch'
+                }) + '\n'
+                break
+
+            index = count
+            count += 1
+            try:
+                with opener() as f:
+                    image = Image.open(f)
+                    chunk.append((index, name, predictor.preprocess(image)))
+            except Exception as e:
+                errors += 1
+                yield json.dumps({
+                    'index': index,
+                    'name': name,
+                    'success': False,
+                    'error': str(e)
+                }) + '\n'
+                continue
+
+            if len(chunk) == predictor.max_batch_size:
+                yield from flush(chunk)
+                chunk = []
+    except zipfile.BadZipFile:
+        errors += 1
+        yield json.dumps({
+            'success': False,
+            'error': 'El archivo zip no es valido'
+        }) + '\n'
+
+    if chunk:
+        yield from flush(chunk)
+
+    yield json.dumps({
+        'done': True,
+        'count': count,
+        'errors': errors
+    }) + '\n'
+
+
+@csrf_exempt
+def api_predict_batch(request):
+    """Endpoint para predecir varias imagenes (o un zip) con resultados en NDJSON"""
+    if request.method == 'POST' and (request.FILES.getlist('images') or request.FILES.get('archive')):
+        response = StreamingHttpResponse(
+            _stream_batch_predictions(request),
+            content_type='application/x-ndjson'
+        )
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    return JsonResponse({
+        'success': False,
+        'error': 'No images provided'
+    }, status=400)
+
+
+def _float_param(params, name, default):
+    try:
+        return float(params.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _iter_request_frames(request, sample_fps):
+    """
+    frames muestreados del 'video' subido o de una secuencia de imagenes
+    ('images' / zip en 'archive', en el orden en que vienen; ?fps= les da tiempo)
+    """
+    video = request.FILES.get('video')
+    if video is None:
+        fps = _float_param(request.GET, 'fps', None)
+        yield from iter_sequence_frames(_iter_uploaded_images(request), fps=fps, sample_fps=sample_fps)
+        return
+
+    # opencv necesita una ruta: los uploads grandes ya estan en disco, los chicos se copian
+    if hasattr(video, 'temporary_file_path'):
+        yield from iter_video_frames(video.temporary_file_path(), sample_fps)
+        return
+
+    suffix = os.path.splitext(video.name)[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+        for chunk in video.chunks():
+            tmp.write(chunk)
+        tmp.flush()
+        yield from iter_video_frames(tmp.name, sample_fps)
+
+
+def _run_in_executor(fn, *args):
+    """
+    corre fn en el pool acotado de inferencia y espera el resultado; un video ya
+    empezado espera su turno (hasta VIDEO_EXECUTOR_TIMEOUT) en vez de cortarse
+    """
+    timeout = getattr(settings, 'VIDEO_EXECUTOR_TIMEOUT', 30)
+    return get_executor().submit_wait(timeout, fn, *args).result()
+
+
+def _stream_video_predictions(request):
+    """
+    una linea NDJSON por frame clasificado (?frames=0 las omite) y al final el
+    resumen con los votos por track; nada del clip se acumula en memoria
+    """
+    params = request.GET
+    analyzer = VideoAnalyzer(
+        get_predictor(),
+        diff_threshold=_float_param(
+            params, 'diff_threshold', getattr(settings, 'VIDEO_DIFF_THRESHOLD', DEFAULT_DIFF_THRESHOLD)
+        ),
+        detect_faces=_wants_faces(params),
+        max_frames=getattr(settings, 'VIDEO_MAX_FRAMES', None),
+        run=_run_in_executor,
+    )
+    sample_fps = _float_param(params, 'sample_fps', getattr(settings, 'VIDEO_SAMPLE_FPS', DEFAULT_SAMPLE_FPS))
+    with_frames = params.get('frames', '1').lower() in ('1', 'true', 'yes')
+
+    try:
+        for event in analyzer.process(_iter_request_frames(request, sample_fps)):
+            if with_frames:
+                yield json.dumps(event) + '\n'
+    except ExecutorFull:
+        yield json.dumps({
+            'success': False,
+            'error': 'Servidor ocupado, intenta de nuevo'
+        }) + '\n'
+        return
+    except Exception as e:
+        print("VIDEO ERROR:")
+        print(traceback.format_exc())
+        yield json.dumps({
+            'success': False,
+            'error': str(e)
+        }) + '\n'
+        return
+
+    yield json.dumps({
+        'done': True,
+        'success': True,
+        **analyzer.summary()
+    }) + '\n'
+
+
+@csrf_exempt
+def api_predict_video(request):
+    """Endpoint para analizar un video (o secuencia de frames) con resultados en NDJSON"""
+    if request.method == 'POST' and (
+        _uploaded_file(request, 'video') or request.FILES.getlist('images') or request.FILES.get('archive')
+    ):
+        response = StreamingHttpResponse(
+            _stream_video_predictions(request),
+            content_type='application/x-ndjson'
+        )
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    return JsonResponse({
+        'success': False,
+        'error': 'No video provided'
+    }, status=400)
+
+
+def model_status(request):
+    """Versiones registradas, la activa de este proceso y la comparacion de la sombra"""
+    if request.method == 'GET':
+        manager = get_model_manager()
+        return JsonResponse({
+            'success': True,
+            'data': {
+                'process': manager.stats(),
+                'registry': manager.registry.state(),
+                'versions': manager.registry.versions(),
+            }
+        })
+    
+    return JsonResponse({
+        'success': False,
+        'error': 'Método no permitido'
+    }, status=405)
+
+
+def health_check(request):
+    """Endpoint de salud: 200 si el modelo esta listo, 503 si no"""
+    ready, detail = health()
+    return JsonResponse({
+        'success': ready,
+        'data': detail
+    }, status=200 if ready else 503)
+
+
+def metrics(request):
+    """Metricas en formato de texto de Prometheus (de todos los workers con METRICS_MULTIPROC_DIR)"""
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def batcher_stats(request):
+    """Estadisticas del micro-batcher (profundidad de cola, tamaños de batch)"""
+    if request.method == 'GET':
+        return JsonResponse({
+            'success': True,
+            'data': get_batcher().stats()
+        })
+    
+    return JsonResponse({
+        'success': False,
+        'error': 'Método no permitido'
+    }, status=405)
+
+
+def cache_stats(request):
+    """Estadisticas del cache de predicciones (hits/misses)"""
+    if request.method == 'GET':
+        return JsonResponse({
+            'success': True,
+            'data': get_prediction_cache().stats()
+        })
+    
+    return JsonResponse({
+        'success': False,
+        'error': 'Método no permitido'
+    }, status=405)
+
+
+def _predict_upload(image_file, predict, detect_faces=False):
+    """decodifica el upload y predice (con cache, o por cara con detect_faces)"""
+    image = Image.open(image_file)
+    if detect_faces:
+        return _detect_faces(image)
+    results = cached_predict(image, predict)
+    get_model_manager().submit_shadow(image, results)
+    return results
+
+
+def _parse_manual_values(post):
+    """valores manuales del formulario, {} si no vienen o no son JSON valido"""
+    manual_values = {}
+    if 'manual_values' in post:
+        try:
+            manual_values = json.loads(post['manual_values'])
+        except json.JSONDecodeError:
+            pass
+    return manual_values
+
+
+def _apply_manual_values(results, manual_values):
+    """resultado final plano: el valor manual gana, la certeza es la del modelo"""
+    final_results = {}
+    for key in ['sex', 'eyes', 'race', 'hair']:
+        if key in manual_values and manual_values[key].strip():
+            # Usar el valor manual
+            final_results[key] = manual_values[key].strip()
+            final_results[f'{key}_confidence'] = results[key]['confidence']
+        else:
+            # Usar el valor de la predicción
+            final_results[key] = results[key]['prediction']
+            final_results[f'{key}_confidence'] = results[key]['confidence']
+    return final_results
+
+
+def _add_embedding(analysis_id, embedding, model_version):
+    try:
+        # al indice de la version que lo calculo, no al de la que este activa ahora
+        get_embedding_store(model_version).add([analysis_id], [embedding])
+    except Exception:
+        # el analisis ya quedo guardado; se puede recuperar con backfill_embeddings
+        print("ERROR al guardar el embedding:")
+        print(traceback.format_exc())
+
+
+def _new_analysis(final_results, results, image_name):
+    """FaceAnalysis sin guardar; results es la salida del modelo, de donde sale el top-k"""
+    top_k = stored_top_k(
+        results,
+        get_predictor().class_names,
+        getattr(settings, 'PREDICTION_STORED_TOP_K', DEFAULT_STORED_TOP_K)
+    )
+    return FaceAnalysis(
+        image_name=image_name,
+        top_k=top_k,
+        model_version=results.get(MODEL_VERSION_KEY, ''),
+        **final_results
+    )
+
+
+def _store_upload(analysis, image_file):
+    image_file.seek(0)
+    with timed('image_save'):
+        # lo mismo que haria FileField.pre_save, pero medido aparte del INSERT
+        analysis.image.save(image_file.name, image_file, save=False)
+
+
+def _detected_faces(analysis, faces):
+    """filas hijas por cara; index 0 es la principal"""
+    class_names = get_predictor().class_names
+    k = getattr(settings, 'PREDICTION_STORED_TOP_K', DEFAULT_STORED_TOP_K)
+    rows = []
+    for index, face in enumerate(faces):
+        x, y, width, height = face['box']
+        rows.append(DetectedFace(
+            analysis=analysis,
+            index=index,
+            box_x=x,
+            box_y=y,
+            box_width=width,
+            box_height=height,
+            detection_score=face['score'],
+            landmarks=face['landmarks'],
+            top_k=stored_top_k(face['results'], class_names, k),
+            **_flatten_predictions(face['results'])
+        ))
+    return rows
+
+
+def _insert_analysis(analysis, results):
+    """INSERT (y caras detectadas), derivados en segundo plano y el embedding cuando se haga commit"""
+    with timed('db_write'), transaction.atomic():
+        analysis.save()
+        if results.get('faces'):
+            DetectedFace.objects.bulk_create(_detected_faces(analysis, results['faces']))
+        enqueue('make_derivatives', analysis_id=analysis.id)
+    
+    if results.get(EMBEDDING_KEY) is not None:
+        embedding = results[EMBEDDING_KEY]
+        model_version = analysis.model_version or None
+        transaction.on_commit(lambda: _add_embedding(analysis.id, embedding, model_version))
+    return analysis
+
+
+def _save_upload(image_file, final_results, results):
+    """
+    crea el registro: la imagen se copia al storage en chunks justo antes del
+    INSERT y los derivados se encolan para segundo plano
+    """
+    analysis = _new_analysis(final_results, results, image_file.name)
+    _store_upload(analysis, image_file)
+    return _insert_analysis(analysis, results)
+
+
+def _save_staged(token, manual_values, image_file=None):
+    """
+    confirma una prediccion de /api/predict/ por su token sin correr el modelo otra
+    vez; la imagen es la que quedo en el storage con el token o, si no se guardo,
+    la del upload. regresa (analysis, final_results, results)
+    """
+    with transaction.atomic():
+        results, stored_name, original_name = claim(token)
+        final_results = _apply_manual_values(results, manual_values)
+        
+        if stored_name:
+            analysis = _new_analysis(final_results, results, original_name)
+            analysis.image.name = stored_name
+        elif image_file:
+            analysis = _new_analysis(final_results, results, image_file.name)
+            _store_upload(analysis, image_file)
+        else:
+            raise ValueError('La predicción no guardó la imagen, hay que enviarla')
+        
+        _insert_analysis(analysis, results)
+    return analysis, final_results, results
+
+
+def _token_expired():
+    """410 cuando el token ya vencio o ya se uso; el cliente debe mandar la imagen"""
+    return JsonResponse({
+        'success': False,
+        'error': 'La predicción expiró, vuelve a enviar la imagen',
+        'token_expired': True
+    }, status=410)
+
+
 @csrf_exempt
 def save_analysis(request):
     """Endpoint para guardar los resultados del análisis en la BD"""
     if request.method == 'POST':
         try:
             # Obtener la imagen
-            image_file = request.FILES.get('image')
-            if not image_file:
-                return JsonResponse({
-                    'success': False,
-                    'error': 'No se proporcionó imagen'
-                }, status=400)
-            
-            # procesar imagen
-            image_data = image_file.read()
-            image = Image.open(io.BytesIO(image_data))
+            image_file = _uploaded_file(request)
+            token = request.POST.get('prediction_token')
+            manual_values = _parse_manual_values(request.POST)
             
-            # prediccion
-            predictor = get_predictor()
-            results = predictor.predict(image)
-            
-            # verifica si hay valores manuales (para campos con baja confianza)
-            manual_values = {}
-            if 'manual_values' in request.POST:
+            if token:
+                # confirma la prediccion de /api/predict/ sin subir ni predecir otra vez
                 try:
-                    manual_values = json.loads(request.POST['manual_values'])
-                except json.JSONDecodeError:
-                    pass
-            
-            # aplicar valores manuales si existen
-            final_results = {}
-            for key in ['sex', 'eyes', 'race', 'hair']:
-                if key in manual_values and manual_values[key].strip():
-                    # Usar el valor manual
-                    final_results[key] = manual_values[key].strip()
-                    final_results[f'{key}_confidence'] = results[key]['confidence']
-                else:
-                    # Usar el valor de la predicción
-                    final_results[key] = results[key]['prediction']
-                    final_results[f'{key}_confidence'] = results[key]['confidence']
-            
-            # Crear el registro en la base de datos
-            analysis = FaceAnalysis.objects.create(
-                sex=final_results['sex'],
-                sex_confidence=final_results['sex_confidence'],
-                eyes=final_results['eyes'],
-                eyes_confidence=final_results['eyes_confidence'],
-                race=final_results['race'],
-                race_confidence=final_results['race_confidence'],
-                hair=final_results['hair'],
-                hair_confidence=final_results['hair_confidence'],
-                image_name=image_file.name
-            )
-            
-            # Guardar la imagen
-            analysis.image.save(
-                image_file.name,
-                ContentFile(image_data),
-                save=True
-            )
+                    analysis, final_results, results = _save_staged(token, manual_values, image_file)
+                except TokenExpired:
+                    return _token_expired()
+            else:
+                if not image_file:
+                    return JsonResponse({
+                        'success': False,
+                        'error': 'No se proporcionó imagen'
+                    }, status=400)
+                
+                # prediccion directo del upload (sin copiarlo a memoria)
+                results = _predict_upload(image_file, get_predictor().predict, _wants_faces(request.GET))
+                
+                # aplicar valores manuales si existen (para campos con baja confianza)
+                final_results = _apply_manual_values(results, manual_values)
+                
+                analysis = _save_upload(image_file, final_results, results)
             
             return JsonResponse({
                 'success': True,
@@ -152,9 +658,120 @@ def save_analysis(request):
                     'race_confidence': final_results['race_confidence'],
                     'hair': final_results['hair'],
                     'hair_confidence': final_results['hair_confidence']
-                }
+                },
+                **_face_extras(results),
+                **_prediction_extras(results, parse_options(request.GET), get_predictor().class_names)
+            })
+        
+        except Exception as e:
+            print("ERROR al guardar análisis:")
+            print(traceback.format_exc())
+            
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            }, status=400)
+    
+    return JsonResponse({
+        'success': False,
+        'error': 'Método no permitido'
+    }, status=405)
+
+
+def _service_unavailable():
+    """503 con Retry-After cuando el pool de inferencia esta lleno"""
+    response = JsonResponse({
+        'success': False,
+        'error': 'Servidor ocupado, intenta de nuevo'
+    }, status=503)
+    response['Retry-After'] = str(getattr(settings, 'ASYNC_RETRY_AFTER', 2))
+    return response
+
+
+@csrf_exempt
+async def api_predict_async(request):
+    """Version async de api_predict: decode e inferencia en el pool acotado"""
+    if request.method == 'POST':
+        # el parseo del multipart tambien es trabajo sincrono
+        image_file = await sync_to_async(_uploaded_file)(request)
+        if image_file:
+            try:
+                results = await get_executor().run(
+                    _predict_upload, image_file, predict_image, _wants_faces(request.GET)
+                )
+                staged = await sync_to_async(_stage_prediction)(results, image_file, request.GET)
+                
+                return JsonResponse({
+                    'success': True,
+                    'data': _flatten_predictions(results),
+                    **_face_extras(results),
+                    **staged,
+                    **_prediction_extras(results, parse_options(request.GET), get_predictor().class_names)
+                })
+            
+            except ExecutorFull:
+                return _service_unavailable()
+            
+            except Exception as e:
+                print("API ERROR:")
+                print(traceback.format_exc())
+                
+                return JsonResponse({
+                    'success': False,
+                    'error': str(e)
+                }, status=400)
+    
+    return JsonResponse({
+        'success': False,
+        'error': 'No image provided'
+    }, status=400)
+
+
+@csrf_exempt
+async def save_analysis_async(request):
+    """Version async de save_analysis: decode e inferencia en el pool acotado"""
+    if request.method == 'POST':
+        try:
+            image_file = await sync_to_async(_uploaded_file)(request)
+            post = await sync_to_async(lambda: request.POST)()
+            token = post.get('prediction_token')
+            manual_values = _parse_manual_values(post)
+            
+            if token:
+                # sin inferencia: solo el INSERT, en un hilo (ORM sincrono)
+                try:
+                    analysis, final_results, results = await sync_to_async(_save_staged)(
+                        token, manual_values, image_file
+                    )
+                except TokenExpired:
+                    return _token_expired()
+            else:
+                if not image_file:
+                    return JsonResponse({
+                        'success': False,
+                        'error': 'No se proporcionó imagen'
+                    }, status=400)
+                
+                results = await get_executor().run(
+                    _predict_upload, image_file, predict_image, _wants_faces(request.GET)
+                )
+                final_results = _apply_manual_values(results, manual_values)
+                
+                # INSERT + escritura del archivo en un hilo (ORM sincrono)
+                analysis = await sync_to_async(_save_upload)(image_file, final_results, results)
+            
+            return JsonResponse({
+                'success': True,
+                'message': 'Análisis guardado exitosamente',
+                'analysis_id': analysis.id,
+                'data': final_results,
+                **_face_extras(results),
+                **_prediction_extras(results, parse_options(request.GET), get_predictor().class_names)
             })
         
+        except ExecutorFull:
+            return _service_unavailable()
+        
         except Exception as e:
             print("ERROR al guardar análisis:")
             print(traceback.format_exc())
@@ -170,33 +787,160 @@ def save_analysis(request):
     }, status=405)
 
 
+def _similar_response(request, matches, k):
+    """filas de los analisis parecidos en orden de similitud (se saltan los ya borrados)"""
+    threshold = getattr(settings, 'EMBEDDING_DUPLICATE_THRESHOLD', DEFAULT_DUPLICATE_THRESHOLD)
+    media_base = request.build_absolute_uri('/').rstrip('/')
+    
+    scores = {}
+    for analysis_id, score in matches:
+        scores.setdefault(analysis_id, score)
+    rows = FaceAnalysis.objects.filter(id__in=scores).values(*LIST_FIELDS)
+    rows = sorted(rows, key=lambda row: -scores[row['id']])[:k]
+    
+    data = []
+    for row in rows:
+        item = serialize_row(row, media_base)
+        item['similarity'] = round(scores[row['id']], 4)
+        item['duplicate'] = scores[row['id']] >= threshold
+        data.append(item)
+    return data
+
+
+def _similar_limit(request):
+    try:
+        k = int(request.GET.get('k', 10))
+    except ValueError:
+        k = 10
+    return max(1, min(k, 100))
+
+
+def similar_analyses(request, analysis_id):
+    """
+    Analisis parecidos a uno ya guardado, con su embedding guardado (sin inferencia).
+    query params: k
+    """
+    if request.method != 'GET':
+        return JsonResponse({
+            'success': False,
+            'error': 'Método no permitido'
+        }, status=405)
+    
+    # el indice de la version activa; si aun no tiene este analisis (backfill pendiente),
+    # el de la version que lo guardo
+    store = get_embedding_store()
+    vector = store.vector(analysis_id)
+    if vector is None:
+        saved_with = FaceAnalysis.objects.filter(pk=analysis_id).values_list('model_version', flat=True).first()
+        if saved_with:
+            store = get_embedding_store(saved_with)
+            vector = store.vector(analysis_id)
+    if vector is None:
+        return JsonResponse({
+            'success': False,
+            'error': 'Análisis sin embedding (correr manage.py backfill_embeddings)'
+        }, status=404)
+    
+    k = _similar_limit(request)
+    # unas filas de mas por si alguna ya se borro de la tabla
+    matches = store.search(vector, k + 5, exclude=[analysis_id])
+    return JsonResponse({
+        'success': True,
+        'data': _similar_response(request, matches, k)
+    })
+
+
+@csrf_exempt
+def find_similar(request):
+    """
+    Busca analisis parecidos a una imagen nueva. si hay un duplicado (similitud >=
+    EMBEDDING_DUPLICATE_THRESHOLD) el cliente puede reusar su resultado en vez de guardar otro.
+    query params: k
+    """
+    if request.method == 'POST' and _uploaded_file(request):
+        try:
+            results = _predict_upload(request.FILES['image'], predict_image)
+            if results.get(EMBEDDING_KEY) is None:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'El modelo cargado no da embeddings (re-exportar con manage.py export_model)'
+                }, status=400)
+            
+            k = _similar_limit(request)
+            matches = get_embedding_store(results.get(MODEL_VERSION_KEY)).search(results[EMBEDDING_KEY], k + 5)
+            similar = _similar_response(request, matches, k)
+            
+            return JsonResponse({
+                'success': True,
+                'data': _flatten_predictions(results),
+                'duplicate_of': similar[0] if similar and similar[0]['duplicate'] else None,
+                'similar': similar
+            })
+        
+        except Exception as e:
+            print("API ERROR:")
+            print(traceback.format_exc())
+            
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            }, status=400)
+    
+    return JsonResponse({
+        'success': False,
+        'error': 'No image provided'
+    }, status=400)
+
+
+def _stream_analyses_export(queryset, media_base):
+    """exporta todas las filas como NDJSON sin materializar la tabla"""
+    for row in iter_all_rows(queryset):
+        yield json.dumps(serialize_row(row, media_base)) + '\n'
+
+
 @csrf_exempt
 def get_all_analyses(request):
-    """Endpoint para obtener todos los análisis guardados"""
+    """
+    Endpoint para obtener los análisis guardados, paginado por cursor.
+    query params: limit, cursor, sex, eyes, race, hair, low_confidence, export=ndjson
+    """
     if request.method == 'GET':
         try:
-            analyses = FaceAnalysis.objects.all()
-            
-            data = [{
-                'id': analysis.id,
-                'image_url': request.build_absolute_uri(analysis.image.url) if analysis.image else None,
-                'image_name': analysis.image_name,
-                'sex': analysis.sex,
-                'sex_confidence': analysis.sex_confidence,
-                'eyes': analysis.eyes,
-                'eyes_confidence': analysis.eyes_confidence,
-                'race': analysis.race,
-                'race_confidence': analysis.race_confidence,
-                'hair': analysis.hair,
-                'hair_confidence': analysis.hair_confidence,
-                'created_at': analysis.created_at.isoformat(),
-                'average_confidence': round(analysis.average_confidence, 2),
-                'has_low_confidence': analysis.has_low_confidence
-            } for analysis in analyses]
+            queryset = filter_analyses(FaceAnalysis.objects.all(), request.GET)
+            media_base = request.build_absolute_uri('/').rstrip('/')
+            
+            # export completo en streaming
+            if request.GET.get('export') == 'ndjson':
+                return StreamingHttpResponse(
+                    _stream_analyses_export(queryset, media_base),
+                    content_type='application/x-ndjson'
+                )
+            
+            try:
+                limit = int(request.GET.get('limit', DEFAULT_PAGE_SIZE))
+            except ValueError:
+                limit = DEFAULT_PAGE_SIZE
+            limit = max(1, min(limit, MAX_PAGE_SIZE))
+            
+            try:
+                rows, next_cursor = paginate(queryset, request.GET.get('cursor'), limit)
+            except ValueError as e:
+                return JsonResponse({
+                    'success': False,
+                    'error': str(e)
+                }, status=400)
+            
+            try:
+                thumb_size = int(request.GET.get('thumb_size', DEFAULT_THUMBNAIL_SIZE))
+            except ValueError:
+                thumb_size = DEFAULT_THUMBNAIL_SIZE
+            thumb_ext = 'jpg' if request.GET.get('thumb_format') in ('jpg', 'jpeg') else 'webp'
+            data = [serialize_row(row, media_base, thumb_size, thumb_ext) for row in rows]
             
             return JsonResponse({
                 'success': True,
                 'count': len(data),
+                'next_cursor': next_cursor,
                 'data': data
             })
         
@@ -215,30 +959,152 @@ def get_all_analyses(request):
     }, status=405)
 
 
+def analyses_stats(request):
+    """
+    Endpoint de estadisticas (histogramas por clase, percentiles de certeza,
+    tasa de baja confianza) sobre el resumen diario. query params: from, to (YYYY-MM-DD)
+    """
+    if request.method == 'GET':
+        try:
+            start = parse_date(request.GET['from']) if request.GET.get('from') else None
+            end = parse_date(request.GET['to']) if request.GET.get('to') else None
+        except ValueError:
+            start = end = None
+        
+        if (request.GET.get('from') and start is None) or (request.GET.get('to') and end is None):
+            return JsonResponse({
+                'success': False,
+                'error': 'Fecha invalida, usar YYYY-MM-DD'
+            }, status=400)
+        
+        return JsonResponse({
+            'success': True,
+            'data': aggregate(start, end)
+        })
+    
+    return JsonResponse({
+        'success': False,
+        'error': 'Método no permitido'
+    }, status=405)
+
+
+def thumbnail(request, analysis_id, size, ext):
+    """
+    Sirve una miniatura con cache larga (la url lleva ?v=version) y ETag,
+    contesta 304 si el navegador ya la tiene
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return JsonResponse({
+            'success': False,
+            'error': 'Método no permitido'
+        }, status=405)
+    
+    derivatives = FaceAnalysis.objects.filter(pk=analysis_id).values_list('derivatives', flat=True).first()
+    name = thumbnail_name(derivatives, size, ext)
+    if not name or ext not in CONTENT_TYPES:
+        return HttpResponse(status=404)
+    
+    etag = f'"{analysis_id}-{size}-{ext}-{derivatives.get("version", 0)}"'
+    cache_control = 'public, max-age=31536000, immutable'
+    
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+    else:
+        try:
+            response = FileResponse(default_storage.open(name, 'rb'), content_type=CONTENT_TYPES[ext])
+        except FileNotFoundError:
+            return HttpResponse(status=404)
+    
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
+
+
 @csrf_exempt
 def delete_analysis(request, analysis_id):
-    """Endpoint para eliminar un análisis"""
+    """Endpoint para eliminar un análisis (los archivos se borran en segundo plano)"""
     if request.method == 'DELETE':
         try:
-            analysis = FaceAnalysis.objects.get(id=analysis_id)
-            
-            # eliminar imagen del sistema de archivos
-            if analysis.image:
-                analysis.image.delete(save=False)
-            
-            # eliminar el registro
-            analysis.delete()
+            ids, _ = delete_analyses(FaceAnalysis.objects.filter(id=analysis_id))
+            if not ids:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Análisis no encontrado'
+                }, status=404)
             
             return JsonResponse({
                 'success': True,
                 'message': 'Análisis eliminado exitosamente'
             })
         
-        except FaceAnalysis.DoesNotExist:
+        except Exception as e:
+            print("ERROR al eliminar análisis:")
+            print(traceback.format_exc())
+            
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            }, status=400)
+    
+    return JsonResponse({
+        'success': False,
+        'error': 'Método no permitido'
+    }, status=405)
+
+
+@csrf_exempt
+def bulk_delete_analyses(request):
+    """
+    Endpoint para eliminar muchos análisis en una transacción.
+    body JSON: {"ids": [1, 2, ...]} o {"filter": {"sex": ..., "low_confidence": "1", ...}}
+    (mismos filtros que el listado). Borra hasta BULK_DELETE_MAX por llamada; con
+    "more": true quedan filas que coinciden y se puede repetir
+    """
+    if request.method in ('POST', 'DELETE'):
+        try:
+            body = json.loads(request.body or b'{}')
+        except (json.JSONDecodeError, UnicodeDecodeError):
             return JsonResponse({
                 'success': False,
-                'error': 'Análisis no encontrado'
-            }, status=404)
+                'error': 'El body debe ser JSON'
+            }, status=400)
+        
+        ids = body.get('ids')
+        filters = body.get('filter')
+        if ids is not None:
+            if not isinstance(ids, list) or not all(isinstance(pk, int) for pk in ids):
+                return JsonResponse({
+                    'success': False,
+                    'error': '"ids" debe ser una lista de enteros'
+                }, status=400)
+            queryset = FaceAnalysis.objects.filter(id__in=ids)
+        elif isinstance(filters, dict) and filters:
+            # sin filtro (o con uno que no existe) no se borra la tabla completa por accidente
+            filters = {key: str(value).strip() for key, value in filters.items()}
+            unknown = set(filters) - set(BULK_DELETE_FILTERS)
+            unknown.update(key for key, value in filters.items() if not value)
+            if filters.get('low_confidence', 'true').lower() not in ('1', 'true', 'yes', '0', 'false', 'no'):
+                unknown.add('low_confidence')
+            if unknown:
+                return JsonResponse({
+                    'success': False,
+                    'error': f"Filtros invalidos: {', '.join(sorted(unknown))}"
+                }, status=400)
+            queryset = filter_analyses(FaceAnalysis.objects.all(), filters)
+        else:
+            return JsonResponse({
+                'success': False,
+                'error': 'Indica "ids" o un "filter" no vacío'
+            }, status=400)
+        
+        try:
+            deleted, more = delete_analyses(queryset)
+            return JsonResponse({
+                'success': True,
+                'deleted': len(deleted),
+                'ids': deleted,
+                'more': more
+            })
         
         except Exception as e:
             print("ERROR al eliminar análisis:")
@@ -252,4 +1118,4 @@ def delete_analysis(request, analysis_id):
     return JsonResponse({
         'success': False,
         'error': 'Método no permitido'
-    }, status=405)
\ No newline at end of file
+    }, status=405)
@@ -0,0 +1,85 @@
+# predictorThing/warmup.py
+import os
+import time
+import traceback
+
+import torch
+
+from . import predictor as predictor_module
+from .predictor import get_predictor
+
+DEFAULT_WARMUP_BATCH_SIZES = (1, 8)
+DEFAULT_WARMUP_ITERATIONS = 2
+
+# estado de carga del proceso, lo reporta /api/health/
+_state = {
+    'loaded': False,
+    'warmed_up': False,
+    'load_seconds': None,
+    'warmup_seconds': None,
+    'error': None,
+    'pid': None,
+}
+
+
+def warm_up(predictor, batch_sizes=DEFAULT_WARMUP_BATCH_SIZES, iterations=DEFAULT_WARMUP_ITERATIONS):
+    """forward passes con tensores dummy para que el allocator y los kernels ya esten listos"""
+    for batch_size in batch_sizes:
+        batch_size = min(int(batch_size), predictor.max_batch_size)
+        tensors = [torch.zeros(3, 224, 224)] * batch_size
+        for _ in range(iterations):
+            predictor.predict_tensors(tensors, max_batch_size=batch_size)
+
+
+def load_and_warm_up():
+    """carga el modelo y lo calienta; pensado para AppConfig.ready (antes del fork de gunicorn)"""
+    from django.conf import settings
+
+    _state['pid'] = os.getpid()
+    try:
+        started = time.monotonic()
+        predictor = get_predictor()
+        _state['load_seconds'] = round(time.monotonic() - started, 3)
+        _state['loaded'] = True
+
+        started = time.monotonic()
+        warm_up(
+            predictor,
+            batch_sizes=getattr(settings, 'PREDICTOR_WARMUP_BATCH_SIZES', DEFAULT_WARMUP_BATCH_SIZES),
+            iterations=getattr(settings, 'PREDICTOR_WARMUP_ITERATIONS', DEFAULT_WARMUP_ITERATIONS),
+        )
+        _state['warmup_seconds'] = round(time.monotonic() - started, 3)
+        _state['warmed_up'] = True
+
+        print(f"modelo listo en {_state['load_seconds']}s (warm-up {_state['warmup_seconds']}s)")
+    except Exception as e:
+        _state['error'] = str(e)
+        print("ERROR al precargar el modelo:")
+        print(traceback.format_exc())
+
+
+def health():
+    """regresa (listo, detalle) del modelo en este proceso"""
+    from django.conf import settings
+
+    eager = getattr(settings, 'PREDICTOR_EAGER_LOAD', False)
+    loaded = predictor_module.predictor is not None
+
+    # con precarga el worker no esta listo hasta terminar el warm-up sin error;
+    # en modo lazy el modelo se carga con el primer request, asi que no bloquea
+    if eager:
+        ready = loaded and _state['warmed_up'] and _state['error'] is None
+    else:
+        ready = _state['error'] is None
+    return ready, {
+        'ready': ready,
+        'eager_load': eager,
+        'loaded': loaded,
+        'warmed_up': _state['warmed_up'],
+        'load_seconds': _state['load_seconds'],
+        'warmup_seconds': _state['warmup_seconds'],
+        'error': _state['error'],
+        # si el pid no coincide, el modelo se cargo antes del fork (copy-on-write)
+        'loaded_in_pid': _state['pid'],
+        'pid': os.getpid(),
+    }
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # primero para medir todo el request: conteos por endpoint, latencias y X-Timing
+    'predictorThing.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -57,6 +60,11 @@ CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:3000",
 ]
 
+# el frontend puede pedir y leer el desglose de tiempos
+from corsheaders.defaults import default_headers
+CORS_ALLOW_HEADERS = (*default_headers, 'x-timing')
+CORS_EXPOSE_HEADERS = ['X-Timing']
+
 ROOT_URLCONF = 'waterloo.urls'
 
 TEMPLATES = [
@@ -136,3 +144,119 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Predictor
+# maximo de imagenes por forward pass en FaceAttributePredictor.predict_batch
+
+PREDICTOR_MAX_BATCH_SIZE = 32
+
+# junta requests concurrentes de /api/predict/ en un solo forward pass
+PREDICTOR_MICROBATCHING = True
+
+# ventana (ms) que espera el micro-batcher por mas imagenes
+PREDICTOR_BATCH_WINDOW_MS = 5
+
+# maximo de imagenes por request en /api/predict/batch/
+PREDICTOR_BATCH_MAX_FILES = 1000
+
+# cache de predicciones por hash de imagen + version del modelo
+PREDICTION_CACHE_ENABLED = True
+PREDICTION_CACHE_SIZE = 1024
+
+# alias de CACHES para un segundo nivel compartido entre procesos (None = solo LRU)
+PREDICTION_CACHE_BACKEND = None
+PREDICTION_CACHE_TIMEOUT = 60 * 60 * 24
+
+# clases mas probables por cabeza que se guardan en cada analisis (FaceAnalysis.top_k)
+PREDICTION_STORED_TOP_K = 3
+
+# deteccion de caras antes del modelo (ver detection.py); ?faces=1 la activa por request.
+# FACE_DETECTOR_MODEL: ruta al onnx de YuNet (alinea con landmarks), None = Haar cascade de opencv
+FACE_DETECTION_ENABLED = False
+FACE_DETECTOR_MODEL = None
+FACE_DETECTION_SCORE_THRESHOLD = 0.8
+FACE_DETECTION_MIN_SIZE = 32
+FACE_DETECTION_MAX_FACES = 16
+
+# cuanto dura el token de /api/predict/?stage=1 para confirmar con /api/save/ sin re-subir la imagen
+PREDICTION_TOKEN_TTL = 15 * 60
+# cada cuantos segundos la cola de trabajos borra los tokens vencidos (None = nunca)
+PREDICTION_TOKEN_PURGE_INTERVAL = 60
+
+# indice de embeddings para buscar analisis parecidos / duplicados (ver embeddings.py), uno por
+# version del modelo en EMBEDDINGS_DIR/<version>; activar una version encola su backfill
+EMBEDDINGS_DIR = BASE_DIR / 'embeddings'
+EMBEDDING_DUPLICATE_THRESHOLD = 0.97
+
+# analisis de video (ver video.py): frames por segundo que se muestrean, diferencia minima
+# (0-1) contra el ultimo frame clasificado para no descartarlo, y tope de frames muestreados
+VIDEO_SAMPLE_FPS = 2.0
+VIDEO_DIFF_THRESHOLD = 0.02
+VIDEO_MAX_FRAMES = 3600
+# segundos que un video en curso espera lugar en el pool de inferencia (ASYNC_INFERENCE_*)
+VIDEO_EXECUTOR_TIMEOUT = 30
+
+# registro de versiones del modelo (ver registry.py y manage.py model_registry): cada proceso
+# revisa registry.json cada MODEL_RELOAD_INTERVAL segundos y cambia de version sin reiniciar
+MODEL_REGISTRY_DIR = BASE_DIR / 'predictorThing' / 'ml_models' / 'versions'
+MODEL_RELOAD_INTERVAL = 5
+MODEL_SHADOW_QUEUE = 32
+
+# motor de inferencia: 'torch' (eager), 'torchscript' u 'onnx' (ver manage.py export_model)
+PREDICTOR_BACKEND = 'torch'
+
+# optimizacion para cpu del modelo eager (ver manage.py quantization_report)
+# PREDICTOR_QUANTIZATION: None, 'dynamic' (cabezas INT8) o 'static' (todo el modelo, necesita calibracion)
+PREDICTOR_QUANTIZATION = None
+PREDICTOR_CALIBRATION_DIR = None
+PREDICTOR_CHANNELS_LAST = False
+
+# hilos intra-op de torch (None = default de torch)
+PREDICTOR_NUM_THREADS = None
+
+# carga y calienta el modelo en AppConfig.ready en vez de en el primer request
+PREDICTOR_EAGER_LOAD = os.environ.get('PREDICTOR_EAGER_LOAD', '0') == '1'
+PREDICTOR_WARMUP_BATCH_SIZES = [1, 8, PREDICTOR_MAX_BATCH_SIZE]
+PREDICTOR_WARMUP_ITERATIONS = 2
+
+# cola de trabajos en segundo plano (miniaturas, derivados); el worker es manage.py run_jobs.
+# con JOBS_LOCAL_WORKER un hilo del propio proceso procesa la cola (util con runserver)
+JOBS_LOCAL_WORKER = DEBUG
+JOBS_POLL_INTERVAL = 2.0
+# cada cuantos segundos se marca como vivo un trabajo en curso (ver jobs.STALE_AFTER)
+JOBS_HEARTBEAT_INTERVAL = 60.0
+
+# borrado en bulk (api/analyses/delete/): filas por llamada; los archivos se borran en un trabajo
+BULK_DELETE_MAX = 5000
+
+# barrido de media/face_images contra la tabla (ver cleanup.py y manage.py sweep_media).
+# con MEDIA_SWEEP_INTERVAL (segundos) el barrido se vuelve a encolar solo en la cola de trabajos
+MEDIA_SWEEP_INTERVAL = None
+MEDIA_SWEEP_GRACE = 60 * 60
+MEDIA_SWEEP_BATCH_SIZE = 1000
+
+# cada cuantos segundos se pliegan los deltas en el resumen diario (None = solo con rebuild_stats --fold);
+# manage.py run_jobs (o el worker local) encola el primero al arrancar
+DAILY_SUMMARY_FOLD_INTERVAL = 60
+
+# vistas async (ASGI): hilos para decode + inferencia y cuantos requests pueden esperar en cola;
+# si se llena se contesta 503 con Retry-After (segundos)
+ASYNC_INFERENCE_WORKERS = 4
+ASYNC_INFERENCE_QUEUE = 16
+ASYNC_RETRY_AFTER = 2
+
+# /metrics: cada proceso cuenta lo suyo. con varios workers (gunicorn) hay que definir un
+# directorio compartido; cada worker escribe ahi sus metricas cada METRICS_FLUSH_INTERVAL
+# segundos y /metrics las suma. gunicorn.conf.py lo vacia al arrancar
+METRICS_MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR') or None
+METRICS_FLUSH_INTERVAL = 5.0
+
+# pool de inferencia multiproceso (manage.py serve_inference). si INFERENCE_POOL_SOCKET
+# esta definido, las vistas no cargan el modelo y le mandan los tensores al pool
+INFERENCE_POOL_SOCKET = os.environ.get('INFERENCE_POOL_SOCKET') or None
+INFERENCE_POOL_WORKERS = int(os.environ.get('INFERENCE_POOL_WORKERS', '2'))
+# conexiones abiertas por proceso de Django (cada una con un segmento de PREDICTOR_MAX_BATCH_SIZE
+# imagenes); None = 4 por worker. la llave del socket sale de SECRET_KEY si no se define
+INFERENCE_POOL_CONNECTIONS = None
+INFERENCE_POOL_AUTHKEY = os.environ.get('INFERENCE_POOL_AUTHKEY') or None
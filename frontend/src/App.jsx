@@ -19,12 +19,15 @@ export default function FacePredictor() {
   const [dragActive, setDragActive] = useState(false);
   const [editingField, setEditingField] = useState(null);
   const [manualValues, setManualValues] = useState({});
+  // token de /api/predict/ para guardar sin volver a subir la imagen
+  const [predictionToken, setPredictionToken] = useState(null);
   const fileInputRef = useRef(null);
   
   // Estados del historial
   const [analyses, setAnalyses] = useState([]);
   const [loadingHistory, setLoadingHistory] = useState(false);
   const [historyError, setHistoryError] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
 
   // Configuración de atributos
   const attributeOptions = {
@@ -49,16 +52,23 @@ export default function FacePredictor() {
   }, [currentView]);
 
   // Funciones del historial
-  const loadAnalyses = async () => {
+  const loadAnalyses = async (loadMore = false) => {
     setLoadingHistory(true);
     setHistoryError(null);
     
     try {
-      const response = await fetch('http://localhost:8000/api/analyses/');
+      // el listado viene paginado por cursor
+      const params = new URLSearchParams({ limit: '50' });
+      if (loadMore === true && nextCursor) {
+        params.set('cursor', nextCursor);
+      }
+      
+      const response = await fetch(`http://localhost:8000/api/analyses/?${params}`);
       const data = await response.json();
       
       if (data.success) {
-        setAnalyses(data.data);
+        setAnalyses(loadMore === true ? [...analyses, ...data.data] : data.data);
+        setNextCursor(data.next_cursor);
       } else {
         setHistoryError(data.error || 'Error al cargar el historial');
       }
@@ -99,6 +109,7 @@ export default function FacePredictor() {
       setError(null);
       setResults(null);
       setSaved(false);
+      setPredictionToken(null);
       
       const reader = new FileReader();
       reader.onload = (e) => setPreview(e.target.result);
@@ -138,12 +149,14 @@ export default function FacePredictor() {
     setError(null);
     setResults(null);
     setSaved(false);
+    setPredictionToken(null);
 
     const formData = new FormData();
     formData.append('image', selectedFile);
 
     try {
-      const response = await fetch('http://localhost:8000/api/predict/', {
+      // stage + stage_image: el servidor se queda con la imagen y el resultado hasta que se guarde
+      const response = await fetch('http://localhost:8000/api/predict/?stage=1&stage_image=1', {
         method: 'POST',
         body: formData,
       });
@@ -152,6 +165,7 @@ export default function FacePredictor() {
 
       if (data.success) {
         setResults(data.data);
+        setPredictionToken(data.prediction_token || null);
       } else {
         setError(data.error || 'Error al procesar la imagen');
       }
@@ -177,18 +191,31 @@ export default function FacePredictor() {
     setSaving(true);
     setError(null);
 
-    const formData = new FormData();
-    formData.append('image', selectedFile);
-    
-    if (Object.keys(manualValues).length > 0) {
-      formData.append('manual_values', JSON.stringify(manualValues));
-    }
+    const buildFormData = (useToken) => {
+      const formData = new FormData();
+      if (useToken) {
+        formData.append('prediction_token', predictionToken);
+      } else {
+        formData.append('image', selectedFile);
+      }
+      if (Object.keys(manualValues).length > 0) {
+        formData.append('manual_values', JSON.stringify(manualValues));
+      }
+      return formData;
+    };
+
+    const postSave = (useToken) => fetch('http://localhost:8000/api/save/', {
+      method: 'POST',
+      body: buildFormData(useToken),
+    });
 
     try {
-      const response = await fetch('http://localhost:8000/api/save/', {
-        method: 'POST',
-        body: formData,
-      });
+      let response = await postSave(Boolean(predictionToken));
+      if (response.status === 410) {
+        // el token expiro: se manda la imagen como antes
+        response = await postSave(false);
+      }
+      setPredictionToken(null);
 
       const data = await response.json();
 
@@ -214,6 +241,7 @@ export default function FacePredictor() {
     setSaved(false);
     setEditingField(null);
     setManualValues({});
+    setPredictionToken(null);
     if (fileInputRef.current) {
       fileInputRef.current.value = '';
     }
@@ -303,6 +331,7 @@ export default function FacePredictor() {
           loadingHistory={loadingHistory}
           historyError={historyError}
           loadAnalyses={loadAnalyses}
+          hasMore={Boolean(nextCursor)}
           deleteAnalysis={deleteAnalysis}
           setCurrentView={setCurrentView}
           formatDate={formatDate}
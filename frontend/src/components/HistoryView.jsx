@@ -5,6 +5,7 @@ export default function HistoryView({
   loadingHistory,
   historyError,
   loadAnalyses,
+  hasMore,
   deleteAnalysis,
   setCurrentView,
   formatDate,
@@ -26,12 +27,12 @@ export default function HistoryView({
             Historial de Análisis
           </h2>
           <p className="text-my-Lazul mt-2">
-            {analyses.length} análisis guardados
+            {analyses.length}{hasMore ? '+' : ''} análisis guardados
           </p>
         </div>
         
         <button
-          onClick={loadAnalyses}
+          onClick={() => loadAnalyses()}
           disabled={loadingHistory}
           className="bg-my-azul hover:bg-my-Dazul text-white font-semibold py-2 px-6 rounded-lg transition-all flex items-center gap-2"
         >
@@ -85,10 +86,11 @@ export default function HistoryView({
             >
               {/* Imagen */}
               <div className="relative h-48 bg-gray-200">
-                {analysis.image_url ? (
+                {analysis.thumbnail_url || analysis.image_url ? (
                   <img
-                    src={analysis.image_url}
+                    src={analysis.thumbnail_url || analysis.image_url}
                     alt={`Análisis ${analysis.id}`}
+                    loading="lazy"
                     className="w-full h-full object-cover"
                   />
                 ) : (
@@ -157,6 +159,18 @@ export default function HistoryView({
           ))}
         </div>
       )}
+
+      {/* load more */}
+      {!loadingHistory && hasMore && (
+        <div className="text-center mt-8">
+          <button
+            onClick={() => loadAnalyses(true)}
+            className="bg-my-azul hover:bg-my-Dazul text-white font-semibold py-2 px-6 rounded-lg transition-all"
+          >
+            Cargar más
+          </button>
+        </div>
+      )}
     </div>
   );
 }
\ No newline at end of file